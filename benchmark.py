@@ -0,0 +1,492 @@
+#!/usr/local/bin/python3.10
+
+import re
+import gc
+import json
+import random
+import platform
+import tracemalloc
+from typing import Tuple, List, Dict, Callable
+from os import path, makedirs
+from sys import stderr
+from time import perf_counter
+from tempfile import TemporaryDirectory
+from lexer import Lexer, SCANNERS
+from parser import Parser
+
+####################################################################################################
+
+# Benchmarks: time Lexer.__init__, Lexer.generate_tokens and Parser.parse separately
+# on synthetic A-Script programs of any size, see generate_corpus
+# Results are printed as a table, and optionally saved as JSON to compare later runs with (--save, --compare)
+
+
+# Everything generate_corpus can put in a program
+FEATURES = (
+    "imports", # import "file" and from "file" import {...} lists
+    "blocks", # functions with deeply nested if/while/for blocks
+    "numbers", # binary, octal, decimal (int/float) and hexadecimal literals
+    "operators", # long operator expressions
+    "strings", # multi-lined strings, strings and characters
+    "comments", # # comments
+    "block_comments", # ## comments
+)
+
+PHASES = ("init", "lex", "parse")
+
+BINARY_OPERATORS = ("+", "-", "*", "/", "&", "|", "^", "<<", ">>", "==", "!=", "<", "<=", ">", ">=", "and", "or")
+
+ASSIGNMENT_OPERATORS = ("=", "+=", "-=", "*=", "/=", "&=", "|=", "^=", "<<=", ">>=")
+
+SIZE_PATTERN = re.compile(pattern = r"(?P<number>\d+(\.\d+)?)\s*(?P<unit>[kKmM]?)[bB]?")
+
+
+def parse_size(size: str) -> int:
+    """
+    Bytes in a size like 512, 64K, 1.5M or 100MB
+    """
+    size_match = SIZE_PATTERN.fullmatch(size.strip())
+    if not size_match:
+        raise ValueError(f"Invalid size {repr(size)}, expected something like 512, 64K or 100M")
+    unit = {"": 1, "k": 1024, "m": 1024 * 1024}[size_match["unit"].lower()]
+    return int(float(size_match["number"]) * unit)
+
+
+def format_size(size: int) -> str:
+    for unit, unit_size in (("M", 1024 * 1024), ("K", 1024)):
+        if size >= unit_size and size % unit_size == 0:
+            return f"{size // unit_size}{unit}"
+    return str(size)
+
+
+####################################################################################################
+
+# Corpus generator
+
+
+class CorpusGenerator:
+    """
+    Writes random but lexically valid A-Script programs
+    Based numbers (binary/octal/hexadecimal) are written anywhere numbers are, like decimal ones
+    Blocks are always closed one level at a time (with end), so every line changes indentation by at most one level
+    ## comments are written between functions and inside blocks, each one ends at the next ##
+    """
+    def __init__(self, seed: int = 0, features = FEATURES, max_depth: int = 8):
+        unknown = set(features) - set(FEATURES)
+        if unknown:
+            raise ValueError(f"Unknown features {sorted(unknown)}, expected some of {FEATURES}")
+        self.rng = random.Random(seed)
+        self.features = frozenset(features)
+        self.max_depth = max_depth
+        self.functions = 0 # Functions written so far, used to give each one a new name
+
+
+    def name(self) -> str:
+        return self.rng.choice(("x", "y", "count", "total_1", "item", "a", "b", "value_2"))
+
+
+    def decimal(self) -> str:
+        return self.rng.choice(("0", "7", "42", "1_000_000", "3.14", ".5", "2.", "1e10", "6.022e+23", "1_0.2_5E-3"))
+
+
+    def based(self) -> str:
+        digits = self.rng.randint(1, 12)
+        base = self.rng.choice("box")
+        if base == "b":
+            body = "".join(self.rng.choice("01") for _ in range(digits))
+        elif base == "o":
+            body = "".join(self.rng.choice("01234567") for _ in range(digits))
+        else:
+            body = "".join(self.rng.choice("0123456789abcdefABCDEF") for _ in range(digits))
+        if len(body) > 4:
+            body = body[:4] + "_" + body[4:]
+        return "0" + base + body
+
+
+    def operand(self) -> str:
+        r = self.rng.random()
+        if "numbers" in self.features and r < 0.3:
+            return self.based() if r < 0.08 else self.decimal()
+        if "strings" in self.features and r < 0.35:
+            return self.rng.choice(("'a'", "'\\n'", "'\\''", '"text"', '"escaped \\" quote"'))
+        if r < 0.45:
+            return f"{self.name()}({self.name()}, {self.name()})"
+        if r < 0.5:
+            return f"{self.name()}[{self.rng.randint(0, 99)}]"
+        if r < 0.55:
+            return f"{self.name()}.{self.name()}"
+        return self.name()
+
+
+    def expression(self, operators: int) -> str:
+        expression = self.operand()
+        for _ in range(operators):
+            operand = self.operand()
+            if self.rng.random() < 0.2:
+                operand = f"({operand} {self.rng.choice(BINARY_OPERATORS)} {self.operand()})"
+            elif self.rng.random() < 0.1:
+                operand = self.rng.choice(("-", "~", "not ")) + operand
+            expression += f" {self.rng.choice(BINARY_OPERATORS)} {operand}"
+        return expression
+
+
+    def statement(self, indent: str, in_loop: bool = False) -> List[str]:
+        """
+        Lines of a random simple statement, break and continue only in_loop (a while/for body)
+        """
+        r = self.rng.random()
+        if "numbers" in self.features and r < 0.2:
+            if self.rng.random() < 0.5:
+                return [indent + f"define {self.name()}: mut int := {self.based()}"]
+            return [indent + f"define {self.name()}: const float := {self.decimal()} * {self.decimal()}"]
+        if "operators" in self.features and r < 0.45:
+            operators = self.rng.randint(4, 16)
+            return [
+                indent + f"{self.name()} {self.rng.choice(ASSIGNMENT_OPERATORS)} {self.expression(operators)};"
+            ]
+        if "strings" in self.features and r < 0.55:
+            lines = [
+                "    " * self.rng.randint(0, 3) + " ".join(self.name() for _ in range(self.rng.randint(1, 10)))
+                for _ in range(self.rng.randint(2, 8))
+            ]
+            return [indent + 'write("' + lines[0]] + lines[1:] + ['")']
+        if "comments" in self.features and r < 0.65:
+            return [indent + "# " + " ".join(self.name() for _ in range(self.rng.randint(1, 10)))]
+        if "block_comments" in self.features and r < 0.68:
+            return self.block_comment(indent)
+        if r < 0.8:
+            return [indent + self.rng.choice(("pass;", "break;", "continue;") if in_loop else ("pass;",))]
+        return [indent + f"{self.name()} = {self.expression(self.rng.randint(0, 3))};"]
+
+
+    def block(self, depth: int, in_loop: bool = False) -> List[str]:
+        """
+        Lines of a random block at depth (indentation levels), its statements and nested blocks
+        A block of comments only is not a block, pass is written after them
+        """
+        indent = "    " * depth
+        lines: List[str] = []
+        statements = 0 # Not counting comments
+        for _ in range(self.rng.randint(1, 4)):
+            if depth < self.max_depth and self.rng.random() < 0.4:
+                header = self.rng.choice((
+                    f"if {self.expression(self.rng.randint(1, 3))}:",
+                    f"while {self.expression(self.rng.randint(1, 3))}:",
+                    f"for {self.name()} in {self.name()}:",
+                ))
+                keyword = header.split()[0]
+                lines.append(indent + header)
+                lines.extend(self.block(depth + 1, in_loop or keyword in ("while", "for")))
+                lines.append(indent + f"end \"{keyword}\"")
+                statements += 1
+            else:
+                statement = self.statement(indent, in_loop)
+                lines.extend(statement)
+                statements += not statement[0].lstrip().startswith("#")
+        if not statements:
+            lines.append(indent + "pass;")
+        return lines
+
+
+    def function(self) -> List[str]:
+        self.functions += 1
+        name = f"function_{self.functions}"
+        parameters = ", ".join(f"{self.name()}_{i}: int" for i in range(self.rng.randint(0, 4)))
+        lines = [f"function {name}({parameters}) => int:"]
+        if "blocks" in self.features:
+            lines.extend(self.block(1))
+        else:
+            for _ in range(self.rng.randint(1, 6)):
+                lines.extend(self.statement("    "))
+        lines.append(f"    return {self.expression(self.rng.randint(0, 4))};")
+        lines.append(f"end \"{name}\"")
+        return lines
+
+
+    def block_comment(self, indent: str = "") -> List[str]:
+        """
+        Lines of a ## comment beginning at indent, lines inside it are indented anyhow
+        """
+        lines = [indent + "## " + self.name()]
+        for _ in range(self.rng.randint(0, 6)):
+            lines.append(" " * self.rng.randint(0, 8) + " ".join(self.name() for _ in range(self.rng.randint(1, 10))))
+        return lines + [indent + "##"]
+
+
+    def imports(self) -> List[str]:
+        lines: List[str] = []
+        for i in range(self.rng.randint(1, 8)):
+            if self.rng.random() < 0.3:
+                lines.append(f"import \"library_{i}.as\"")
+            else:
+                items = [f"    item_{j}," for j in range(self.rng.randint(1, 40))]
+                lines.append(f"from \"library_{i}.as\" import {{")
+                lines.extend(items)
+                lines.append("}")
+        return lines
+
+
+    def generate(self, size: int) -> str:
+        """
+        A program of at least size bytes (a little more, programs end with a complete function)
+        """
+        lines: List[str] = []
+        written = 0
+        if "imports" in self.features:
+            lines = self.imports()
+            written = sum(len(line) + 1 for line in lines)
+        while written < size:
+            unit = self.function()
+            if "imports" in self.features and self.rng.random() < 0.05:
+                unit = self.imports() + unit
+            if "block_comments" in self.features and self.rng.random() < 0.2:
+                unit = self.block_comment() + unit
+            lines.extend(unit)
+            lines.append("")
+            written += sum(len(line) + 1 for line in unit) + 1
+        return "\n".join(lines) + "\n"
+
+
+def generate_corpus(size: int, seed: int = 0, features = FEATURES, max_depth: int = 8) -> str:
+    """
+    A random A-Script program of about size bytes, the same for the same (size, seed, features, max_depth)
+    """
+    return CorpusGenerator(seed, features, max_depth).generate(size)
+
+
+####################################################################################################
+
+# Harness
+
+
+def measure(action: Callable, repeat: int = 1, memory: bool = True) -> Tuple[float, int, object]:
+    """
+    (best seconds of repeat runs, peak memory in bytes of one more run traced by tracemalloc or 0, last result)
+    action is called once per run, and must do the whole job each time
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = perf_counter()
+        result = action()
+        best = min(best, perf_counter() - start)
+    peak = 0
+    if memory:
+        result = None
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = action()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak, result
+
+
+def benchmark_source(
+    source_path: str,
+    mapped: bool = True,
+    scanner: str = "master",
+    compact: bool = False,
+    repeat: int = 3,
+    memory: bool = True,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Time Lexer.__init__, Lexer.generate_tokens and Parser.parse on a source file, each one alone
+    When mapped is True the lexer maps the file like lexer.py --file, otherwise it's given the text like --source
+    Parsing is timed on tokens generated beforehand, errors are collected and counted in its "diagnostics"
+    """
+    with open(source_path, "rb") as source_file:
+        size = len(source_file.read())
+    text = None if mapped else open(source_path, encoding = "utf-8").read()
+
+    def new_lexer(**options) -> Lexer:
+        return Lexer(file_name = source_path, text = text, scanner = scanner, compact = compact, **options)
+
+    def init():
+        return new_lexer(exit_on_error = False)
+
+    def lex():
+        return new_lexer(exit_on_error = False).generate_tokens()
+
+    def parse():
+        # Tokens are generated out of the timed part
+        lexer = new_lexer(collect_errors = True).generate_tokens()
+        parser = Parser(lexer_object = lexer, echo = False)
+        start = perf_counter()
+        parser.parse()
+        return perf_counter() - start, parser
+
+    results: Dict[str, Dict[str, float]] = {}
+    seconds, peak, lexer = measure(init, repeat, memory)
+    results["init"] = {"seconds": seconds, "peak_memory": peak}
+    seconds, peak, lexer = measure(lex, repeat, memory)
+    tokens = lexer.tokens_found
+    results["lex"] = {"seconds": seconds, "peak_memory": peak}
+    del lexer
+
+    # Only time spent in Parser.parse counts, so measure keeps the whole run time and parse reports its own
+    parse_times: List[float] = []
+    def timed_parse():
+        seconds, parser = parse()
+        parse_times.append(seconds)
+        return parser
+    _, peak, parser = measure(timed_parse, repeat, memory)
+    results["parse"] = {
+        "seconds": min(parse_times[:repeat]),
+        "peak_memory": peak,
+        "statements": len(parser.statements),
+        "diagnostics": len(parser.diagnostics),
+    }
+    del parser
+
+    for phase in PHASES:
+        seconds = results[phase]["seconds"]
+        results[phase]["bytes"] = size
+        results[phase]["tokens"] = tokens
+        results[phase]["bytes_per_second"] = size / seconds if seconds else 0.0
+        results[phase]["tokens_per_second"] = tokens / seconds if seconds else 0.0
+    return results
+
+
+def run_benchmarks(
+    sizes: List[int],
+    seed: int = 0,
+    features = FEATURES,
+    max_depth: int = 8,
+    mapped: bool = True,
+    scanner: str = "master",
+    compact: bool = False,
+    repeat: int = 3,
+    memory: bool = True,
+    corpus_dir: str = None,
+) -> Dict:
+    """
+    benchmark_source on a generated program of each size
+    Programs are written to corpus_dir (kept) or to a temporary directory (removed after)
+    """
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scanner": scanner,
+        "compact": compact,
+        "mapped": mapped,
+        "seed": seed,
+        "features": sorted(features),
+        "max_depth": max_depth,
+        "repeat": repeat,
+        "results": {},
+    }
+    with TemporaryDirectory() as temporary_dir:
+        directory = corpus_dir or temporary_dir
+        makedirs(directory, exist_ok = True)
+        for size in sizes:
+            source_path = path.join(directory, f"corpus_{format_size(size)}_{seed}.as")
+            with open(source_path, "w", encoding = "utf-8") as source_file:
+                source_file.write(generate_corpus(size, seed, features, max_depth))
+            report["results"][format_size(size)] = benchmark_source(
+                source_path, mapped, scanner, compact, repeat, memory
+            )
+    return report
+
+
+def compare_reports(report: Dict, baseline: Dict, tolerance: float = 0.1) -> List[str]:
+    """
+    Lines comparing bytes/sec of each size and phase in report with baseline
+    A line starts with REGRESSION when report is slower than baseline by more than tolerance (0.1 => 10%)
+    """
+    lines: List[str] = []
+    for size, phases in report["results"].items():
+        for phase, result in phases.items():
+            base = baseline.get("results", {}).get(size, {}).get(phase)
+            if not base or not base["bytes_per_second"]:
+                continue
+            ratio = result["bytes_per_second"] / base["bytes_per_second"]
+            prefix = "REGRESSION" if ratio < 1 - tolerance else "ok"
+            lines.append(f"{prefix:<10} {size:>6} {phase:<5} {ratio:6.2f}x baseline")
+    return lines
+
+
+def format_report(report: Dict) -> str:
+    lines = [
+        f"python {report['python']}, scanner {report['scanner']}, compact {report['compact']}, mapped {report['mapped']}",
+        f"{'size':>6} {'phase':<5} {'seconds':>10} {'tokens/s':>12} {'MB/s':>8} {'peak MB':>9}",
+    ]
+    for size, phases in report["results"].items():
+        for phase, result in phases.items():
+            lines.append(
+                f"{size:>6} {phase:<5} {result['seconds']:>10.4f} {result['tokens_per_second']:>12.0f} "
+                f"{result['bytes_per_second'] / 1e6:>8.2f} {result['peak_memory'] / 1e6:>9.2f}"
+            )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description = "Benchmark lexer and parser on generated A-Script programs")
+
+    parser.add_argument("--sizes", default="1K,16K,256K,1M", help="Comma separated program sizes, from 1K to 100M (default 1K,16K,256K,1M)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of generated programs")
+    parser.add_argument("--without", default="", help=f"Comma separated features left out of programs, some of {','.join(FEATURES)}")
+    parser.add_argument("--max-depth", type=int, default=8, help="Deepest block nesting in programs (default 8)")
+    parser.add_argument("--scanner", choices=SCANNERS, default="master", help="Scanner used to find tokens")
+    parser.add_argument("--compact", action="store_true", help="Store tokens compactly, see lexer.TokenStore")
+    parser.add_argument("--text", action="store_true", help="Give lexer source text instead of mapping the file")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each phase, the best one counts (default 3)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip measuring peak memory (one more traced run per phase)")
+    parser.add_argument("--corpus-dir", help="Keep generated programs in this directory")
+    parser.add_argument("--corpus-only", action="store_true", help="Only generate programs (in --corpus-dir), do not benchmark")
+    parser.add_argument("--save", metavar="FILE", help="Save results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="Compare results with JSON saved before by --save")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Slow down ratio reported as regression (default 0.1)")
+
+    args = parser.parse_args()
+
+    without = {feature.strip() for feature in args.without.split(",") if feature.strip()}
+    if unknown := without - set(FEATURES):
+        parser.error(f"--without: unknown features {','.join(sorted(unknown))}, expected some of {','.join(FEATURES)}")
+
+    try:
+        sizes = [parse_size(size) for size in args.sizes.split(",") if size.strip()]
+        features = [feature for feature in FEATURES if feature not in without]
+        CorpusGenerator(features = features)
+    except ValueError as error:
+        print(error, file = stderr)
+        exit(1)
+
+    if args.corpus_only:
+        if not args.corpus_dir:
+            print("--corpus-only needs --corpus-dir", file = stderr)
+            exit(1)
+        makedirs(args.corpus_dir, exist_ok = True)
+        for size in sizes:
+            with open(path.join(args.corpus_dir, f"corpus_{format_size(size)}_{args.seed}.as"), "w") as corpus_file:
+                corpus_file.write(generate_corpus(size, args.seed, features, args.max_depth))
+        exit(0)
+
+    report = run_benchmarks(
+        sizes,
+        seed = args.seed,
+        features = features,
+        max_depth = args.max_depth,
+        mapped = not args.text,
+        scanner = args.scanner,
+        compact = args.compact,
+        repeat = max(args.repeat, 1),
+        memory = not args.no_memory,
+        corpus_dir = args.corpus_dir,
+    )
+    print(format_report(report))
+
+    if args.save:
+        with open(args.save, "w") as save_file:
+            json.dump(report, save_file, indent = 4)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            comparison = compare_reports(report, json.load(baseline_file), args.tolerance)
+        print("\n".join(comparison))
+        if any(line.startswith("REGRESSION") for line in comparison):
+            exit(1)
@@ -0,0 +1,1075 @@
+#!/usr/local/bin/python3.10
+
+from typing import List, Dict, Tuple, Callable, Union
+from dataclasses import dataclass, field
+from array import array
+from bisect import bisect_right
+import linecache
+from const import *
+from lexer import Token, Diagnostic, character_span
+from parser import *
+from loader import Program
+from folder import ConstantFolder
+import runtime
+
+####################################################################################################
+
+# Compiler: AST of a loaded program (loader.Program) => bytecode run by vm.VM
+# Each function, and the top level code of each module, is compiled to a Code: a flat array("i") of
+# opcodes (each one followed by its operands) and a pool of constants, both indexed by operands
+#   - Variables defined in functions (and in blocks of top level code) live in slots of their frame,
+#     found by index at run time, no dict lookups
+#   - Variables defined at top level of modules are globals, slots shared by the whole program
+#   - Jumps have their absolute targets, patched in once the end of the jumped over code is known
+# Functions and structs of a module can be used anywhere in it, variables only after they're defined
+# import "file" makes every function, struct and global variable of file usable, from "file" import ... only some
+
+
+# Opcodes, operands follow them in code
+# Numbered (and dispatched by vm.VM) roughly from most to least frequently run
+class Op:
+    LOAD_LOCAL           = 1  # slot
+    LOAD_LOCAL_LOCAL     = 2  # slot, slot: two LOAD_LOCAL
+    LOAD_LOCAL_CONST     = 3  # slot, constant: LOAD_LOCAL then LOAD_CONST
+    LOAD_CONST           = 4  # constant
+    STORE_LOCAL          = 5  # slot
+    ADD                  = 6
+    ADD_CONST            = 7  # constant: LOAD_CONST then ADD
+    INCREMENT_LOCAL      = 8  # slot, constant: slot += constant
+    JUMP_IF_LESS         = 9  # target, pop two values and jump if first < second
+    JUMP_UNLESS_LESS     = 10 # target, pop two values and jump unless first < second
+    SUBTRACT             = 11
+    SUBTRACT_CONST       = 12 # constant: LOAD_CONST then SUBTRACT
+    MULTIPLY             = 13
+    CALL                 = 14 # function, arguments count
+    RETURN               = 15
+    LOAD_ITEM            = 16
+    STORE_ITEM           = 17 # keep (push stored value back)
+    JUMP                 = 18 # target
+    POP_JUMP_IF_FALSE    = 19 # target
+    POP_JUMP_IF_TRUE     = 20 # target
+    FOR_ITER             = 21 # slot (of iterator), target (when it's exhausted)
+    LOAD_GLOBAL          = 22 # slot
+    STORE_GLOBAL         = 23 # slot
+    LESS                 = 24
+    LESS_EQUAL           = 25
+    GREATER              = 26
+    GREATER_EQUAL        = 27
+    EQUAL                = 28
+    NOT_EQUAL            = 29
+    JUMP_IF_LESS_EQUAL   = 30 # target (as JUMP_IF_LESS for each comparison)
+    JUMP_UNLESS_LESS_EQUAL = 31
+    JUMP_IF_GREATER      = 32
+    JUMP_UNLESS_GREATER  = 33
+    JUMP_IF_GREATER_EQUAL = 34
+    JUMP_UNLESS_GREATER_EQUAL = 35
+    JUMP_IF_EQUAL        = 36
+    JUMP_UNLESS_EQUAL    = 37
+    JUMP_IF_NOT_EQUAL    = 38
+    JUMP_UNLESS_NOT_EQUAL = 39
+    BINARY               = 40 # operation, index in BINARY_OPERATIONS
+    LOAD_MEMBER          = 41 # constant (member name)
+    STORE_MEMBER         = 42 # constant (member name), keep
+    LOAD_LOCAL_DEREF     = 43 # slot (holding a reference)
+    STORE_LOCAL_DEREF    = 44 # slot (holding a reference)
+    LOAD_GLOBAL_DEREF    = 45 # slot (holding a reference)
+    STORE_GLOBAL_DEREF   = 46 # slot (holding a reference)
+    RETURN_NONE          = 47
+    POP                  = 48
+    DUP                  = 49
+    DUP_TWO              = 50
+    NEGATE               = 51
+    POSITIVE             = 52
+    INVERT               = 53
+    NOT                  = 54
+    AND_JUMP             = 55 # target, jump keeping False when top is false, pop it otherwise
+    OR_JUMP              = 56 # target, jump keeping True when top is true, pop it otherwise
+    TO_BOOL              = 57
+    REF_LOCAL            = 58 # slot
+    REF_GLOBAL           = 59 # slot
+    REF_ITEM             = 60 # reference to container[key], both popped
+    GET_ITER             = 61 # slot (to store iterator in)
+    BUILD_ARRAY          = 62 # items count
+    NEW_STRUCT           = 63 # constant ((struct, member names)), values count
+    CALL_NATIVE          = 64 # constant (Python function), arguments count
+
+
+OPCODE_NAMES = {value: name for name, value in vars(Op).items() if name.isupper()}
+
+# Operands of each opcode
+OPERANDS_COUNTS = {opcode: 0 for opcode in OPCODE_NAMES}
+OPERANDS_COUNTS.update({
+    Op.LOAD_LOCAL: 1, Op.LOAD_LOCAL_LOCAL: 2, Op.LOAD_LOCAL_CONST: 2, Op.LOAD_CONST: 1, Op.STORE_LOCAL: 1,
+    Op.ADD_CONST: 1, Op.INCREMENT_LOCAL: 2, Op.SUBTRACT_CONST: 1, Op.CALL: 2, Op.STORE_ITEM: 1, Op.JUMP: 1,
+    Op.POP_JUMP_IF_FALSE: 1, Op.POP_JUMP_IF_TRUE: 1, Op.FOR_ITER: 2, Op.LOAD_GLOBAL: 1, Op.STORE_GLOBAL: 1,
+    Op.BINARY: 1, Op.LOAD_MEMBER: 1, Op.STORE_MEMBER: 2, Op.LOAD_LOCAL_DEREF: 1, Op.STORE_LOCAL_DEREF: 1,
+    Op.LOAD_GLOBAL_DEREF: 1, Op.STORE_GLOBAL_DEREF: 1, Op.AND_JUMP: 1, Op.OR_JUMP: 1, Op.REF_LOCAL: 1,
+    Op.REF_GLOBAL: 1, Op.GET_ITER: 1, Op.BUILD_ARRAY: 1, Op.NEW_STRUCT: 2, Op.CALL_NATIVE: 2,
+})
+
+# Comparison operator => (opcode jumping if it's true, opcode jumping unless it's true), for conditions
+COMPARISON_JUMPS = {
+    "<": (Op.JUMP_IF_LESS, Op.JUMP_UNLESS_LESS),
+    "<=": (Op.JUMP_IF_LESS_EQUAL, Op.JUMP_UNLESS_LESS_EQUAL),
+    ">": (Op.JUMP_IF_GREATER, Op.JUMP_UNLESS_GREATER),
+    ">=": (Op.JUMP_IF_GREATER_EQUAL, Op.JUMP_UNLESS_GREATER_EQUAL),
+    "==": (Op.JUMP_IF_EQUAL, Op.JUMP_UNLESS_EQUAL),
+    "!=": (Op.JUMP_IF_NOT_EQUAL, Op.JUMP_UNLESS_NOT_EQUAL),
+}
+for _, jump_unless in COMPARISON_JUMPS.values():
+    OPERANDS_COUNTS[jump_unless] = OPERANDS_COUNTS[jump_unless - 1] = 1
+
+# Superinstructions: (previous instruction, instruction) => one instruction doing both, operands of both
+FUSED_OPCODES = {
+    (Op.LOAD_LOCAL, Op.LOAD_LOCAL): Op.LOAD_LOCAL_LOCAL,
+    (Op.LOAD_LOCAL, Op.LOAD_CONST): Op.LOAD_LOCAL_CONST,
+    (Op.LOAD_CONST, Op.ADD): Op.ADD_CONST,
+    (Op.LOAD_CONST, Op.SUBTRACT): Op.SUBTRACT_CONST,
+}
+
+# Binary operators without an opcode of their own, run by Op.BINARY
+BINARY_OPERATIONS = (
+    runtime.int_divide,
+    lambda a, b: a & b,
+    lambda a, b: a | b,
+    lambda a, b: a ^ b,
+    lambda a, b: a << b,
+    lambda a, b: a >> b,
+)
+
+# Binary operator => (opcode, operand)
+BINARY_OPCODES = {
+    "+": (Op.ADD, None),
+    "-": (Op.SUBTRACT, None),
+    "*": (Op.MULTIPLY, None),
+    "<": (Op.LESS, None),
+    "<=": (Op.LESS_EQUAL, None),
+    ">": (Op.GREATER, None),
+    ">=": (Op.GREATER_EQUAL, None),
+    "==": (Op.EQUAL, None),
+    "!=": (Op.NOT_EQUAL, None),
+    "/": (Op.BINARY, 0),
+    "&": (Op.BINARY, 1),
+    "|": (Op.BINARY, 2),
+    "^": (Op.BINARY, 3),
+    "<<": (Op.BINARY, 4),
+    ">>": (Op.BINARY, 5),
+}
+
+# Assignment operator => binary operator it applies, None for plain assignment
+ASSIGNMENT_OPERATIONS = {
+    "=": None, ":=": None, "~=": None, # a ~= b is a = ~b
+    "+=": "+", "-=": "-", "*=": "*", "/=": "/", "&=": "&", "|=": "|", "^=": "^", "<<=": "<<", ">>=": ">>",
+}
+
+UNARY_OPCODES = {"-": Op.NEGATE, "+": Op.POSITIVE, "~": Op.INVERT, "not": Op.NOT}
+
+REFERENCE_OPERATORS = ("&", "ref_of")
+
+# Built in functions => (Python function, do they take references)
+BUILTINS = {
+    "write": (runtime.write, False),
+    "read": (runtime.read, True),
+}
+
+
+@dataclass
+class Code:
+    """
+    A compiled function, or the top level code of a module
+    """
+    name: str
+    file: str
+    parameters: int = 0
+    slots: int = 0 # Local variables (parameters included) and hidden slots (iterators of for loops)
+    code: array = field(default_factory = lambda: array("i"))
+    constants: list = field(default_factory = list)
+    # Start of each instruction, and position (line, column, width) of what it was compiled from, for errors
+    starts: array = field(default_factory = lambda: array("i"))
+    positions: List[Tuple[int, int, int]] = field(default_factory = list)
+    instructions: list = None # code as a list, made by vm.VM before running it (list items are faster to read)
+
+    def position(self, pc: int) -> Tuple[int, int, int]:
+        """
+        Position of instruction at pc
+        """
+        return self.positions[max(bisect_right(self.starts, pc) - 1, 0)]
+
+    def error_report(self, pc: int, message: str, kind: str = "Runtime Error") -> str:
+        return position_report(self.file, *self.position(pc), message, kind)
+
+
+@dataclass
+class Variable:
+    name: str
+    slot: int
+    is_global: bool
+    mutable: bool
+    reference: bool # Holds a reference, reading/writing it reads/writes what it references
+    type: Type
+    defined: bool = True # Globals are declared before top level code is compiled, defined once it defines them
+
+
+@dataclass
+class Function:
+    name: str
+    index: int # In CompiledProgram.functions
+    statement: Compound_Statement_Function
+
+
+@dataclass
+class Struct:
+    name: str
+    statement: Compound_Statement_Struct
+    members: Dict[str, Type] = field(default_factory = dict)
+    cls: type = None # Made once all structs are declared, types of members may be structs declared later
+
+
+Symbol = Union[Variable, Function, Struct]
+
+
+@dataclass
+class CompiledProgram:
+    functions: List[Code] = field(default_factory = list)
+    bodies: List[Code] = field(default_factory = list) # Top level code of each module, in order of execution
+    globals: int = 0
+    errors: List[Diagnostic] = field(default_factory = list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+@dataclass
+class Loop:
+    continue_target: int = -1 # Where continue jumps, -1 until it's known (then continue_jumps are patched)
+    continue_jumps: List[int] = field(default_factory = list)
+    break_jumps: List[int] = field(default_factory = list)
+
+
+def position_report(file: str, ln: int, col: int, width: int, message: str, kind: str) -> str:
+    """
+    Error report pointing at width bytes from line ln, column col (both from 0, col in bytes like a mapped source) of file
+    """
+    line = linecache.getline(file, ln + 1) or "\n"
+    col, width = character_span(line, col, width)
+    report = f"{kind} in \"{file}\", line {ln + 1}, column {col + 1}:\n"
+    report += " " * 4 + message + "\n"
+    report += f"{ln + 1} | " + line
+    report += " " * len(f"{ln + 1} | ") + " " * col + "^" * max(width, 1)
+    return report
+
+
+def token_report(file: str, tok: Token, message: str, kind: str) -> str:
+    return position_report(file, tok.begin_ln, tok.begin_col, len(tok.value.partition("\n")[0].encode("utf-8")), message, kind)
+
+
+class CodeCompiler:
+    """
+    Compiles one Code: a function or the top level code of a module
+    """
+    def __init__(self, module: "ModuleCompiler", code: Code, in_function: bool):
+        self.module = module
+        self.code = code
+        self.in_function = in_function
+        self.scopes: List[Dict[str, Variable]] = [{}]
+        self.scope_starts: List[int] = [0] # First slot of each scope, slots of a closed scope are reused
+        self.next_slot = 0
+        self.loops: List[Loop] = []
+        self.constant_indices: Dict[Tuple[type, object], int] = {}
+        self.last = -1 # Start of last instruction
+        self.labels = set() # Jump targets
+
+
+    def error(self, tok: Token, message: str):
+        self.module.error(tok, message)
+
+
+    def emit(self, tok: Token, opcode: int, *operands: int) -> int:
+        """
+        Append an instruction, compiled from something at tok, returns where it starts
+        An instruction fused with the previous one (see FUSED_OPCODES) starts where the previous one does,
+        unless something jumps between them
+        """
+        code = self.code.code
+        start = len(code)
+        position = (tok.begin_ln, tok.begin_col, len(tok.value.partition("\n")[0]))
+        if self.last >= 0 and start not in self.labels:
+            previous = code[self.last]
+            if previous == Op.LOAD_LOCAL_CONST and (Op.LOAD_CONST, opcode) in FUSED_OPCODES:
+                # LOAD_LOCAL, then the LOAD_CONST fused with this one
+                code[self.last] = Op.LOAD_LOCAL
+                self.last += 2
+                self.code.starts.append(self.last)
+                self.code.positions.append(position)
+                code.append(code[self.last])
+                code[self.last] = FUSED_OPCODES[(Op.LOAD_CONST, opcode)]
+                return self.last
+            if fused := FUSED_OPCODES.get((previous, opcode)):
+                code[self.last] = fused
+                code.extend(operands)
+                if opcode in (Op.ADD, Op.SUBTRACT):
+                    self.code.positions[-1] = position # It may fail, not the constant
+                return self.last
+        self.code.starts.append(start)
+        self.code.positions.append(position)
+        code.append(opcode)
+        code.extend(operands)
+        self.last = start
+        return start
+
+
+    def label(self) -> int:
+        """
+        Where the next instruction starts, something jumps there so it's not fused with the previous one
+        """
+        target = len(self.code.code)
+        self.labels.add(target)
+        return target
+
+
+    def patch(self, start: int, target: int = None):
+        """
+        Make the jump at start jump to target (default: next instruction), its target is its last operand
+        """
+        code = self.code.code
+        code[start + OPERANDS_COUNTS[code[start]]] = self.label() if target is None else target
+
+
+    def constant(self, value) -> int:
+        """
+        Index of value in constants pool, equal constants (of the same type) are stored once
+        """
+        try:
+            key = (type(value), value)
+            if key in self.constant_indices:
+                return self.constant_indices[key]
+        except TypeError:
+            key = None # Not hashable
+        self.code.constants.append(value)
+        index = len(self.code.constants) - 1
+        if key is not None:
+            self.constant_indices[key] = index
+        return index
+
+
+    # Scopes
+
+    def open_scope(self):
+        self.scopes.append({})
+        self.scope_starts.append(self.next_slot)
+
+
+    def close_scope(self):
+        self.scopes.pop()
+        self.next_slot = self.scope_starts.pop()
+
+
+    def new_slot(self) -> int:
+        slot = self.next_slot
+        self.next_slot += 1
+        self.code.slots = max(self.code.slots, self.next_slot)
+        return slot
+
+
+    def define_local(self, name: Token, variable_type: Type = None) -> Variable:
+        """
+        Variable named name in innermost scope, variable_type is None for loop variables (immutable)
+        """
+        if name.value in self.scopes[-1]:
+            self.error(name, f"{name.value} is already defined")
+        variable = Variable(
+            name      = name.value,
+            slot      = self.new_slot(),
+            is_global = False,
+            mutable   = variable_type is not None and variable_type.mutable,
+            reference = variable_type is not None and variable_type.reference,
+            type      = variable_type,
+        )
+        self.scopes[-1][name.value] = variable
+        return variable
+
+
+    def lookup(self, tok: Token) -> Symbol:
+        """
+        What name tok is: innermost local variable, then anything of the module, None (and an error) if it's undefined
+        """
+        for scope in reversed(self.scopes):
+            if tok.value in scope:
+                return scope[tok.value]
+        symbol = self.module.lookup(tok.value)
+        if symbol is None:
+            if tok.value not in BUILTINS:
+                self.error(tok, f"Undefined name {tok.value}")
+        elif isinstance(symbol, Variable) and not symbol.defined and not self.in_function:
+            self.error(tok, f"{tok.value} is used before it's defined")
+        return symbol
+
+
+    def variable(self, tok: Token) -> Variable:
+        """
+        Variable named by tok, None (and an error) if it's something else
+        """
+        symbol = self.lookup(tok)
+        if symbol is not None and not isinstance(symbol, Variable):
+            self.error(tok, f"{tok.value} is not a variable")
+            return None
+        if symbol is None and tok.value in BUILTINS:
+            self.error(tok, f"{tok.value} is not a variable")
+        return symbol
+
+
+    def load_variable(self, tok: Token, variable: Variable):
+        if variable.is_global:
+            self.emit(tok, Op.LOAD_GLOBAL_DEREF if variable.reference else Op.LOAD_GLOBAL, variable.slot)
+        else:
+            self.emit(tok, Op.LOAD_LOCAL_DEREF if variable.reference else Op.LOAD_LOCAL, variable.slot)
+
+
+    def store_variable(self, tok: Token, variable: Variable, through_reference: bool = True):
+        """
+        Pop top into variable, into what it references when it's a reference (unless through_reference is False)
+        """
+        reference = variable.reference and through_reference
+        if variable.is_global:
+            self.emit(tok, Op.STORE_GLOBAL_DEREF if reference else Op.STORE_GLOBAL, variable.slot)
+        else:
+            self.emit(tok, Op.STORE_LOCAL_DEREF if reference else Op.STORE_LOCAL, variable.slot)
+
+
+    def root_variable(self, expression: Expression) -> Variable:
+        """
+        Variable an assignment target (or referenced expression) is part of: a, a.b, a[i], a.b[i].c, ...
+        """
+        while isinstance(expression, (Membership_Access_Expression, Array_Subscription_Expression)):
+            expression = expression.struct if isinstance(expression, Membership_Access_Expression) else expression.array
+        if isinstance(expression, Name_Expression):
+            return self.variable(expression.token)
+        return None
+
+
+    # Expressions
+
+    def compile_expression(self, expression: Expression):
+        """
+        Code pushing value of expression
+        """
+        kind = expression.kind
+        tok = expression.token
+        if kind in (NodeKind.CONSTANT, NodeKind.LITERAL):
+            self.emit(tok, Op.LOAD_CONST, self.constant(expression.value))
+        elif kind == NodeKind.NAME:
+            if (variable := self.variable(tok)) is not None:
+                self.load_variable(tok, variable)
+        elif kind == NodeKind.BINARY:
+            operator = tok.value
+            if tok.kind & ~KIND_INDEX_MASK == TokenKind.ASSIGNMENT:
+                self.compile_assignment(expression.left, tok, expression.right, keep = True)
+            elif operator in ("and", "or"):
+                self.compile_expression(expression.left)
+                jump = self.emit(tok, Op.AND_JUMP if operator == "and" else Op.OR_JUMP, -1)
+                self.compile_expression(expression.right)
+                self.emit(tok, Op.TO_BOOL)
+                self.patch(jump)
+            else:
+                self.compile_expression(expression.left)
+                self.compile_expression(expression.right)
+                self.emit_binary(tok, operator)
+        elif kind == NodeKind.UNARY:
+            operator = tok.value
+            if operator in UNARY_OPCODES:
+                self.compile_expression(expression.operand)
+                self.emit(tok, UNARY_OPCODES[operator])
+            elif operator in REFERENCE_OPERATORS:
+                self.compile_reference(expression.operand, tok, mutable = False)
+            else: # ++ / --
+                self.compile_assignment(expression.operand, tok, None, keep = True)
+        elif kind == NodeKind.STRUCT_MEMBERSHIP_ACCESS:
+            self.compile_expression(expression.struct)
+            self.emit(expression.member, Op.LOAD_MEMBER, self.constant(expression.member.value))
+        elif kind == NodeKind.ARRAY_SUBSCRIPTION:
+            self.compile_expression(expression.array)
+            self.compile_expression(expression.index)
+            self.emit(tok, Op.LOAD_ITEM)
+        elif kind == NodeKind.FUNCTION_CALL:
+            self.compile_call(expression)
+        elif kind == NodeKind.ARRAY:
+            for item in expression.items:
+                self.compile_expression(item)
+            self.emit(tok, Op.BUILD_ARRAY, len(expression.items))
+        elif kind == NodeKind.STRUCT:
+            self.compile_struct_expression(expression)
+
+
+    def emit_binary(self, tok: Token, operator: str):
+        opcode, operation = BINARY_OPCODES[operator]
+        if operation is None:
+            self.emit(tok, opcode)
+        else:
+            self.emit(tok, opcode, operation)
+
+
+    def compile_reference(self, expression: Expression, tok: Token, mutable: bool):
+        """
+        Code pushing a reference to expression (a variable, struct member or array item)
+        mutable: is the reference used to change what it references
+        """
+        if not isinstance(expression, (Name_Expression, Membership_Access_Expression, Array_Subscription_Expression)):
+            self.error(tok, "Only variables, struct members and array items have references")
+            return
+        variable = self.root_variable(expression)
+        if variable is None:
+            return
+        if mutable and not variable.mutable:
+            self.error(tok, f"Mutable reference to immutable {variable.name}")
+        if isinstance(expression, Name_Expression):
+            if variable.reference:
+                # Already a reference, pass it on
+                self.load_reference(expression.token, variable)
+            else:
+                self.emit(tok, Op.REF_GLOBAL if variable.is_global else Op.REF_LOCAL, variable.slot)
+        elif isinstance(expression, Membership_Access_Expression):
+            self.compile_expression(expression.struct)
+            self.emit(expression.member, Op.LOAD_CONST, self.constant(expression.member.value))
+            self.emit(tok, Op.REF_ITEM)
+        else:
+            self.compile_expression(expression.array)
+            self.compile_expression(expression.index)
+            self.emit(tok, Op.REF_ITEM)
+
+
+    def load_reference(self, tok: Token, variable: Variable):
+        """
+        Push the reference a reference variable holds, not what it references
+        """
+        self.emit(tok, Op.LOAD_GLOBAL if variable.is_global else Op.LOAD_LOCAL, variable.slot)
+
+
+    def compile_assignment(self, target: Expression, tok: Token, value: Expression, keep: bool):
+        """
+        target (operator tok) value, keep: push assigned value
+        value is None for ++target / --target
+        """
+        operator = tok.value
+        if value is None:
+            operation = "+" if operator == "++" else "-"
+        else:
+            operation = ASSIGNMENT_OPERATIONS[operator]
+        if not isinstance(target, (Name_Expression, Membership_Access_Expression, Array_Subscription_Expression)):
+            self.error(tok, "Can't assign to this expression")
+            return
+        variable = self.root_variable(target)
+        if variable is None:
+            return
+        if not variable.mutable:
+            self.error(tok, f"Can't assign to immutable {variable.name}")
+
+        def compile_value():
+            if value is None:
+                self.emit(tok, Op.LOAD_CONST, self.constant(1))
+            else:
+                self.compile_expression(value)
+            if operator == "~=":
+                self.emit(tok, Op.INVERT)
+            if operation is not None:
+                self.emit_binary(tok, operation)
+
+        if isinstance(target, Name_Expression):
+            if (
+                operation in ("+", "-") and not keep and not variable.is_global and not variable.reference
+                and (value is None or value.kind == NodeKind.CONSTANT and type(value.value) in (int, float))
+            ):
+                step = 1 if value is None else value.value
+                self.emit(tok, Op.INCREMENT_LOCAL, variable.slot, self.constant(step if operation == "+" else -step))
+                return
+            if operation is not None:
+                self.load_variable(target.token, variable)
+            compile_value()
+            if keep:
+                self.emit(tok, Op.DUP)
+            self.store_variable(tok, variable)
+        elif isinstance(target, Membership_Access_Expression):
+            self.compile_expression(target.struct)
+            if operation is not None:
+                self.emit(tok, Op.DUP)
+                self.emit(target.member, Op.LOAD_MEMBER, self.constant(target.member.value))
+            compile_value()
+            self.emit(tok, Op.STORE_MEMBER, self.constant(target.member.value), int(keep))
+        else:
+            self.compile_expression(target.array)
+            self.compile_expression(target.index)
+            if operation is not None:
+                self.emit(tok, Op.DUP_TWO)
+                self.emit(target.token, Op.LOAD_ITEM)
+            compile_value()
+            self.emit(tok, Op.STORE_ITEM, int(keep))
+
+
+    def compile_call(self, call: Function_Call_Expression):
+        tok = call.token
+        if not isinstance(call.function, Name_Expression):
+            self.error(first_token(call.function), "Only functions can be called")
+            return
+        name = call.function.token
+        symbol = self.lookup(name)
+        arguments = call.arguments
+        if symbol is None and name.value in BUILTINS:
+            function, takes_references = BUILTINS[name.value]
+            for argument in arguments:
+                if takes_references:
+                    self.compile_reference_argument(argument, mutable = True)
+                else:
+                    self.compile_expression(argument)
+            self.emit(name, Op.CALL_NATIVE, self.constant(function), len(arguments))
+            return
+        if symbol is None:
+            return
+        if not isinstance(symbol, Function):
+            self.error(name, f"{name.value} is not a function")
+            return
+        parameters = symbol.statement.parameters
+        if len(arguments) != len(parameters):
+            self.error(name, f"{name.value} takes {len(parameters)} arguments, got {len(arguments)}")
+            return
+        for parameter, argument in zip(parameters, arguments):
+            if parameter.type.reference:
+                self.compile_reference_argument(argument, parameter.type.mutable)
+            else:
+                self.compile_expression(argument)
+        self.emit(name, Op.CALL, symbol.index, len(arguments))
+
+
+    def compile_reference_argument(self, argument: Expression, mutable: bool):
+        """
+        Argument of a reference parameter: ref_of x (or &x), or a reference variable
+        """
+        if isinstance(argument, Unary_Expression) and argument.token.value in REFERENCE_OPERATORS:
+            self.compile_reference(argument.operand, argument.token, mutable)
+            return
+        if isinstance(argument, Name_Expression):
+            variable = self.variable(argument.token)
+            if variable is not None and variable.reference:
+                if mutable and not variable.mutable:
+                    self.error(argument.token, f"Mutable reference to immutable {variable.name}")
+                self.load_reference(argument.token, variable)
+                return
+        self.error(first_token(argument), "Expected a reference (ref_of name)")
+
+
+    def compile_struct_expression(self, expression: Struct_Expression):
+        name = expression.struct.token
+        symbol = self.lookup(name)
+        if symbol is None:
+            return
+        if not isinstance(symbol, Struct):
+            self.error(name, f"{name.value} is not a struct")
+            return
+        given: List[str] = []
+        for member, value in zip(expression.members, expression.values):
+            if member.value not in symbol.members:
+                self.error(member, f"{name.value} has no member {member.value}")
+            elif member.value in given:
+                self.error(member, f"{member.value} is given more than once")
+            given.append(member.value)
+            self.compile_expression(value)
+        self.emit(name, Op.NEW_STRUCT, self.constant((symbol, tuple(given))), len(given))
+
+
+    def compile_condition(self, condition: Expression, jump_if: bool, target: int = -1) -> int:
+        """
+        Code jumping to target when condition is jump_if, returns where the jump is (to patch it)
+        Comparisons jump without pushing their result
+        """
+        tok = condition.token
+        if condition.kind == NodeKind.BINARY and tok.value in COMPARISON_JUMPS:
+            self.compile_expression(condition.left)
+            self.compile_expression(condition.right)
+            return self.emit(tok, COMPARISON_JUMPS[tok.value][not jump_if], target)
+        self.compile_expression(condition)
+        return self.emit(first_token(condition), Op.POP_JUMP_IF_TRUE if jump_if else Op.POP_JUMP_IF_FALSE, target)
+
+
+    # Statements
+
+    def compile_block(self, block: Block):
+        self.open_scope()
+        for statement in block:
+            self.compile_statement(statement)
+        self.close_scope()
+
+
+    def compile_statement(self, statement: Statement):
+        kind = statement.kind
+        if kind == NodeKind.EXPRESSION_STATEMENT:
+            expression = statement.expression
+            tok = expression.token
+            if expression.kind == NodeKind.BINARY and tok.kind & ~KIND_INDEX_MASK == TokenKind.ASSIGNMENT:
+                self.compile_assignment(expression.left, tok, expression.right, keep = False)
+            elif expression.kind == NodeKind.UNARY and tok.kind == TokenKind.OPERATOR: # ++ / --
+                self.compile_assignment(expression.operand, tok, None, keep = False)
+            else:
+                self.compile_expression(expression)
+                self.emit(tok, Op.POP)
+        elif kind == NodeKind.DEFINE_STATEMENT:
+            self.compile_define(statement)
+        elif kind == NodeKind.IF_STATEMENT:
+            end_jumps: List[int] = []
+            last = len(statement.conditions) - 1
+            for i, (condition, block) in enumerate(zip(statement.conditions, statement.blocks)):
+                next_jump = self.compile_condition(condition, jump_if = False)
+                self.compile_block(block)
+                if i < last or statement.else_block is not None:
+                    end_jumps.append(self.emit(first_token(condition), Op.JUMP, -1))
+                self.patch(next_jump)
+            if statement.else_block is not None:
+                self.compile_block(statement.else_block)
+            for jump in end_jumps:
+                self.patch(jump)
+        elif kind == NodeKind.WHILE_STATEMENT:
+            # Condition is tested after the body, one jump per iteration
+            tok = first_token(statement.condition)
+            loop = Loop()
+            entry = self.emit(tok, Op.JUMP, -1)
+            body = self.label()
+            self.loops.append(loop)
+            self.compile_block(statement.body)
+            self.loops.pop()
+            self.patch(entry)
+            loop.continue_target = self.code.code[entry + 1]
+            self.compile_condition(statement.condition, jump_if = True, target = body)
+            self.end_loop(loop)
+        elif kind == NodeKind.FOR_STATEMENT:
+            tok = first_token(statement.iterable)
+            self.compile_expression(statement.iterable)
+            self.open_scope()
+            iterator = self.new_slot()
+            self.emit(tok, Op.GET_ITER, iterator)
+            loop = Loop(continue_target = self.label())
+            exit_jump = self.emit(statement.variable, Op.FOR_ITER, iterator, -1)
+            variable = self.define_local(statement.variable)
+            self.store_variable(statement.variable, variable)
+            self.loops.append(loop)
+            self.compile_block(statement.body)
+            self.loops.pop()
+            self.emit(statement.variable, Op.JUMP, loop.continue_target)
+            self.patch(exit_jump)
+            self.end_loop(loop)
+            self.close_scope()
+        elif kind in (NodeKind.BREAK_STATEMENT, NodeKind.CONTINUE_STATEMENT):
+            tok = statement.keyword
+            if not self.loops:
+                self.error(tok, f"{tok.value} outside of a loop")
+            elif kind == NodeKind.BREAK_STATEMENT:
+                self.loops[-1].break_jumps.append(self.emit(tok, Op.JUMP, -1))
+            else:
+                loop = self.loops[-1]
+                jump = self.emit(tok, Op.JUMP, loop.continue_target)
+                if loop.continue_target < 0:
+                    loop.continue_jumps.append(jump)
+        elif kind == NodeKind.RETURN_STATEMENT:
+            tok = statement.keyword
+            if not self.in_function:
+                self.error(tok, "return outside of a function")
+            elif statement.value is None:
+                self.emit(tok, Op.RETURN_NONE)
+            else:
+                self.compile_expression(statement.value)
+                self.emit(tok, Op.RETURN)
+        elif kind == NodeKind.FUNCTION_STATEMENT:
+            self.error(statement.function, "Functions are only defined at top level of modules")
+        elif kind == NodeKind.STRUCT_STATEMENT:
+            self.error(statement.struct, "Structs are only defined at top level of modules")
+        elif kind == NodeKind.IMPORT_STATEMENT:
+            self.error(statement.path, "Imports are only allowed at top level of modules")
+        # pass: nothing to do
+
+
+    def end_loop(self, loop: Loop):
+        for jump in loop.continue_jumps:
+            self.patch(jump, loop.continue_target)
+        for jump in loop.break_jumps:
+            self.patch(jump)
+
+
+    def compile_define(self, statement: Simple_Statement_Define, variable: Variable = None):
+        """
+        variable: global variable defined by statement, None for local ones (defined here)
+        """
+        name = statement.variable
+        variable_type = statement.type
+        value = statement.value
+        if variable_type.reference:
+            if value is None:
+                self.error(name, f"Reference {name.value} needs a value (ref_of name)")
+            else:
+                self.compile_reference_argument(value, variable_type.mutable)
+        elif value is not None:
+            self.compile_expression(value)
+            if variable_type.sizes:
+                self.emit(name, Op.CALL_NATIVE, self.constant(self.module.array_converter(variable_type)), 1)
+        else:
+            if variable_type.constant:
+                self.error(name, f"Constant {name.value} needs a value")
+            self.compile_zero(name, variable_type)
+        if variable is None:
+            variable = self.define_local(name, variable_type)
+        else:
+            variable.defined = True
+        self.store_variable(name, variable, through_reference = False)
+
+
+    def compile_zero(self, tok: Token, variable_type: Type):
+        """
+        Code pushing initial value of a variable of variable_type without one
+        """
+        base = variable_type.base.value
+        if base in runtime.ZERO_VALUES:
+            self.emit(tok, Op.LOAD_CONST, self.constant(runtime.ZERO_VALUES[base]))
+        else:
+            self.emit(tok, Op.CALL_NATIVE, self.constant(self.module.zero_factory(variable_type)), 0)
+
+
+class ModuleCompiler:
+    """
+    Compiles one module: its functions and structs, then its top level code
+    """
+    def __init__(self, compiler: "Compiler", file: str, statements: List[Statement]):
+        self.compiler = compiler
+        self.file = file
+        self.statements = statements
+        self.symbols: Dict[str, Symbol] = {} # Functions, structs and global variables of this module
+        self.imported: Dict[str, Symbol] = {} # Names imported from other modules
+        self.constants: Dict[str, object] = {} # Values of constants defined at top level, known once it's folded
+        self.imported_constants: Dict[str, object] = {}
+
+
+    def error(self, tok: Token, message: str):
+        self.compiler.errors.append(
+            Diagnostic(
+                kind    = "Compile Error",
+                file    = self.file,
+                line    = tok.begin_ln,
+                col     = character_span(linecache.getline(self.file, tok.begin_ln + 1), tok.begin_col, 0)[0],
+                span    = (tok.begin_idx, tok.end_idx),
+                message = message,
+                report  = token_report(self.file, tok, message, "Compile Error"),
+            )
+        )
+
+
+    def lookup(self, name: str) -> Symbol:
+        return self.symbols.get(name) or self.imported.get(name)
+
+
+    def declare(self, tok: Token, symbol: Symbol):
+        if tok.value in self.symbols:
+            self.error(tok, f"{tok.value} is already defined")
+        self.symbols[tok.value] = symbol
+
+
+    def declare_all(self):
+        """
+        Functions, structs and global variables, before anything is compiled so they can be used anywhere
+        """
+        for statement in self.statements:
+            kind = statement.kind
+            if kind == NodeKind.FUNCTION_STATEMENT:
+                self.declare(statement.function, Function(statement.function.value, self.compiler.new_function(), statement))
+            elif kind == NodeKind.STRUCT_STATEMENT:
+                self.declare(statement.struct, Struct(statement.struct.value, statement))
+            elif kind == NodeKind.DEFINE_STATEMENT:
+                self.declare(
+                    statement.variable,
+                    Variable(
+                        name      = statement.variable.value,
+                        slot      = self.compiler.new_global(),
+                        is_global = True,
+                        mutable   = statement.type.mutable,
+                        reference = statement.type.reference,
+                        type      = statement.type,
+                        defined   = False,
+                    )
+                )
+
+
+    def import_all(self, modules: Dict[str, "ModuleCompiler"], imports):
+        """
+        Names imported by this module's import statements, modules are compilers of imported files
+        """
+        for imported in imports:
+            module = modules.get(imported.file)
+            if module is None:
+                continue # Part of an import cycle, already an error
+            statement = imported.statement
+            if not statement.items:
+                for name, symbol in module.symbols.items():
+                    if self.imported.setdefault(name, symbol) is symbol and name in module.constants:
+                        self.imported_constants[name] = module.constants[name]
+                continue
+            for item in statement.items:
+                if item.value not in module.symbols:
+                    self.error(item, f"{statement.path.value} has no {item.value}")
+                else:
+                    self.imported[item.value] = module.symbols[item.value]
+                    if item.value in module.constants:
+                        self.imported_constants[item.value] = module.constants[item.value]
+                    else:
+                        self.imported_constants.pop(item.value, None)
+
+
+    def make_structs(self):
+        for symbol in self.symbols.values():
+            if not isinstance(symbol, Struct):
+                continue
+            zeros = []
+            for member in symbol.statement.members:
+                if member.identifier.value in symbol.members:
+                    self.error(member.identifier, f"{member.identifier.value} is already a member of {symbol.name}")
+                    continue
+                symbol.members[member.identifier.value] = member.type
+                zeros.append(self.zero_factory(member.type))
+            symbol.cls = runtime.struct_class(symbol.name, tuple(symbol.members), tuple(zeros))
+
+
+    def type_symbol(self, tok: Token) -> Struct:
+        symbol = self.lookup(tok.value)
+        if not isinstance(symbol, Struct):
+            self.error(tok, f"Unknown type {tok.value}")
+            return None
+        return symbol
+
+
+    def array_parts(self, array_type: Type) -> Tuple[Tuple[int, ...], str, Callable[[], object]]:
+        """
+        Sizes, typecode and item zero factory of a (sized) array type, see runtime.array_factory
+        """
+        element = array_type.element
+        sizes = tuple(literal_value(size) for size in array_type.sizes)
+        typecode = None
+        if not element.reference and not element.sizes:
+            typecode = runtime.ARRAY_TYPECODES.get(element.base.value)
+        return (sizes, typecode, self.zero_factory(element))
+
+
+    def array_converter(self, array_type: Type) -> Callable[[object], object]:
+        return runtime.array_converter(*self.array_parts(array_type))
+
+
+    def zero_factory(self, variable_type: Type) -> Callable[[], object]:
+        """
+        Function making initial value of variables of variable_type without one
+        """
+        if variable_type.reference:
+            return lambda: None
+        base = variable_type.base.value
+        if base in runtime.ZERO_VALUES:
+            zero = runtime.ZERO_VALUES[base]
+            return lambda: zero
+        if variable_type.base.kind == KEYWORD_KINDS["array"]:
+            if not variable_type.sizes:
+                return list
+            return runtime.array_factory(*self.array_parts(variable_type))
+        symbol = self.type_symbol(variable_type.base)
+        if symbol is None:
+            return lambda: None
+        return lambda: symbol.cls()
+
+
+    def compile_functions(self):
+        for symbol in list(self.symbols.values()):
+            if not isinstance(symbol, Function):
+                continue
+            statement = symbol.statement
+            code = Code(name = symbol.name, file = self.file, parameters = len(statement.parameters))
+            compiler = CodeCompiler(self, code, in_function = True)
+            for parameter in statement.parameters:
+                self.check_type(parameter.type)
+                compiler.define_local(parameter.identifier, parameter.type)
+            for body_statement in statement.body:
+                compiler.compile_statement(body_statement)
+            compiler.emit(statement.function, Op.RETURN_NONE)
+            self.compiler.compiled.functions[symbol.index] = code
+
+
+    def check_type(self, variable_type: Type):
+        """
+        Report struct names of a type which are not structs
+        """
+        while variable_type is not None:
+            if variable_type.base.kind == TokenKind.NAME:
+                self.type_symbol(variable_type.base)
+            variable_type = variable_type.element
+
+
+    def compile_body(self) -> Code:
+        """
+        Top level code of module
+        """
+        code = Code(name = "<module>", file = self.file)
+        compiler = CodeCompiler(self, code, in_function = False)
+        for statement in self.statements:
+            kind = statement.kind
+            if kind in (NodeKind.FUNCTION_STATEMENT, NodeKind.STRUCT_STATEMENT, NodeKind.IMPORT_STATEMENT):
+                continue
+            if kind == NodeKind.DEFINE_STATEMENT:
+                self.check_type(statement.type)
+                variable = self.symbols.get(statement.variable.value)
+                compiler.compile_define(statement, variable if isinstance(variable, Variable) else None)
+            else:
+                compiler.compile_statement(statement)
+        compiler.emit(Token(), Op.RETURN_NONE)
+        return code
+
+
+class Compiler:
+    def __init__(self, program: Program):
+        self.program = program
+        self.compiled = CompiledProgram()
+        self.errors = self.compiled.errors
+        self.modules: Dict[str, ModuleCompiler] = {} # By file, once compiled they know every module's names
+
+
+    def new_function(self) -> int:
+        self.compiled.functions.append(None)
+        return len(self.compiled.functions) - 1
+
+
+    def new_global(self) -> int:
+        self.compiled.globals += 1
+        return self.compiled.globals - 1
+
+
+    def compile(self) -> CompiledProgram:
+        """
+        Compile every module of program, in order of execution
+        """
+        modules = self.modules
+        for file_path in self.program.order:
+            module = self.program.modules[file_path]
+            compiler = modules[file_path] = ModuleCompiler(self, file_path, module.statements)
+            compiler.declare_all()
+            compiler.import_all(modules, module.imports)
+            errors = len(self.errors)
+            compiler.constants = ConstantFolder(module.statements, compiler.error, compiler.imported_constants).fold()
+            compiler.make_structs()
+            compiler.compile_functions()
+            self.compiled.bodies.append(compiler.compile_body())
+            # Functions are compiled before top level code, keep errors of the module in source order
+            self.errors[errors:] = sorted(self.errors[errors:], key = lambda diagnostic: diagnostic.span)
+        return self.compiled
+
+
+def disassemble(code: Code) -> str:
+    lines = [f"{code.name} ({code.file}): {code.parameters} parameters, {code.slots} slots"]
+    pc = 0
+    while pc < len(code.code):
+        opcode = code.code[pc]
+        operands = list(code.code[pc + 1 : pc + 1 + OPERANDS_COUNTS[opcode]])
+        text = f"{pc:6} {OPCODE_NAMES[opcode]:<20}" + " ".join(map(str, operands))
+        if opcode in (Op.LOAD_CONST, Op.ADD_CONST, Op.SUBTRACT_CONST, Op.LOAD_MEMBER, Op.STORE_MEMBER, Op.NEW_STRUCT, Op.CALL_NATIVE):
+            text += f"  ({code.constants[operands[0]]!r})"
+        elif opcode in (Op.LOAD_LOCAL_CONST, Op.INCREMENT_LOCAL):
+            text += f"  ({code.constants[operands[1]]!r})"
+        lines.append(text)
+        pc += 1 + OPERANDS_COUNTS[opcode]
+    return "\n".join(lines)
@@ -72,9 +72,9 @@ BLOCK_STATEMENTS = ("function", "if", "else", "else_if", "for", "while")
 
 PRIMITIVE_DATA_TYPES = ("int", "float", "bool", "char", "string", "array")
 
-OPERATORS = (
-    ".", # Membership access
-    # ARITHMETIC_OPERATORS
+MEMBERSHIP_ACCESS_OPERATORS = (".",)
+
+ARITHMETIC_OPERATORS = (
     "+",
     "-",
     "*",
@@ -85,7 +85,9 @@ OPERATORS = (
     "^",
     ">>",
     "<<",
-    # LOGICAL_OPERATORS
+)
+
+LOGICAL_OPERATORS = (
     "==",
     "!=",
     "<",
@@ -95,7 +97,9 @@ OPERATORS = (
     "not",
     "and",
     "or",
-    # ASSIGNMENT_OPERATORS
+)
+
+ASSIGNMENT_OPERATORS = (
     ":=",
     "=",
     "+=",
@@ -110,6 +114,8 @@ OPERATORS = (
     "<<=",
 )
 
+OPERATORS = MEMBERSHIP_ACCESS_OPERATORS + ARITHMETIC_OPERATORS + LOGICAL_OPERATORS + ASSIGNMENT_OPERATORS
+
 SEPARATORS = ("{", "}", "[", "]", "(", ")", ",", ":", ";", "=>")
 
 BINARY_NUMBER_PATTERN = re.compile(r"0[bB]([_]{0,1}[01]+)+")
@@ -128,15 +134,15 @@ FLOAT_PATTERN = re.compile(
 
         r"("
 
-            r"[.](\d+([_]\d+)*){0,1}" # Fractional part with optional digits after the decimal point (e.g, .1234, or just ., like in 4.)
+            r"[.](\d+([_]\d+)*){0,1}[Ee][+-]{0,1}\d+([_]\d+)*" # BOTH, tried first so the exponent is not left out
 
             r"|" # OR
 
-            r"[Ee][+-]{0,1}\d+([_]\d+)*" # Exponent part (e-3, E+12)
+            r"[.](\d+([_]\d+)*){0,1}" # Fractional part with optional digits after the decimal point (e.g, .1234, or just ., like in 4.)
 
-            r"|" # OR BOTH
+            r"|" # OR
 
-            r"[.](\d+([_]\d+)*){0,1}[Ee][+-]{0,1}\d+([_]\d+)*"
+            r"[Ee][+-]{0,1}\d+([_]\d+)*" # Exponent part (e-3, E+12)
 
         r")"
 
@@ -160,8 +166,6 @@ STRING_PATTERN = r'".*?(?<!\\)"'
 
 SINGLE_LINED_STRING_PATTERN = re.compile(pattern = STRING_PATTERN) # Match (matching ") ONLY IF this (matching ") is not preceded by \
 
-MULTI_LINED_STRING_PATTERN  = re.compile(pattern = STRING_PATTERN, flags = re.DOTALL)
-
 NAME_PATTERN = re.compile(r"[_a-zA-Z][_a-zA-Z0-9]*")
 
 OPERATOR_PATTERN = re.compile(
@@ -178,11 +182,11 @@ OPERATOR_PATTERN = re.compile(
     r"~=|"
     r"&=|"
     r"[|]=|"
-    r"\^="
+    r"\^=|"
     r">>=|"
     r">>|"
     r"<<=|"
-    r"<<=|"
+    r"<<|"
     r":=|"
     r"==|"
     r"!=|"
@@ -198,7 +202,7 @@ OPERATOR_PATTERN = re.compile(
     r"\^|"
     r"<|"
     r">|"
-    r"="
+    r"=(?!>)" # => is a separator
 )
 
 SEPARATOR_PATTERN = re.compile(
@@ -226,3 +230,171 @@ SEPARATOR_PATTERN = re.compile(
 ARRAY_TYPE_PATTERN = re.compile(
     rf"array[ ]*\([ ]*{NAME_PATTERN.pattern}[ ]*([ ]*,[ ]*{INT_PATTERN.pattern}[ ]*)*[ ]*\)"
 )
+
+####################################################################################################
+
+# Token kinds: an int for each kind of token, so the lexer and parser compare ints instead of building/comparing names
+#   bits 0-7: which keyword/operator/separator it is (its position in KEYWORDS/OPERATORS/SEPARATORS, plus 1), 0 otherwise
+#   bits 8-11: kind inside its category, like BINARY in NUMBER::BINARY
+#   bits 12-23: category, one bit for each, so checking a category is a single &
+#   bit 24: MULTI_LINED flag
+# TokenKind is a plain class of ints, not an IntEnum: reading an enum member is several times slower
+# and the lexer reads a few kinds for every token
+
+KIND_INDEX_MASK = 0xFF
+
+KIND_CATEGORIES_MASK = 0xFFF << 12
+
+
+class TokenKind:
+    NAME        = 1 << 12
+    KEYWORD     = 1 << 13
+    NUMBER      = 1 << 14
+    OPERATOR    = 1 << 15
+    SEPARATOR   = 1 << 16
+    CHARACTER   = 1 << 17
+    STRING      = 1 << 18
+    COMMENT     = 1 << 19
+    LINE_BREAK  = 1 << 20
+    INDENT      = 1 << 21
+    OUTDENT     = 1 << 22
+    EOF         = 1 << 23
+    MULTI_LINED = 1 << 24 # Flag, combined with STRING/COMMENT
+
+    BLOCK_KEYWORD = KEYWORD | 1 << 8
+    DATA_TYPE     = KEYWORD | 2 << 8
+
+    BINARY      = NUMBER | 1 << 8
+    OCTAL       = NUMBER | 2 << 8
+    HEXADECIMAL = NUMBER | 3 << 8
+    INT         = NUMBER | 4 << 8
+    FLOAT       = NUMBER | 5 << 8
+
+    MEMBERSHIP_ACCESS = OPERATOR | 1 << 8
+    ARITHMETIC        = OPERATOR | 2 << 8
+    LOGICAL           = OPERATOR | 3 << 8
+    ASSIGNMENT        = OPERATOR | 4 << 8
+
+    MULTI_LINED_STRING  = STRING | MULTI_LINED
+    MULTI_LINED_COMMENT = COMMENT | MULTI_LINED
+
+
+# Name of each kind, shown when printing tokens
+KIND_NAMES = {
+    TokenKind.NAME: "NAME",
+    TokenKind.KEYWORD: "KEYWORD",
+    TokenKind.BLOCK_KEYWORD: "KEYWORD::BLOCK_KEYWORD",
+    TokenKind.DATA_TYPE: "KEYWORD::DATA_TYPE",
+    TokenKind.NUMBER: "NUMBER",
+    TokenKind.BINARY: "NUMBER::BINARY",
+    TokenKind.OCTAL: "NUMBER::OCTAL",
+    TokenKind.HEXADECIMAL: "NUMBER::HEXADECIMAL",
+    TokenKind.INT: "NUMBER::INT",
+    TokenKind.FLOAT: "NUMBER::FLOAT",
+    TokenKind.OPERATOR: "OPERATOR",
+    TokenKind.MEMBERSHIP_ACCESS: "OPERATOR::MEMBERSHIP_ACCESS",
+    TokenKind.ARITHMETIC: "OPERATOR::ARITHMETIC",
+    TokenKind.LOGICAL: "OPERATOR::LOGICAL",
+    TokenKind.ASSIGNMENT: "OPERATOR::ASSIGNMENT",
+    TokenKind.SEPARATOR: "SEPARATOR",
+    TokenKind.CHARACTER: "CHARACTER",
+    TokenKind.STRING: "STRING",
+    TokenKind.MULTI_LINED_STRING: "MULTI_LINED_STRING",
+    TokenKind.COMMENT: "COMMENT",
+    TokenKind.MULTI_LINED_COMMENT: "MULTI_LINED_COMMENT",
+    TokenKind.LINE_BREAK: "LINE_BREAK",
+    TokenKind.INDENT: "INDENT",
+    TokenKind.OUTDENT: "OUTDENT",
+    TokenKind.EOF: "EOF",
+}
+
+KINDS_BY_NAME = {name: kind for kind, name in KIND_NAMES.items()}
+
+
+def kind_name(kind: int) -> str:
+    """
+    Name of a token kind, like NUMBER::HEXADECIMAL
+    """
+    return KIND_NAMES[kind & ~KIND_INDEX_MASK]
+
+
+# Kind of each keyword/operator/separator text, the only place text is looked at to classify them
+# A name is looked up in KEYWORD_KINDS, and it's a NAME if it's not there
+# not/and/or are both keywords and operators, they're found as names so they're keywords
+
+KEYWORD_KINDS = {
+    keyword: (
+        TokenKind.BLOCK_KEYWORD if keyword in BLOCK_STATEMENTS else
+        TokenKind.DATA_TYPE if keyword in PRIMITIVE_DATA_TYPES else
+        TokenKind.KEYWORD
+    ) | (i + 1)
+    for i, keyword in enumerate(KEYWORDS)
+}
+
+OPERATOR_KINDS = {
+    operator: (
+        TokenKind.MEMBERSHIP_ACCESS if operator in MEMBERSHIP_ACCESS_OPERATORS else
+        TokenKind.ARITHMETIC if operator in ARITHMETIC_OPERATORS else
+        TokenKind.LOGICAL if operator in LOGICAL_OPERATORS else
+        TokenKind.ASSIGNMENT
+    ) | (i + 1)
+    for i, operator in enumerate(OPERATORS)
+}
+
+SEPARATOR_KINDS = {separator: TokenKind.SEPARATOR | (i + 1) for i, separator in enumerate(SEPARATORS)}
+
+OPENING_BRACKET_KINDS = frozenset(SEPARATOR_KINDS[bracket] for bracket in ("(", "[", "{"))
+
+CLOSING_BRACKET_KINDS = frozenset(SEPARATOR_KINDS[bracket] for bracket in (")", "]", "}"))
+
+####################################################################################################
+
+# Precompiled helpers for the lexer's master scanner (Lexer.generate_next_token_master)
+# Built from the definitions above so both scanners always agree on what a token is
+
+KEYWORDS_SET = frozenset(KEYWORDS) # O(1) keyword checks
+
+INDENT_PATTERN = re.compile(r"[ \t]*")
+
+FIRST_NON_WHITE_SPACE_PATTERN = re.compile(r"[^\s]")
+
+# Head of a line: its indentation, other white-spaces, then its first non-white-space character (\n for blank lines)
+LINE_HEAD_PATTERN = re.compile(r"(?P<indent>[ \t]*)[^\S\n]*(?P<first>[^\s]|\n)")
+
+# Characters which can change whether the next line head is a safe restart point (see Lexer.find_chunks):
+# brackets, line breaks and starts of strings, characters and comments
+RESTART_POINT_PATTERN = re.compile(pattern = r"""[()\[\]{}"'#\n]""")
+
+# Characters which make the lexer attempt a number, same as r"[.0-9a-fA-F]"
+NUMBER_START_CHARACTERS = frozenset(".0123456789abcdefABCDEF")
+
+# A (possible) (binary/octal/hexadecimal) number, it's confirmed using one of the patterns in BASED_NUMBERS
+WEAK_BASED_NUMBER_PATTERN = re.compile(pattern = r"0(?P<header>[boxBOX])(?P<body>[_.0-9a-zA-Z]*)[^_.0-9a-zA-Z]")
+
+# header => (token kind, pattern)
+BASED_NUMBERS = {
+    "b": (TokenKind.BINARY, BINARY_NUMBER_PATTERN),
+    "o": (TokenKind.OCTAL, OCTAL_NUMBER_PATTERN),
+    "x": (TokenKind.HEXADECIMAL, HEX_NUMBER_PATTERN),
+}
+
+# FLOAT is tried before INT, just like FLOAT_PATTERN then INT_PATTERN
+DECIMAL_NUMBER_PATTERN = re.compile(
+    rf"(?P<FLOAT>{FLOAT_PATTERN.pattern})"
+    r"|"
+    rf"(?P<INT>{INT_PATTERN.pattern})"
+)
+
+DECIMAL_NUMBER_KINDS = {"FLOAT": TokenKind.FLOAT, "INT": TokenKind.INT} # DECIMAL_NUMBER_PATTERN group => token kind
+
+WEAK_CHAR_PATTERN = re.compile(pattern = r"['].*?(?<!\\)[']")
+
+# One alternation for names/keywords, operators and separators
+# Alternatives keep the order in which the classic scanner tries them, so the first one to match wins in both
+MASTER_PATTERN = re.compile(
+    rf"(?P<NAME>{NAME_PATTERN.pattern})"
+    r"|"
+    rf"(?P<OPERATOR>{OPERATOR_PATTERN.pattern})"
+    r"|"
+    rf"(?P<SEPARATOR>{SEPARATOR_PATTERN.pattern})"
+)
@@ -0,0 +1,179 @@
+#!/usr/local/bin/python3.10
+
+from typing import List, Iterable
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+from os import path, walk, cpu_count
+from sys import stderr
+from time import perf_counter
+from lexer import Lexer, TokenStore, Diagnostic, SCANNERS
+from parser import Parser
+from token_cache import TokenCache, encode_tokens
+
+####################################################################################################
+
+# Driver: lex/parse many files at once, each file in a worker process
+# Workers send back a small FileResult (counts, diagnostics, optionally encoded tokens), never Token/AST objects
+# so little is pickled between processes, and one bad file does not stop the others
+# Lexer/parser collect errors, so every error of every file is reported in one run
+
+
+MODES = ("parse", "lex")
+
+SOURCE_SUFFIX = ".as"
+
+
+@dataclass
+class FileResult:
+    file: str
+    tokens: int = 0 # How many tokens were found
+    statements: int = 0 # How many statements were parsed, always 0 when only lexing
+    errors: List[Diagnostic] = field(default_factory = list) # str(error) is the report a failing lexer/parser prints
+    seconds: float = 0.0
+    token_data: bytes = None # All tokens encoded by token_cache.encode_tokens, only when asked for
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def collect_files(paths: Iterable[str], suffix: str = SOURCE_SUFFIX) -> List[str]:
+    """
+    Absolute paths of files in paths, directories are searched recursively for files ending with suffix
+    """
+    files: List[str] = []
+    for file_path in paths:
+        if path.isdir(file_path):
+            for directory, directories, names in walk(file_path):
+                directories.sort()
+                files.extend(path.join(directory, name) for name in sorted(names) if name.endswith(suffix))
+        else:
+            files.append(file_path)
+    return [path.abspath(file_path) for file_path in files]
+
+
+def check_file(
+    file_path: str,
+    mode: str = "parse",
+    scanner: str = "master",
+    token_cache_dir: str = None,
+    keep_tokens: bool = False,
+) -> FileResult:
+    """
+    Lex (mode "lex") or lex and parse (mode "parse") one file
+    Runs in worker processes, so it must stay a module level function
+    """
+    result = FileResult(file = file_path)
+    start = perf_counter()
+    lexer = None
+    try:
+        lexer = Lexer(
+            file_name = file_path,
+            scanner = scanner,
+            compact = True,
+            token_cache = TokenCache(token_cache_dir) if token_cache_dir else None,
+            collect_errors = True,
+        )
+        if mode == "lex" or keep_tokens:
+            lexer.generate_tokens()
+        if mode == "parse":
+            result.statements = len(Parser(lexer_object = lexer, echo = False).parse().statements)
+        result.tokens = lexer.tokens_found
+        if keep_tokens:
+            result.token_data = encode_tokens({column: getattr(lexer.tokens, column) for column in TokenStore.COLUMNS})
+        result.errors = lexer.diagnostics
+    except OSError as error:
+        result.errors.append(
+            Diagnostic(
+                kind    = "File Error",
+                file    = file_path,
+                message = error.strerror,
+                report  = f"File Error in \"{file_path}\":\n" + " " * 4 + f"{error.strerror}",
+            )
+        )
+    finally:
+        if lexer:
+            lexer.close()
+    result.seconds = perf_counter() - start
+    return result
+
+
+def run_batch(
+    files: List[str],
+    workers: int = None,
+    mode: str = "parse",
+    scanner: str = "master",
+    token_cache_dir: str = None,
+    keep_tokens: bool = False,
+) -> List[FileResult]:
+    """
+    check_file every file in a pool of workers processes (default: one per CPU), results are in the order of files
+    With one worker (or one file) files are checked in this process, no pool is started
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {repr(mode)}, expected one of {MODES}")
+    workers = min(workers or cpu_count() or 1, len(files)) or 1
+    arguments = (mode, scanner, token_cache_dir, keep_tokens)
+    if workers == 1:
+        return [check_file(file_path, *arguments) for file_path in files]
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        # Many small files are sent to workers in chunks, so each file does not cost a round trip
+        chunksize = max(1, len(files) // (workers * 4))
+        return list(pool.map(
+            check_file,
+            files,
+            *([argument] * len(files) for argument in arguments),
+            chunksize = chunksize
+        ))
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    from token_cache import DEFAULT_TOKEN_CACHE_DIR
+
+    parser = ArgumentParser(description = "Lex/parse many source files in parallel")
+
+    parser.add_argument("paths", nargs="+", help=f"Source files, or directories searched for *{SOURCE_SUFFIX} files")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--lex-only", action="store_true", help="Only find tokens, do not parse")
+    parser.add_argument("--scanner", choices=SCANNERS, default="master", help="Scanner used to find tokens")
+    parser.add_argument("--suffix", default=SOURCE_SUFFIX, help=f"Suffix of source files in directories (default {SOURCE_SUFFIX})")
+    parser.add_argument(
+        "--token-cache",
+        nargs="?",
+        const=DEFAULT_TOKEN_CACHE_DIR,
+        metavar="DIR",
+        help=f"Reuse tokens of sources scanned before, cached in DIR (default {DEFAULT_TOKEN_CACHE_DIR})"
+    )
+
+    args = parser.parse_args()
+
+    if args.workers is not None and args.workers < 1:
+        print("--workers must be at least 1", file = stderr)
+        exit(1)
+
+    files = collect_files(args.paths, args.suffix)
+    start = perf_counter()
+    results = run_batch(
+        files,
+        workers = args.workers,
+        mode = "lex" if args.lex_only else "parse",
+        scanner = args.scanner,
+        token_cache_dir = args.token_cache,
+    )
+    seconds = perf_counter() - start
+
+    failed = [result for result in results if not result.ok]
+    errors = sum(len(result.errors) for result in results)
+    for result in failed:
+        for error in result.errors:
+            print(error, file = stderr)
+            print(file = stderr)
+
+    tokens = sum(result.tokens for result in results)
+    statements = sum(result.statements for result in results)
+    summary = f"{len(results)} files, {len(failed)} failed ({errors} errors), {tokens} tokens"
+    if not args.lex_only:
+        summary += f", {statements} statements"
+    print(summary + f" in {seconds:.3f}s")
+    exit(1 if failed else 0)
@@ -0,0 +1,283 @@
+#!/usr/local/bin/python3.10
+
+import operator
+from typing import List, Dict, Tuple, Callable
+from lexer import Token
+from parser import *
+import runtime
+
+####################################################################################################
+
+# Constant folding: AST pass run on each parsed module before it's compiled (by compiler.Compiler, once names
+# imported from other modules are known, so constants of imported modules are folded too)
+# Expressions whose value is known at compile time become Constant_Expressions, computed once here instead of
+# each time they run:
+#   - literals of every kind (all number bases, with _ separators, strings and chars)
+#   - unary, arithmetic, bitwise, comparison and logical operators of constant operands
+#   - names of constants (define name: const type := value) defined before, or imported
+#   - items of constant arrays at constant indices
+# Initial values of constants must be constant expressions (or array/struct literals of them), anything else
+# (calls, variables, references) is an error
+# Operators compute what they compute at run time (runtime.py), an operation that would fail (like 1 / 0) is not
+# folded, so it still fails when it runs (unless it's the value of a constant, then it's an error here)
+# Names that are assigned or referenced (assignment targets, ref_of operands) are never replaced
+
+
+# Binary operator => operation, as the VM and transpiled code compute it
+BINARY_OPERATIONS = {
+    "+": operator.add, "-": operator.sub, "*": operator.mul, "/": runtime.int_divide,
+    "&": operator.and_, "|": operator.or_, "^": operator.xor, "<<": operator.lshift, ">>": operator.rshift,
+    "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge, "==": operator.eq, "!=": operator.ne,
+    "and": lambda a, b: bool(a and b), "or": lambda a, b: bool(a or b),
+}
+
+UNARY_OPERATIONS = {"-": operator.neg, "+": operator.pos, "~": operator.invert, "not": operator.not_}
+
+# Results bigger than this (characters of strings, bits of ints) are left to run time, not stored in code
+MAX_FOLDED_SIZE = 4096
+
+# Value of an expression that's not constant
+NOT_CONSTANT = object()
+
+
+class ConstantArray(tuple):
+    """
+    Value of a constant array, items are values (constant arrays for arrays of many dimensions)
+    """
+
+
+# Value of a constant that's not folded: struct literals of constants, arrays whose items are converted at run time
+OPAQUE = object()
+
+# Item type => conversion of items of arrays of that type (runtime.ARRAY_TYPECODES), None if they can't be converted
+ITEM_CONVERSIONS = {
+    "int": lambda item: int(item) if type(item) in (int, bool) else None,
+    "float": lambda item: float(item) if type(item) in (int, bool, float) else None,
+}
+
+
+def array_value(value: ConstantArray, array_type: Type):
+    """
+    Value of constant array value once it's stored in a variable of array_type (see runtime.array_converter)
+    """
+    if not array_type.sizes or array_type.element.sizes or array_type.element.reference:
+        return value
+    convert = ITEM_CONVERSIONS.get(array_type.element.base.value)
+    if convert is None:
+        return value
+    def converted(items: ConstantArray, dimensions: int):
+        if dimensions > 1:
+            items = [converted(item, dimensions - 1) if isinstance(item, ConstantArray) else OPAQUE for item in items]
+        else:
+            items = [convert(item) for item in items]
+        return OPAQUE if any(item is None or item is OPAQUE for item in items) else ConstantArray(items)
+    return converted(value, len(array_type.sizes))
+
+
+def too_big(value) -> bool:
+    if isinstance(value, str):
+        return len(value) > MAX_FOLDED_SIZE
+    return type(value) is int and value.bit_length() > MAX_FOLDED_SIZE
+
+
+class ConstantFolder:
+    def __init__(self, statements: List[Statement], fail: Callable[[Token, str], None], imported: Dict[str, object] = None):
+        """
+        statements: of a module, folded in place
+        fail(tok, message): reports an error about tok
+        imported: name => value of constants imported from other modules
+        """
+        self.statements = statements
+        self.fail = fail
+        # Innermost last, name => value of constant, NOT_CONSTANT for other variables (they hide constants)
+        # Names defined at top level of module hide imported ones everywhere, even before they're defined
+        top_level_names = {}
+        for statement in statements:
+            if statement.kind == NodeKind.DEFINE_STATEMENT:
+                top_level_names[statement.variable.value] = NOT_CONSTANT
+            elif statement.kind == NodeKind.FUNCTION_STATEMENT:
+                top_level_names[statement.function.value] = NOT_CONSTANT
+            elif statement.kind == NodeKind.STRUCT_STATEMENT:
+                top_level_names[statement.struct.value] = NOT_CONSTANT
+        self.scopes: List[Dict[str, object]] = [dict(imported or {}), top_level_names]
+        self.failures: List[Tuple[Token, str]] = [] # Operations of constants failing here
+
+
+    def fold(self) -> Dict[str, object]:
+        """
+        Fold top level code in order (constants are known from their definitions on), then functions, which
+        see every constant of the module
+        Returns name => value of constants defined at top level
+        """
+        for statement in self.statements:
+            if statement.kind != NodeKind.FUNCTION_STATEMENT:
+                self.statement(statement, top_level = True)
+        for statement in self.statements:
+            if statement.kind == NodeKind.FUNCTION_STATEMENT:
+                self.scopes.append({parameter.identifier.value: NOT_CONSTANT for parameter in statement.parameters})
+                statement.body = self.block(statement.body, open_scope = False)
+                self.scopes.pop()
+        return {name: value for name, value in self.scopes[1].items() if value is not NOT_CONSTANT}
+
+
+    def lookup(self, name: str):
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        return NOT_CONSTANT
+
+
+    # Expressions
+
+    def expression(self, expression: Expression) -> Tuple[Expression, object]:
+        """
+        (folded expression, its value or NOT_CONSTANT)
+        Only values of constant arrays/structs are kept as values without being folded
+        """
+        kind = expression.kind
+        if kind == NodeKind.LITERAL:
+            value = expression.value
+            return (Constant_Expression(expression.first, expression.last, expression.token, value), value)
+        if kind == NodeKind.CONSTANT:
+            return (expression, expression.value)
+        if kind == NodeKind.NAME:
+            value = self.lookup(expression.token.value)
+            return (self.constant(expression, value), value)
+        if kind == NodeKind.BINARY:
+            tok = expression.token
+            if tok.kind & ~KIND_INDEX_MASK == TokenKind.ASSIGNMENT:
+                expression.left = self.target(expression.left)
+                expression.right, _ = self.expression(expression.right)
+                return (expression, NOT_CONSTANT)
+            expression.left, left = self.expression(expression.left)
+            expression.right, right = self.expression(expression.right)
+            return self.operation(expression, BINARY_OPERATIONS.get(tok.value), left, right)
+        if kind == NodeKind.UNARY:
+            tok = expression.token
+            if tok.value in UNARY_OPERATIONS:
+                expression.operand, operand = self.expression(expression.operand)
+                return self.operation(expression, UNARY_OPERATIONS[tok.value], operand)
+            expression.operand = self.target(expression.operand) # ref_of / ++ / --
+            return (expression, NOT_CONSTANT)
+        if kind == NodeKind.ARRAY_SUBSCRIPTION:
+            expression.array, array = self.expression(expression.array)
+            expression.index, index = self.expression(expression.index)
+            if isinstance(array, ConstantArray) and type(index) is int and 0 <= index < len(array):
+                return (self.constant(expression, array[index]), array[index])
+            return (expression, NOT_CONSTANT)
+        if kind == NodeKind.ARRAY:
+            items = [self.expression(item) for item in expression.items]
+            expression.items = tuple(item for item, _ in items)
+            if any(value is NOT_CONSTANT for _, value in items):
+                return (expression, NOT_CONSTANT)
+            return (expression, ConstantArray(value for _, value in items))
+        if kind == NodeKind.STRUCT:
+            values = [self.expression(value) for value in expression.values]
+            expression.values = tuple(value for value, _ in values)
+            if any(value is NOT_CONSTANT for _, value in values):
+                return (expression, NOT_CONSTANT)
+            return (expression, OPAQUE)
+        if kind == NodeKind.STRUCT_MEMBERSHIP_ACCESS:
+            expression.struct, _ = self.expression(expression.struct)
+        elif kind == NodeKind.FUNCTION_CALL:
+            expression.arguments = tuple(self.expression(argument)[0] for argument in expression.arguments)
+        return (expression, NOT_CONSTANT)
+
+
+    def constant(self, expression: Expression, value) -> Expression:
+        """
+        Constant_Expression of value for expression, expression itself if value can't be folded into one
+        """
+        if value is NOT_CONSTANT or value is OPAQUE or isinstance(value, ConstantArray):
+            return expression
+        return Constant_Expression(expression.first, expression.last, first_token(expression), value)
+
+
+    def operation(self, expression: Expression, operation: Callable, *operands) -> Tuple[Expression, object]:
+        """
+        Fold expression applying operation to operands, if they're all constants and it does not fail
+        """
+        if operation is None or any(operand is NOT_CONSTANT or operand is OPAQUE or isinstance(operand, ConstantArray) for operand in operands):
+            return (expression, NOT_CONSTANT)
+        if expression.token.value == "<<" and type(operands[1]) is int and operands[1] > MAX_FOLDED_SIZE:
+            return (expression, NOT_CONSTANT)
+        if expression.token.value == "*" and any(isinstance(operand, str) for operand in operands):
+            if any(type(operand) is int and operand > MAX_FOLDED_SIZE for operand in operands):
+                return (expression, NOT_CONSTANT)
+        try:
+            value = operation(*operands)
+        except Exception as error:
+            self.failures.append((expression.token, runtime.error_message(error)))
+            return (expression, NOT_CONSTANT) # Fails when it runs
+        if too_big(value):
+            return (expression, NOT_CONSTANT)
+        return (self.constant(expression, value), value)
+
+
+    def target(self, expression: Expression) -> Expression:
+        """
+        Assignment target or referenced expression: its root name is kept, indices are folded
+        """
+        if isinstance(expression, Membership_Access_Expression):
+            expression.struct = self.target(expression.struct)
+        elif isinstance(expression, Array_Subscription_Expression):
+            expression.array = self.target(expression.array)
+            expression.index, _ = self.expression(expression.index)
+        elif not isinstance(expression, Name_Expression):
+            expression, _ = self.expression(expression)
+        return expression
+
+
+    # Statements
+
+    def block(self, block: Block, open_scope: bool = True) -> Block:
+        if open_scope:
+            self.scopes.append({})
+        for statement in block:
+            self.statement(statement)
+        if open_scope:
+            self.scopes.pop()
+        return block
+
+
+    def statement(self, statement: Statement, top_level: bool = False):
+        kind = statement.kind
+        if kind == NodeKind.EXPRESSION_STATEMENT:
+            statement.expression, _ = self.expression(statement.expression)
+        elif kind == NodeKind.DEFINE_STATEMENT:
+            self.define(statement)
+        elif kind == NodeKind.RETURN_STATEMENT:
+            if statement.value is not None:
+                statement.value, _ = self.expression(statement.value)
+        elif kind == NodeKind.IF_STATEMENT:
+            statement.conditions = tuple(self.expression(condition)[0] for condition in statement.conditions)
+            statement.blocks = tuple(self.block(block) for block in statement.blocks)
+            if statement.else_block is not None:
+                self.block(statement.else_block)
+        elif kind == NodeKind.WHILE_STATEMENT:
+            statement.condition, _ = self.expression(statement.condition)
+            self.block(statement.body)
+        elif kind == NodeKind.FOR_STATEMENT:
+            statement.iterable, _ = self.expression(statement.iterable)
+            self.scopes.append({statement.variable.value: NOT_CONSTANT})
+            self.block(statement.body)
+            self.scopes.pop()
+        elif kind == NodeKind.FUNCTION_STATEMENT and not top_level:
+            self.block(statement.body) # Not allowed here, the compiler says so, but its constants are folded too
+
+
+    def define(self, statement: Simple_Statement_Define):
+        name = statement.variable
+        value = NOT_CONSTANT
+        if statement.value is not None:
+            failures = len(self.failures)
+            statement.value, value = self.expression(statement.value)
+            if statement.type.constant and (value is NOT_CONSTANT or statement.type.reference):
+                if len(self.failures) > failures:
+                    self.fail(*self.failures[failures])
+                else:
+                    self.fail(first_token(statement.value), f"Value of constant {name.value} must be known at compile time")
+                value = NOT_CONSTANT
+            elif isinstance(value, ConstantArray):
+                value = array_value(value, statement.type)
+        self.scopes[-1][name.value] = value if statement.type.constant else NOT_CONSTANT
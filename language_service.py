@@ -0,0 +1,373 @@
+#!/usr/local/bin/python3.10
+
+import asyncio
+import json
+import threading
+from typing import List, Dict, Tuple, Iterable
+from dataclasses import dataclass, field, asdict
+from concurrent.futures import ThreadPoolExecutor
+from os import path, unlink
+from sys import stdin, stdout, stderr
+from const import *
+from lexer import Lexer, Token, SCANNERS
+from parser import Parser, NodeKind
+
+####################################################################################################
+
+# Language service: a long running process editors talk to, answering questions about open documents
+# Requests and responses are JSON objects, one per line, over stdio or a local (unix) socket:
+#     {"id": 1, "method": "open", "params": {"file": "main.as", "text": "..."}}
+#     {"id": 1, "result": {"version": 0}}                   or  {"id": 1, "error": "message"}
+# Methods (params):
+#   open (file, text)                   start tracking a document
+#   change (file, text)                 replace its whole text
+#   change (file, start, end, text)     replace text[start : end] (character indices) with text
+#   close (file)                        stop tracking it
+#   diagnostics (file)                  lexer/parser errors, see lexer.Diagnostic
+#   tokens (file)                       [begin_ln, begin_col, end_ln, end_col, kind name] of tokens to highlight
+#   outline (file)                      functions, structs and imports at top level
+#   shutdown                            stop the service
+# open/change/close are applied in the order they're received, questions are answered as soon as the document
+# they're about is analyzed (lexed and parsed) in its latest version, so answers may come in any order
+#
+# Each document keeps its incremental Lexer (see Lexer.apply_edit) between versions, so an edit is re-scanned only
+# around where it happened. Analysis runs in a worker thread, at most one at a time for each document:
+#   - it starts once edits stop coming for ANALYSIS_DELAY seconds, so typing never queues up analyses
+#   - a newer edit cancels an analysis still running, it stops at the next token it reads (see checked)
+
+
+# Seconds without edits before a document is analyzed
+ANALYSIS_DELAY = 0.05
+
+# Longest request line, whole texts of documents are sent in one line
+MAX_REQUEST_SIZE = 1 << 30
+
+# Tokens read between checks for cancellation
+CANCEL_CHECK_INTERVAL = 256
+
+# Token kinds editors have nothing to highlight for
+UNHIGHLIGHTED_KINDS = TokenKind.LINE_BREAK | TokenKind.INDENT | TokenKind.OUTDENT | TokenKind.EOF
+
+
+class Cancelled(Exception):
+    """
+    Raised in a worker thread when the analysis it runs is cancelled, see checked
+    """
+
+
+class RequestError(Exception):
+    """
+    A request that can't be answered, its message is sent back as the response error
+    """
+
+
+@dataclass
+class Analysis:
+    """
+    What's known about one version of a document, ready to be sent as JSON
+    """
+    version: int
+    diagnostics: List[dict] = field(default_factory = list)
+    tokens: List[Tuple[int, int, int, int, str]] = field(default_factory = list)
+    outline: List[dict] = field(default_factory = list)
+
+
+class Document:
+    def __init__(self, file: str, text: str, scanner: str = "master"):
+        self.file = file
+        self.text = text
+        self.scanner = scanner
+        self.version = 0
+        # Edits applied to text but not to lexer yet, as (start, end, new text)
+        self.edits: List[Tuple[int, int, str]] = []
+        # Lexer of the last analyzed text, None until a full scan finishes
+        # Only analysis jobs touch it, one at a time
+        self.lexer: Lexer = None
+        self.analysis: Analysis = None # Of the latest version analyzed
+        self.task: asyncio.Task = None # Analysis of the latest version
+
+
+    def edit(self, start: int, end: int, text: str):
+        if not 0 <= start <= end <= len(self.text):
+            raise RequestError(f"Edit {start}-{end} outside document (0-{len(self.text)})")
+        self.text = self.text[ : start] + text + self.text[end : ]
+        self.edits.append((start, end, text))
+        self.version += 1
+
+
+def checked(tokens: Iterable[Token], cancelled: threading.Event):
+    """
+    Yield tokens, raising Cancelled once cancelled is set
+    """
+    for i, tok in enumerate(tokens):
+        if not i % CANCEL_CHECK_INTERVAL and cancelled.is_set():
+            raise Cancelled
+        yield tok
+
+
+def outline(statements, tokens) -> List[dict]:
+    """
+    Functions, structs and imports among statements (top level of a document)
+    """
+    items = []
+    for statement in statements:
+        if statement.kind == NodeKind.FUNCTION_STATEMENT:
+            kind, name = "function", statement.function.value
+        elif statement.kind == NodeKind.STRUCT_STATEMENT:
+            kind, name = "struct", statement.struct.value
+        elif statement.kind == NodeKind.IMPORT_STATEMENT:
+            kind, name = "import", statement.file_path
+        else:
+            continue
+        first, last = tokens[statement.first], tokens[statement.last]
+        items.append({
+            "kind": kind,
+            "name": name,
+            "line": first.begin_ln,
+            "col": first.begin_col,
+            "end_line": last.end_ln,
+            "end_col": last.end_col,
+        })
+        if kind == "import":
+            items[-1]["items"] = [item.value for item in statement.items]
+    return items
+
+
+def analyze(document: Document, text: str, edits: List[Tuple[int, int, str]], version: int, cancelled: threading.Event) -> Analysis:
+    """
+    Lex and parse version of document (its text), raises Cancelled when cancelled is set before it's done
+    Edits since the last analysis are applied to the document's lexer, it's scanned from scratch if it has none
+    Runs in worker threads, never two at a time for the same document
+    """
+    lexer, document.lexer = document.lexer, None # Back once it's in step with text
+    if lexer is not None:
+        for start, end, new_text in edits:
+            lexer.apply_edit(start, end, new_text)
+        if lexer.source != (text if text.endswith("\n") else text + "\n"):
+            lexer = None # Line break added at end of source by the lexer was edited, start over
+    if lexer is None:
+        lexer = Lexer(document.file, text, scanner = document.scanner, incremental = True, exit_on_error = False, collect_errors = True)
+        for tok in checked(lexer.scan_tokens(), cancelled):
+            lexer.tokens.append(tok)
+    document.lexer = lexer
+
+    # Parser errors go to lexer's diagnostics, they're taken back out so the lexer keeps only its own
+    lexer_diagnostics = list(lexer.diagnostics)
+    try:
+        parser = Parser(lexer_object = lexer, echo = False)
+        parser.token_stream = checked(parser.token_stream, cancelled)
+        parser.parse()
+        diagnostics = [asdict(diagnostic) for diagnostic in lexer.diagnostics]
+    finally:
+        lexer.diagnostics[:] = lexer_diagnostics
+
+    if cancelled.is_set():
+        raise Cancelled
+    return Analysis(
+        version = version,
+        diagnostics = diagnostics,
+        tokens = [
+            (tok.begin_ln, tok.begin_col, tok.end_ln, tok.end_col, kind_name(tok.kind))
+            for tok in lexer.tokens if not tok.kind & UNHIGHLIGHTED_KINDS
+        ],
+        outline = outline(parser.statements, lexer.tokens),
+    )
+
+
+class LanguageService:
+    def __init__(self, scanner: str = "master", workers: int = 1, delay: float = ANALYSIS_DELAY):
+        self.scanner = scanner
+        self.delay = delay
+        self.executor = ThreadPoolExecutor(max_workers = workers)
+        self.documents: Dict[str, Document] = {}
+        self.stopped = asyncio.Event()
+
+
+    def schedule(self, document: Document):
+        """
+        Analyze latest version of document, cancelling analysis of the version before
+        """
+        previous = document.task
+        if previous:
+            previous.cancel()
+        document.task = asyncio.ensure_future(self.run_analysis(document, previous))
+
+
+    async def run_analysis(self, document: Document, previous: asyncio.Task):
+        await asyncio.sleep(self.delay) # Edits coming faster than this cancel it here, before it costs anything
+        if previous:
+            await asyncio.wait([previous]) # Cancelled, its worker thread stops at the next token
+        edits, document.edits = document.edits, []
+        cancelled = threading.Event()
+        job = asyncio.get_running_loop().run_in_executor(
+            self.executor, analyze, document, document.text, edits, document.version, cancelled
+        )
+        try:
+            document.analysis = await asyncio.shield(job)
+        except asyncio.CancelledError:
+            cancelled.set()
+            # Next analysis waits for this one, so the lexer of document is never used by two threads
+            await asyncio.wait([job])
+            if not job.cancelled():
+                job.exception() # Nobody else waits for it
+            raise
+
+
+    async def current_analysis(self, document: Document) -> Analysis:
+        """
+        Analysis of latest version of document, waiting for it if needed
+        """
+        while document.analysis is None or document.analysis.version != document.version:
+            if self.documents.get(document.file) is not document:
+                raise RequestError(f"Document {document.file!r} was closed")
+            task = document.task
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise # This request was cancelled, not the analysis
+            except Cancelled:
+                pass # Cancelled in its worker thread, a newer analysis is scheduled
+        return document.analysis
+
+
+    def document(self, params: dict) -> Document:
+        file = params.get("file")
+        if file not in self.documents:
+            raise RequestError(f"Document {file!r} is not open")
+        return self.documents[file]
+
+
+    async def handle(self, method: str, params: dict):
+        """
+        Result of a request
+        """
+        if method == "open":
+            file, text = params.get("file"), params.get("text")
+            if not isinstance(file, str) or not isinstance(text, str):
+                raise RequestError("open needs a file and a text")
+            if file in self.documents and self.documents[file].task:
+                self.documents[file].task.cancel()
+            document = self.documents[file] = Document(file, text, self.scanner)
+            self.schedule(document)
+            return {"version": document.version}
+        if method == "change":
+            document = self.document(params)
+            text = params.get("text")
+            if not isinstance(text, str):
+                raise RequestError("change needs a text")
+            start, end = params.get("start", 0), params.get("end", len(document.text))
+            if type(start) is not int or type(end) is not int:
+                raise RequestError("start and end must be character indices")
+            document.edit(start, end, text)
+            self.schedule(document)
+            return {"version": document.version}
+        if method == "close":
+            document = self.documents.pop(self.document(params).file)
+            if document.task:
+                document.task.cancel()
+            return None
+        if method in ("diagnostics", "tokens", "outline"):
+            analysis = await self.current_analysis(self.document(params))
+            return {"version": analysis.version, method: getattr(analysis, method)}
+        if method == "shutdown":
+            self.stopped.set()
+            return None
+        raise RequestError(f"Unknown method {method!r}")
+
+
+    async def answer(self, request_id, method: str, params: dict, writer: asyncio.StreamWriter):
+        try:
+            response = {"id": request_id, "result": await self.handle(method, params)}
+        except RequestError as error:
+            response = {"id": request_id, "error": str(error)}
+        except Exception as error:
+            response = {"id": request_id, "error": f"{type(error).__name__}: {error}"}
+        writer.write(json.dumps(response).encode() + b"\n")
+        await writer.drain()
+
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Answer requests read from reader until it's closed or the service is shut down
+        """
+        answers = set()
+        while not self.stopped.is_set():
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                request_id, method, params = request.get("id"), request["method"], request.get("params") or {}
+            except (ValueError, KeyError, AttributeError, TypeError):
+                writer.write(json.dumps({"id": None, "error": "Expected a JSON object with a method"}).encode() + b"\n")
+                continue
+            answer = self.answer(request_id, method, params, writer)
+            if method in ("open", "change", "close", "shutdown"):
+                await answer # Applied in order
+            else:
+                task = asyncio.ensure_future(answer)
+                answers.add(task)
+                task.add_done_callback(answers.discard)
+        # Every request read gets its answer, even after shutdown or the end of requests
+        await asyncio.gather(*answers, return_exceptions = True)
+        writer.close()
+
+
+    def close(self):
+        for document in self.documents.values():
+            if document.task:
+                document.task.cancel()
+        self.executor.shutdown(wait = False, cancel_futures = True)
+
+
+async def serve_stdio(service: LanguageService):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit = MAX_REQUEST_SIZE)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), stdin)
+    transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, stdout)
+    writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+    await service.serve(reader, writer)
+
+
+async def serve_socket(service: LanguageService, socket_path: str):
+    if path.exists(socket_path):
+        unlink(socket_path)
+    server = await asyncio.start_unix_server(service.serve, path = socket_path, limit = MAX_REQUEST_SIZE)
+    async with server:
+        await service.stopped.wait()
+    unlink(socket_path)
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+
+    parser.add_argument("--socket", metavar="PATH", help="Listen on a unix socket at PATH instead of stdio")
+    parser.add_argument("--scanner", choices=SCANNERS, default="master", help="Scanner used to find tokens")
+    parser.add_argument("--workers", type=int, default=1, help="Worker threads analyzing documents (default 1)")
+    parser.add_argument(
+        "--delay",
+        type=float,
+        default=ANALYSIS_DELAY,
+        help=f"Seconds without edits before a document is analyzed (default {ANALYSIS_DELAY})"
+    )
+
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        print("--workers must be at least 1", file = stderr)
+        exit(1)
+
+    async def main():
+        service = LanguageService(scanner = args.scanner, workers = args.workers, delay = args.delay)
+        try:
+            if args.socket:
+                await serve_socket(service, args.socket)
+            else:
+                await serve_stdio(service)
+        finally:
+            service.close()
+
+    asyncio.run(main())
@@ -1,8 +1,12 @@
 #!/usr/local/bin/python3.10
 
 import re
-from typing import Tuple, List, Dict
+from typing import Tuple, List
 from dataclasses import dataclass
+from array import array
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+from bisect import bisect_left, bisect_right
 from const import *
 from os import path
 from sys import stderr
@@ -12,6 +16,12 @@ from sys import stderr
 # Tokenizer (aka Lexer): takes texts and turns it into "words" (tokens)
 
 
+SCANNERS = ("master", "classic")
+
+# Smallest chunk of a source lexed by a worker process, smaller sources are lexed in one go, see Lexer.scan_chunks
+PARALLEL_CHUNK_SIZE = 1 << 16
+
+
 @dataclass(init=True, repr=True)
 class Line:
     value: str = "" # Actual text excluding \n (line breaks)
@@ -22,7 +32,7 @@ class Line:
 
 @dataclass(init=True, repr=True, eq=True)
 class Token:
-    name: str = ""
+    kind: int = 0 # TokenKind (const.py), name is only for display
     value: str = ""
 
     begin_idx: int = 0
@@ -34,6 +44,10 @@ class Token:
     begin_ln: int = 0
     end_ln: int = 0
 
+    @property
+    def name(self) -> str:
+        return kind_name(self.kind)
+
     def __repr__(self):
         self_idx = f"{self.begin_idx}-{self.end_idx}"
         self_col = f"{self.begin_col}-{self.end_col}"
@@ -43,31 +57,403 @@ class Token:
     __str__ = __repr__
 
 
+class MappedSource:
+    """
+    Source file mapped into memory with mmap instead of read into a str
+    Every byte reads as one character (latin-1), so indices/columns are byte offsets and str patterns work on its lines
+    Token values are decoded as UTF-8 only after they're found (Lexer.decode / MappedSource.text)
+    Mapped files can't grow, so a missing final line break is provided virtually
+    """
+    def __init__(self, file_path: str):
+        with open(file_path, "rb") as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+        self.size = len(self.buffer)
+        self.virtual_line_break = self.buffer[-1:] != b"\n"
+
+    def __len__(self):
+        return self.size + self.virtual_line_break
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            begin, end, _ = index.indices(len(self))
+            text = self.buffer[begin : min(end, self.size)].decode("latin-1")
+            if end > self.size and begin <= self.size:
+                text += "\n"
+            return text
+        if index == self.size and self.virtual_line_break:
+            return "\n"
+        return chr(self.buffer[index])
+
+    def text(self, begin: int, end: int) -> str:
+        """
+        Actual (UTF-8 decoded) text between begin and end
+        """
+        text = self.buffer[begin : min(end, self.size)].decode("utf-8", errors = "replace")
+        if end > self.size and begin <= self.size:
+            text += "\n"
+        return text
+
+    def find(self, sub: str, start: int = 0) -> int:
+        return self.buffer.find(sub.encode("latin-1"), start)
+
+    def close(self):
+        self.buffer.close()
+
+
+class LineIndex:
+    """
+    Lines of a source kept as offsets, begins[ln] is index of first character of line ln
+    Offsets are found lazily, only as far as somebody asks for,
+    and a Line object (with a copy of line's text) is only built when asked for
+    Reads like a Dict[int, Line]: lines[ln], lines.get(ln), len(lines)
+    """
+    def __init__(self, source):
+        self.source = source # str or MappedSource, ends with a line break
+        self.begins = array("q", [0])
+        self.complete = False # True when offsets of all lines are known
+
+    def find_lines(self, ln: int = None, idx: int = None):
+        """
+        Find line offsets until line ln, or line containing index idx, is known, or all lines if neither is given
+        """
+        while not self.complete and (
+            (ln is None and idx is None) or
+            (ln is not None and len(self.begins) <= ln) or
+            (idx is not None and self.begins[-1] <= idx)
+        ):
+            line_break = self.source.find("\n", self.begins[-1])
+            if line_break == -1 or line_break + 1 >= len(self.source):
+                self.complete = True
+            else:
+                self.begins.append(line_break + 1)
+
+    def __len__(self):
+        self.find_lines()
+        return len(self.begins)
+
+    def __getitem__(self, ln: int) -> Line:
+        self.find_lines(ln = ln + 1) # Next line begins where this one ends
+        if not 0 <= ln < len(self.begins):
+            raise KeyError(ln)
+        begin = self.begins[ln]
+        end = self.begins[ln + 1] if ln + 1 < len(self.begins) else len(self.source)
+        return Line(value = self.source[begin : end], begin = begin, end = end)
+
+    def get(self, ln: int, default = None) -> Line:
+        try:
+            return self[ln]
+        except KeyError:
+            return default
+
+    def position(self, idx: int) -> Tuple[int, int]:
+        """
+        (line, column) of index idx, O(log n)
+        """
+        self.find_lines(idx = idx)
+        ln = bisect_right(self.begins, idx) - 1
+        return ln, idx - self.begins[ln]
+
+
+class TokenView:
+    """
+    Lightweight read-only view of one token inside a TokenStore, reads like a Token (.kind, .name, .value, .begin_idx, ...)
+    """
+    __slots__ = ("store", "index")
+
+    def __init__(self, store: "TokenStore", index: int):
+        self.store = store
+        self.index = index
+
+    kind      = property(lambda self: self.store.kinds[self.index])
+    name      = property(lambda self: kind_name(self.store.kinds[self.index]))
+    value     = property(lambda self: self.store.text(self.store.begin_idx[self.index], self.store.end_idx[self.index]))
+    begin_idx = property(lambda self: self.store.begin_idx[self.index])
+    end_idx   = property(lambda self: self.store.end_idx[self.index])
+    begin_col = property(lambda self: self.store.begin_col[self.index])
+    end_col   = property(lambda self: self.store.end_col[self.index])
+    begin_ln  = property(lambda self: self.store.begin_ln[self.index])
+    end_ln    = property(lambda self: self.store.end_ln[self.index])
+
+    def to_token(self) -> Token:
+        return Token(
+            kind      = self.kind,
+            value     = self.value,
+            begin_idx = self.begin_idx,
+            end_idx   = self.end_idx,
+            begin_col = self.begin_col,
+            end_col   = self.end_col,
+            begin_ln  = self.begin_ln,
+            end_ln    = self.end_ln
+        )
+
+    def __eq__(self, other):
+        if isinstance(other, TokenView):
+            other = other.to_token()
+        return self.to_token() == other
+
+    __repr__ = __str__ = Token.__repr__
+
+
+class TokenStore:
+    """
+    Compact token storage: one array('i') column per Token attribute instead of one Token object per token
+    Token values are not stored, they're recovered as slices of the source they were found in
+    Supports the list operations the lexer and parser use (append, extend, len, indexing, iteration)
+    indexing gives TokenView objects built on demand
+    """
+    COLUMNS = ("kinds", "begin_idx", "end_idx", "begin_col", "end_col", "begin_ln", "end_ln")
+
+    def __init__(self, source: str):
+        self.source: str = source
+        for column in TokenStore.COLUMNS:
+            setattr(self, column, array("i"))
+
+    def append(self, tok: Token):
+        self.kinds.append(tok.kind)
+        self.begin_idx.append(tok.begin_idx)
+        self.end_idx.append(tok.end_idx)
+        self.begin_col.append(tok.begin_col)
+        self.end_col.append(tok.end_col)
+        self.begin_ln.append(tok.begin_ln)
+        self.end_ln.append(tok.end_ln)
+
+    def extend(self, tokens):
+        for tok in tokens:
+            self.append(tok)
+
+    def text(self, begin: int, end: int) -> str:
+        if isinstance(self.source, MappedSource):
+            return self.source.text(begin, end)
+        return self.source[begin : end]
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [TokenView(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("token index out of range")
+        return TokenView(self, index)
+
+    def __setitem__(self, index: slice, tokens: List[Token]):
+        """
+        Replace a range of tokens, like list slice assignment
+        """
+        replacement = TokenStore(self.source)
+        replacement.extend(tokens)
+        for column in TokenStore.COLUMNS:
+            getattr(self, column)[index] = getattr(replacement, column)
+
+    def shift(self, start: int, delta_idx: int, delta_ln: int):
+        """
+        Move tokens from index start onwards by delta_idx characters and delta_ln lines
+        """
+        for column, delta in (
+            ("begin_idx", delta_idx), ("end_idx", delta_idx), ("begin_ln", delta_ln), ("end_ln", delta_ln)
+        ):
+            if delta:
+                values = getattr(self, column)
+                values[start:] = array("i", (value + delta for value in values[start:]))
+        if delta_idx and len(self) and self.kinds[-1] == TokenKind.EOF:
+            # EOF columns are its line's end index
+            self.begin_col[-1] += delta_idx
+            self.end_col[-1] += delta_idx
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield TokenView(self, i)
+
+    def to_tokens(self):
+        """
+        Yield a full Token object for each token, faster than going through views
+        """
+        text = self.text
+        for kind, begin_idx, end_idx, begin_col, end_col, begin_ln, end_ln in zip(
+            self.kinds, self.begin_idx, self.end_idx, self.begin_col, self.end_col, self.begin_ln, self.end_ln
+        ):
+            yield Token(kind, text(begin_idx, end_idx), begin_idx, end_idx, begin_col, end_col, begin_ln, end_ln)
+
+    def __repr__(self):
+        return f"TokenStore({len(self)} tokens)"
+
+
+class Checkpoints:
+    """
+    Lexer state at safe restart points, line heads outside any parenthesis and any MULTI_LINED token
+    One entry per such line, in source order, kept in parallel arrays:
+        idx           => index of line head
+        ln            => line number
+        tokens        => how many tokens were generated before this line
+        indent_tokens => how many INDENT/OUTDENT tokens were generated before this line
+        indents       => indents_stack at this line head
+    """
+    def __init__(self):
+        self.idx = array("q")
+        self.ln = array("q")
+        self.tokens = array("q")
+        self.indent_tokens = array("q")
+        self.indents: List[Tuple[int, ...]] = []
+
+    def append(self, idx: int, ln: int, tokens: int, indent_tokens: int, indents: Tuple[int, ...]):
+        self.idx.append(idx)
+        self.ln.append(ln)
+        self.tokens.append(tokens)
+        self.indent_tokens.append(indent_tokens)
+        self.indents.append(indents)
+
+    def __len__(self):
+        return len(self.idx)
+
+    def __getitem__(self, k: int) -> Tuple[int, int, int, int, Tuple[int, ...]]:
+        return (self.idx[k], self.ln[k], self.tokens[k], self.indent_tokens[k], self.indents[k])
+
+    def last_before(self, idx: int) -> int:
+        """
+        Last checkpoint at or before index idx
+        """
+        return bisect_right(self.idx, idx) - 1
+
+    def find(self, idx: int) -> int:
+        """
+        Checkpoint at index idx, -1 if there's none
+        """
+        k = bisect_left(self.idx, idx)
+        return k if k < len(self.idx) and self.idx[k] == idx else -1
+
+    def prefix(self, k: int) -> "Checkpoints":
+        """
+        New Checkpoints with the first k checkpoints
+        """
+        checkpoints = Checkpoints()
+        checkpoints.idx = self.idx[:k]
+        checkpoints.ln = self.ln[:k]
+        checkpoints.tokens = self.tokens[:k]
+        checkpoints.indent_tokens = self.indent_tokens[:k]
+        checkpoints.indents = self.indents[:k]
+        return checkpoints
+
+    def extend_shifted(self, other: "Checkpoints", start: int, delta_idx: int, delta_ln: int, delta_tokens: int, delta_indent_tokens: int):
+        """
+        Append checkpoints of other from index start onwards, moved by the given deltas
+        """
+        self.idx.extend(value + delta_idx for value in other.idx[start:])
+        self.ln.extend(value + delta_ln for value in other.ln[start:])
+        self.tokens.extend(value + delta_tokens for value in other.tokens[start:])
+        self.indent_tokens.extend(value + delta_indent_tokens for value in other.indent_tokens[start:])
+        self.indents.extend(other.indents[start:])
+
+
+class SourceError(Exception):
+    """
+    A lexical/syntax error in a source, raised instead of exiting when exit_on_error is False
+    str(error) is the same report printed when exiting
+    """
+
+
+# First line of an error report: Syntax Error in "file", line 1, column 1:
+# followed by the message, indented with 4 spaces
+ERROR_REPORT_PATTERN = re.compile(
+    pattern = r'(?P<kind>[\w ]+?) in "(?P<file>.*)", line (?P<line>\d+), column (?P<col>\d+):\n {4}(?P<message>.*)'
+)
+QUOTED_LINE_PATTERN = re.compile(pattern = r"\d+ \| ") # Line of source quoted in a report, before the line itself
+
+
+def character_span(line: str, col: int, width: int) -> Tuple[int, int]:
+    """
+    (column, width) in characters of width bytes from column col (counted in bytes, from 0) of line
+    Columns of mapped sources count bytes (UTF-8), reports show them in characters
+    """
+    encoded = line.encode("utf-8")
+    begin = len(encoded[:col].decode("utf-8", errors = "ignore")) + max(col - len(encoded), 0)
+    end = len(encoded[:col + width].decode("utf-8", errors = "ignore")) + max(col + width - len(encoded), 0)
+    return begin, end - begin
+
+
+def decode_mapped(text: str) -> str:
+    """
+    Actual text of text read from a mapped source, text itself if it isn't such text (not UTF-8 once back to bytes)
+    """
+    try:
+        return text.encode("latin-1").decode("utf-8")
+    except UnicodeError:
+        return text
+
+
+@dataclass(init=True, repr=True)
+class Diagnostic:
+    """
+    An error found when the lexer collects errors instead of stopping at the first one, see Lexer.fail
+    """
+    kind: str = "" # Syntax Error, Indentation Error, File Error
+    file: str = ""
+    line: int = 0 # Counted from 0 like Token.begin_ln, reports count from 1
+    col: int = 0
+    span: Tuple[int, int] = (0, 0) # (begin_idx, end_idx) of source text this error is about
+    message: str = "" # Short message, like "Un-terminated string"
+    report: str = "" # Full report, the same text printed when exiting
+
+    def __str__(self):
+        return self.report
+
+
 class Lexer:
-    def __init__(self, file_name : str, text: str):
+    def __init__(
+        self,
+        file_name : str,
+        text: str = None,
+        scanner: str = "master",
+        compact: bool = False,
+        incremental: bool = False,
+        token_cache = None,
+        exit_on_error: bool = True,
+        collect_errors: bool = False,
+        workers: int = 1,
+    ):
+        """
+        When text is None, file (file_name) is mapped into memory and scanned in place, see MappedSource
+        When incremental is True, the lexer remembers safe restart points so apply_edit can re-scan only what changed
+        When token_cache (a token_cache.TokenCache) is given, tokens of a source scanned before are loaded instead
+        (not for incremental lexers, they need their restart points)
+        When exit_on_error is False, errors raise SourceError instead of exiting, see fail
+        When collect_errors is True, errors never stop scanning, they're kept in self.diagnostics
+        and scanning goes on from the next line
+        When workers is more than 1, generate_tokens lexes chunks of a big source in that many processes, see scan_chunks
+        """
         self.file   : str = file_name
-        self.source : str = text
-        if not self.source.endswith("\n"):
-            self.source += "\n"
+        if text is None and path.getsize(file_name):
+            self.source : MappedSource = MappedSource(file_name)
+            self.mapped = True
+        else:
+            self.source : str = text or ""
+            self.mapped = False
+            if not self.source.endswith("\n"):
+                self.source += "\n"
 
         self.idx, self.ln, self.col = 0, 0, 0
 
-        self.tokens: list[Token] = [] # Stores all generated tokens
+        # Stores all generated tokens
+        # a TokenStore when compact is True, that's a few ints per token instead of a Token object
+        self.compact = compact
+        self.tokens: List[Token] = TokenStore(self.source) if compact else []
+        self.tokens_found = 0 # How many tokens were generated so far
 
         self.indents_stack: List[int] = []  # how many indents currently
         self.indents_tokens_stack: List[Token] = [] # stores all INDENT/OUTDENT tokens
 
+        # Match of LINE_HEAD_PATTERN at head of current line (indentation, first non-white-space), see scan_tokens
+        self.line_head: re.Match = None
+
         # True after checking indentation in current line, False only before checking indentation
         self.checked_indent_in_current_line = False
 
         # if self.source does not end with (\n), then add (\n)
         # this way we can guarantee there's at least one line in every input
         # so there's no way self.lines is empty, and so we can always get self.lines[0]
-        self.lines: Dict[int, Line] = {}
-        ln = 0
-        for line_match in re.finditer(pattern = r".*\n", string = self.source):
-            self.lines[ln] = Line(value = line_match.group(), begin = line_match.start(), end = line_match.end())
-            ln += 1
+        # Lines are found lazily while scanning and only kept as offsets, see LineIndex
+        self.lines: LineIndex = LineIndex(self.source)
 
         self.current_line_obj = self.lines[0] # self.lines is never empty, so self.current_line_obj always exists
 
@@ -77,6 +463,74 @@ class Lexer:
         # Store left parentheses, ( or [ or {, tokens to enable multi-lined statements
         self.left_parenthesis_stack: List[Token] = []
 
+        # Which scanner generates the next token
+        # "master" => generate_next_token_master (default, faster)
+        # "classic" => generate_next_token, the pattern-by-pattern reference scanner
+        if scanner not in SCANNERS:
+            raise ValueError(f"Unknown scanner {repr(scanner)}, expected one of {SCANNERS}")
+        self.scanner = scanner
+        self.next_token = self.generate_next_token_master if scanner == "master" else self.generate_next_token
+
+        # Incremental re-scanning, see apply_edit
+        self.incremental = incremental
+        self.checkpoints = Checkpoints() # Filled only when incremental is True
+        self.resync_with: Tuple[Checkpoints, int, int] = None # (old checkpoints, edit end, characters added) while re-scanning
+        self.synced = -1 # old checkpoint where re-scanning met old tokens, -1 if it did not
+
+        self.token_cache = token_cache if not incremental else None
+
+        self.exit_on_error = exit_on_error
+        self.collect_errors = collect_errors
+        self.diagnostics: List[Diagnostic] = [] # Errors found so far, only when collect_errors is True
+
+        self.workers = workers
+
+
+    def fail(self, error: str, span: Tuple[int, int] = None):
+        """
+        Report error then exit, or raise it as SourceError when exit_on_error is False
+        When collect_errors is True, error is kept in self.diagnostics and fail returns, caller must resync
+        span is (begin_idx, end_idx) of source text error is about, current index if not given
+        """
+        error = self.decode_report(error)
+        if self.collect_errors:
+            span = span or (self.idx, self.idx)
+            if header := ERROR_REPORT_PATTERN.match(error):
+                kind, message = header["kind"], header["message"]
+                ln, col = int(header["line"]) - 1, int(header["col"]) - 1
+            else:
+                kind, message = "Error", error.partition("\n")[0]
+                ln, col = self.position(min(span[0], len(self.source) - 1))
+            self.diagnostics.append(
+                Diagnostic(
+                    kind    = kind,
+                    file    = self.file,
+                    line    = ln,
+                    col     = col,
+                    span    = span,
+                    message = message,
+                    report  = error,
+                )
+            )
+            return
+        if not self.exit_on_error:
+            raise SourceError(error)
+        print(error, file = stderr)
+        exit(1)
+
+
+    def skip_line(self):
+        """
+        Resync after an error: move to the line break of current line, so scanning goes on from the next line
+        Brackets opened in skipped text are forgotten, they would make the rest of the source one long line
+        """
+        self.left_parenthesis_stack = [
+            left for left in self.left_parenthesis_stack if left.begin_idx < self.current_line_obj.begin
+        ]
+        self.idx = self.current_line_obj.end - 1 # Line break of current line
+        self.col = len(self.current_line_obj.value) - 1
+        self.checked_indent_in_current_line = True
+
 
     def pos(self) -> str:
         """
@@ -87,6 +541,110 @@ class Lexer:
         return self.current_line_obj.value + " " * self.col + "^"
 
 
+    def line_text(self, ln: int) -> str:
+        """
+        Text of line ln (line break included), used in error messages
+        """
+        return self.decode(self.lines[ln].value)
+
+
+    def position(self, idx: int) -> Tuple[int, int]:
+        """
+        (line, column) of index idx in source
+        """
+        return self.lines.position(idx)
+
+
+    def decode(self, text: str) -> str:
+        """
+        Actual text of something read from a mapped source (where each byte is one character), text itself otherwise
+        """
+        if self.mapped and not text.isascii():
+            return text.encode("latin-1").decode("utf-8", errors = "replace")
+        return text
+
+
+    def width(self, text: str) -> int:
+        """
+        Columns actual text (a token value) takes in source: its UTF-8 bytes when mapped, like columns there
+        """
+        return len(text.encode("utf-8")) if self.mapped else len(text)
+
+
+    def decode_report(self, report: str) -> str:
+        """
+        Actual text of error report about a mapped source, column and ^ marks under its line counted in characters
+        (they are counted in bytes where the report was built, each byte of a mapped source being one character)
+        """
+        if not self.mapped or report.isascii():
+            return report
+        lines = report.split("\n")
+        line = "" # Line the report (or the part of it after its last header) is about, as it is in the mapped source
+        quoted = None # Line quoted above as it is in the mapped source, marks under it are under its bytes
+        for i, text in enumerate(lines):
+            if header := ERROR_REPORT_PATTERN.match("\n".join(lines[i : i + 2])):
+                ln = int(header["line"]) - 1
+                line = self.lines[ln].value.rstrip("\r\n") if ln < len(self.lines) else ""
+                col = character_span(self.decode(line), int(header["col"]) - 1, 0)[0]
+                lines[i] = text[:header.start("col")] + str(col + 1) + text[header.end("col"):]
+            elif quoted is not None and text.strip() and not text.strip(" ^~"):
+                decoded = self.decode(quoted)
+                marks = {}
+                for idx, mark in enumerate(text):
+                    if mark != " ":
+                        marks[quoted_col + character_span(decoded, idx - quoted_col, 0)[0]] = mark
+                lines[i] = "".join(marks.get(idx, " ") for idx in range(max(marks) + 1))
+            elif line and (quote := QUOTED_LINE_PATTERN.match(text)):
+                # Lexer quotes mapped text, parser quotes the line decoded already (line_text)
+                quoted_col = quote.end()
+                quoted = line if text[quoted_col:].rstrip("\r") == self.decode(line) else text[quoted_col:]
+                lines[i] = text[:quoted_col] + self.decode(quoted)
+                continue
+            else:
+                lines[i] = decode_mapped(text)
+            quoted = None
+        return "\n".join(lines)
+
+
+    def comment_end(self) -> int:
+        """
+        Index after the ## closing the MULTI_LINED_COMMENT opened by ## at self.idx, -1 if there's none
+        """
+        if self.source[self.idx + 1] != "#":
+            return -1
+        end = self.source.find("##", self.idx + 2)
+        return end + 2 if end != -1 else -1
+
+
+    def string_end(self) -> int:
+        """
+        Index after the " closing the string opened at self.idx (the first " not preceded by \\), -1 if there's none
+        """
+        end = self.idx
+        while (end := self.source.find('"', end + 1)) != -1 and self.source[end - 1] == "\\":
+            pass
+        return end + 1 if end != -1 else -1
+
+
+    def end_multi_lined(self, tok: Token, end: int):
+        """
+        Make tok (a MULTI_LINED token found with comment_end/string_end) end at index end
+        Its end line/column are of its last character, as scan_tokens expects
+        Both are found by forward searches, so scanning these tokens is linear in their size
+        """
+        tok.value = self.source[tok.begin_idx : end]
+        tok.end_idx = end
+        tok.end_ln, tok.end_col = self.lines.position(end - 1)
+
+
+    def close(self):
+        """
+        Release mapped file, if any
+        """
+        if self.mapped:
+            self.source.close()
+
+
     def advance(self, steps):
         self.idx = min(self.idx + steps, len(self.source)) # maintain self.idx <= len(self.source)
         self.col = self.col + steps
@@ -127,7 +685,9 @@ class Lexer:
                     tok = Token(
                         value     = captured_indent,
                         begin_idx = self.idx,
+                        end_idx   = self.idx + len(captured_indent),
                         begin_col = self.col,
+                        end_col   = self.col + len(captured_indent),
                         begin_ln  = self.ln,
                         end_ln    = self.ln
                     )
@@ -137,14 +697,14 @@ class Lexer:
                         #  end
                         # ^
                         # OUTDENT
-                        tok.name = "OUTDENT"
+                        tok.kind = TokenKind.OUTDENT
                         self.indents_stack.pop(-1)
                     elif current_indent < len(captured_indent):
                         # for
                         #     write
                         # ^^^^
                         # INDENT
-                        tok.name = "INDENT"
+                        tok.kind = TokenKind.INDENT
                         self.indents_stack.append(len(tok.value))
 
                     self.indents_tokens_stack.append(tok)
@@ -159,23 +719,13 @@ class Lexer:
                 begin_col = self.col,
                 begin_ln  = self.ln,
             )
-            if multi_lined_comment := re.compile(pattern = r"##.*##", flags = re.DOTALL).match(
-                string = self.source,
-                pos    = self.idx,
-            ):
-                # MULTI LINED COMMENT
-                tok.name  = "MULTI_LINED_COMMENT"
-                tok.value = multi_lined_comment.group()
-                tok.end_col = -1
-                for c in reversed(tok.value):
-                    if c == "\n":
-                        break
-                    else:
-                        tok.end_col += 1
-                tok.end_ln = tok.begin_ln + tok.value.count("\n")
+            if (end := self.comment_end()) != -1:
+                # MULTI LINED COMMENT, until the next ##
+                tok.kind  = TokenKind.MULTI_LINED_COMMENT
+                self.end_multi_lined(tok, end)
             else:
                 # SINGLE LINE COMMENT
-                tok.name    = "COMMENT"
+                tok.kind    = TokenKind.COMMENT
                 tok.value   = current_line[self.col : ].removesuffix("\n") # exclude (\n)
                 tok.end_col = tok.begin_col + len(tok.value)
                 tok.end_ln  = tok.begin_ln
@@ -185,7 +735,7 @@ class Lexer:
         # LINE BREAK
         elif current_char == "\n":
             tok = Token(
-                name      = "LINE_BREAK",
+                kind      = TokenKind.LINE_BREAK,
                 value     = "\n",
                 begin_idx = self.idx,
                 begin_col = self.col,
@@ -206,21 +756,14 @@ class Lexer:
             )
             tok.end_idx = tok.begin_idx + len(tok.value)
             tok.end_col = tok.begin_col + len(tok.value)
-            if tok.value in KEYWORDS:
-                tok.name = "KEYWORD"
-                if tok.name in BLOCK_STATEMENTS:
-                    tok.name += "::BLOCK_KEYWORD"
-                elif tok.name in PRIMITIVE_DATA_TYPES:
-                    tok.name += "::DATA_TYPE"
-            else:
-                tok.name = "NAME"
+            tok.kind = KEYWORD_KINDS.get(tok.value, TokenKind.NAME) # Keywords are classified in const.py
         # END NAME/KEYWORD
 
         # NUMBER
         # BINARY / OCTAL / HEXADECIMAL
         elif re.match(pattern = r"[.0-9a-fA-F]", string = current_char): # We found a numeric character
             tok = Token(
-                name      = "NUMBER",
+                kind      = TokenKind.NUMBER,
                 begin_idx = self.idx,
                 begin_col = self.col,
                 begin_ln  = self.ln,
@@ -230,12 +773,12 @@ class Lexer:
 
             # A (possible) (binary/octal/hexadecimal) number match
             weak_match = re.compile(
-                pattern = r"0(?P<header>[boxBOX])(?P<body>.*)[^_.0-9a-fA-F]"
+                pattern = r"0(?P<header>[boxBOX])(?P<body>[_.0-9a-zA-Z]*)[^_.0-9a-zA-Z]"
             ).match(string = current_line, pos = self.col)
             if weak_match:
                 weak_match_str = weak_match.group()[:-1]
                 if BINARY_NUMBER_PATTERN.fullmatch(weak_match_str):
-                    tok.name += "::BINARY"
+                    tok.kind = TokenKind.BINARY
                     tok.value = weak_match_str
                 else:
                     if weak_match["header"].lower() == "b":
@@ -260,9 +803,9 @@ class Lexer:
                             error += f"{self.ln + 1} | " + current_line.strip() + "\n"
                             error += " " * len(f"{self.ln + 1} | ") + " " * (self.col - first_non_white_space) + "^^"
 
-                if not error and tok.name == "NUMBER":
+                if not error and tok.kind == TokenKind.NUMBER:
                     if OCTAL_NUMBER_PATTERN.fullmatch(weak_match_str):
-                        tok.name += "::OCTAL"
+                        tok.kind = TokenKind.OCTAL
                         tok.value = weak_match_str
                     else:
                         if weak_match["header"].lower() == "o":
@@ -287,9 +830,9 @@ class Lexer:
                                 error += f"{self.ln + 1} | " + current_line.strip() + "\n"
                                 error += " " * len(f"{self.ln + 1} | ") + " " * (self.col - first_non_white_space) + "^^"
 
-                if not error and tok.name == "NUMBER":
+                if not error and tok.kind == TokenKind.NUMBER:
                     if HEX_NUMBER_PATTERN.fullmatch(weak_match_str):
-                        tok.name += "::HEXADECIMAL"
+                        tok.kind = TokenKind.HEXADECIMAL
                         tok.value = weak_match_str
                     else:
                         if weak_match["header"].lower() == "x":
@@ -317,17 +860,17 @@ class Lexer:
             else:
                 # DECIMAL (INTEGER/FLOAT)
                 if float_match := FLOAT_PATTERN.match(string = current_line, pos = self.col):
-                    tok.name += "::FLOAT"
+                    tok.kind = TokenKind.FLOAT
                     tok.value = float_match.group()
                 elif int_match := INT_PATTERN.match(string = current_line, pos = self.col):
-                    tok.name += "::INT"
+                    tok.kind = TokenKind.INT
                     tok.value = int_match.group()
                 else:
                     if current_char == ".":
                         # We found something like: .e+12 / .e123 / .E1900
                         # all of which don't qualify as valid numeric literals
                         # Assume it's the dot operator
-                        tok.name = "OPERATOR::MEMBERSHIP_ACCESS"
+                        tok.kind = OPERATOR_KINDS["."]
                         tok.value = "."
             if not error: # Successfully match a number
                 # Complete token data initialization
@@ -338,7 +881,7 @@ class Lexer:
         # OPERATORS
         elif operator_match := OPERATOR_PATTERN.match(string = current_line, pos = self.col):
             tok = Token(
-                name      = "OPERATOR",
+                kind      = OPERATOR_KINDS.get(operator_match.group(), TokenKind.OPERATOR), # Classified in const.py
                 value     = operator_match.group(),
                 begin_idx = self.idx,
                 begin_col = self.col,
@@ -347,20 +890,12 @@ class Lexer:
             )
             tok.end_idx = tok.begin_idx + len(tok.value)
             tok.end_col = tok.begin_col + len(tok.value)
-            if tok.name == ".":
-                tok.name += "::MEMBERSHIP_ACCESS"
-            elif tok.name in ("+", "-", "*", "/", "~", "&", "|", "^", ">>", "<<"):
-                tok.name += "::ARITHMETIC"
-            elif tok.name in ("==", "!=", "<", "<=", ">", ">=", "not", "and", "or"):
-                tok.name += "::LOGICAL"
-            elif tok.name in (":=", "=", "+=", "-=", "*=", "/=", "~=", "&=", "|=", "^=", ">>=", "<<="):
-                tok.name += "::ASSIGNMENT"
         # END OPERATOR
 
         # SEPARATORS
         elif separator_match := SEPARATOR_PATTERN.match(string = current_line, pos = self.col):
             tok = Token(
-                name      = "SEPARATOR",
+                kind      = SEPARATOR_KINDS[separator_match.group()],
                 value     = separator_match.group(),
                 begin_idx = self.idx,
                 begin_col = self.col,
@@ -369,9 +904,9 @@ class Lexer:
             )
             tok.end_idx = tok.begin_idx + len(tok.value)
             tok.end_col = tok.begin_col + len(tok.value)
-            if tok.value in ("(", "{", "["):
+            if tok.kind in OPENING_BRACKET_KINDS:
                 self.left_parenthesis_stack.append(tok)
-            elif tok.value in (")", "}", "]"):
+            elif tok.kind in CLOSING_BRACKET_KINDS:
                 if self.left_parenthesis_stack:
                     self.left_parenthesis_stack.pop(-1)
                 else:
@@ -389,7 +924,7 @@ class Lexer:
             if weak_match:
                 if char_match := CHAR_PATTERN.match(string = weak_match.group()):
                     tok = Token(
-                        name      = "CHARACTER",
+                        kind      = TokenKind.CHARACTER,
                         value     = char_match.group(),
                         begin_idx = self.idx,
                         begin_col = self.col,
@@ -425,21 +960,14 @@ class Lexer:
 
             if single_lined_string := SINGLE_LINED_STRING_PATTERN.match(string = current_line, pos = self.col):
                 # SINGLE LINE STRING
-                tok.name    = "STRING"
+                tok.kind    = TokenKind.STRING
                 tok.value   = single_lined_string.group()
                 tok.end_col = tok.begin_col + len(tok.value)
                 tok.end_ln  = tok.begin_ln
-            elif multi_lined_string := MULTI_LINED_STRING_PATTERN.match(string = self.source, pos = self.idx):
+            elif (end := self.string_end()) != -1:
                 # MULTI LINED STRING
-                tok.name  = "MULTI_LINED_STRING"
-                tok.value = multi_lined_string.group()
-                tok.end_col = -1
-                for c in reversed(tok.value):
-                    if c == "\n":
-                        break
-                    else:
-                        tok.end_col += 1
-                tok.end_ln = tok.begin_ln + tok.value.count("\n")
+                tok.kind  = TokenKind.MULTI_LINED_STRING
+                self.end_multi_lined(tok, end)
             else:
                 # Un-terminated string
                 first_non_white_space = re.search(pattern = r"[^\s]", string = current_line).start()
@@ -451,6 +979,14 @@ class Lexer:
             tok.end_idx = tok.begin_idx + len(tok.value)
         # END STRINGS
 
+        return self.finish_token(error, tok, steps)
+
+
+    def finish_token(self, error: str, tok: Token, steps: int = None) -> Tuple[str, Token]:
+        """
+        Shared tail of every scanner: move past the token just found (or past indentation)
+        steps is only given when checking indentation
+        """
         if not error:
             if not steps: # WE DID NOT CHECK FOR INDENTATION, WE DID SOMETHING ELSE
                 if tok:
@@ -459,7 +995,7 @@ class Lexer:
             if steps:
                 if (
                     not tok or # There's no change in indentation OR
-                    (tok and not tok.name.startswith("MULTI_LINED")) # A Valid non-MULTI_LINED token
+                    (tok and not tok.kind & TokenKind.MULTI_LINED) # A Valid non-MULTI_LINED token
                 ):
                     # using self.advance when encountering MULTI_LINED_STRING/MULTI_LINED_COMMENT is dangerous
                     # since self.col becomes invalid after call to self.advance
@@ -472,9 +1008,235 @@ class Lexer:
         return error, tok
 
 
-    def generate_tokens(self):
+    def generate_next_token_master(self) -> Tuple[str, Token]:
+        """
+        Same job as generate_next_token, but faster:
+        names/keywords, operators and separators are classified with a single match of MASTER_PATTERN
+        and everything else is dispatched on the current character, all patterns are precompiled in const.py
+
+        Malformed numbers, characters and strings are handed to generate_next_token which owns all error messages
+        That's safe because generate_next_token changes nothing when it reports an error
+        """
+        tok = None
+        current_line = self.current_line_obj.value
+        current_char = self.source[self.idx]
+
+        # INDENTATION
+        if (
+            not self.checked_indent_in_current_line and # We DID NOT check indentation in current line AND
+            not self.left_parenthesis_stack and # Multi-lining is OFF AND
+            self.col == 0 and # It's line head AND
+            current_line.removesuffix("\n") # current line is not empty
+        ):
+            self.checked_indent_in_current_line = True
+            captured_indent = self.line_head["indent"] # Found by scan_tokens at this line head
+            if self.line_head["first"] not in ("#", ")", "}", "]"):
+                current_indent = 0 if not self.indents_stack else self.indents_stack[-1]
+                if len(captured_indent) != current_indent:
+                    tok = Token(
+                        value     = captured_indent,
+                        begin_idx = self.idx,
+                        end_idx   = self.idx + len(captured_indent),
+                        begin_col = self.col,
+                        end_col   = self.col + len(captured_indent),
+                        begin_ln  = self.ln,
+                        end_ln    = self.ln
+                    )
+                    if len(captured_indent) < current_indent:
+                        tok.kind = TokenKind.OUTDENT
+                        self.indents_stack.pop(-1)
+                    else:
+                        tok.kind = TokenKind.INDENT
+                        self.indents_stack.append(len(tok.value))
+                    self.indents_tokens_stack.append(tok)
+            return self.finish_token("", tok, len(captured_indent))
+
+        # COMMENTS
+        if current_char == "#":
+            tok = Token(
+                begin_idx = self.idx,
+                begin_col = self.col,
+                begin_ln  = self.ln,
+            )
+            if (end := self.comment_end()) != -1:
+                tok.kind    = TokenKind.MULTI_LINED_COMMENT
+                self.end_multi_lined(tok, end)
+            else:
+                tok.kind    = TokenKind.COMMENT
+                tok.value   = current_line[self.col : ].removesuffix("\n")
+                tok.end_col = tok.begin_col + len(tok.value)
+                tok.end_ln  = tok.begin_ln
+            tok.end_idx = tok.begin_idx + len(tok.value)
+            return self.finish_token("", tok)
+
+        # LINE BREAK
+        if current_char == "\n":
+            return self.finish_token("", Token(
+                kind      = TokenKind.LINE_BREAK,
+                value     = "\n",
+                begin_idx = self.idx,
+                end_idx   = self.idx + 1,
+                begin_col = self.col,
+                end_col   = self.col + 1,
+                begin_ln  = self.ln,
+                end_ln    = self.ln
+            ))
+
+        master_match = MASTER_PATTERN.match(current_line, self.col)
+        group = master_match.lastgroup if master_match else None
+
+        # NAME/KEYWORD
+        if group == "NAME":
+            value = master_match.group()
+            return self.finish_token("", Token(
+                kind      = KEYWORD_KINDS.get(value, TokenKind.NAME),
+                value     = value,
+                begin_idx = self.idx,
+                end_idx   = self.idx + len(value),
+                begin_col = self.col,
+                end_col   = self.col + len(value),
+                begin_ln  = self.ln,
+                end_ln    = self.ln
+            ))
+
+        # NUMBER
+        if current_char in NUMBER_START_CHARACTERS:
+            if weak_match := WEAK_BASED_NUMBER_PATTERN.match(current_line, self.col):
+                # BINARY / OCTAL / HEXADECIMAL
+                value = weak_match.group()[:-1]
+                kind, pattern = BASED_NUMBERS[weak_match["header"].lower()]
+                if not pattern.fullmatch(value):
+                    return self.generate_next_token() # Invalid or un-terminated number, report it
+            elif decimal_match := DECIMAL_NUMBER_PATTERN.match(current_line, self.col):
+                # DECIMAL (INTEGER/FLOAT)
+                value = decimal_match.group()
+                kind = DECIMAL_NUMBER_KINDS[decimal_match.lastgroup]
+            elif current_char == ".":
+                # Something like .e+12, assume it's the dot operator
+                kind  = OPERATOR_KINDS["."]
+                value = "."
+            else:
+                return self.generate_next_token()
+            return self.finish_token("", Token(
+                kind      = kind,
+                value     = value,
+                begin_idx = self.idx,
+                end_idx   = self.idx + len(value),
+                begin_col = self.col,
+                end_col   = self.col + len(value),
+                begin_ln  = self.ln,
+                end_ln    = self.ln
+            ))
+
+        # OPERATORS / SEPARATORS
+        if group:
+            value = master_match.group()
+            if group == "OPERATOR":
+                kind = OPERATOR_KINDS.get(value, TokenKind.OPERATOR) # Some operators (like ++) are not in OPERATORS
+            else:
+                kind = SEPARATOR_KINDS[value]
+            tok = Token(
+                kind      = kind,
+                value     = value,
+                begin_idx = self.idx,
+                end_idx   = self.idx + len(value),
+                begin_col = self.col,
+                end_col   = self.col + len(value),
+                begin_ln  = self.ln,
+                end_ln    = self.ln
+            )
+            if tok.kind in OPENING_BRACKET_KINDS:
+                self.left_parenthesis_stack.append(tok)
+            elif tok.kind in CLOSING_BRACKET_KINDS:
+                if not self.left_parenthesis_stack:
+                    return self.generate_next_token() # Un-expected closing parenthesis, report it
+                self.left_parenthesis_stack.pop(-1)
+            return self.finish_token("", tok)
+
+        # CHARACTERS
+        if current_char == "'":
+            if (
+                (weak_match := WEAK_CHAR_PATTERN.match(current_line, self.col)) and
+                (char_match := CHAR_PATTERN.match(weak_match.group()))
+            ):
+                value = char_match.group()
+                return self.finish_token("", Token(
+                    kind      = TokenKind.CHARACTER,
+                    value     = value,
+                    begin_idx = self.idx,
+                    end_idx   = self.idx + len(value),
+                    begin_col = self.col,
+                    end_col   = self.col + len(value),
+                    begin_ln  = self.ln,
+                    end_ln    = self.ln
+                ))
+            return self.generate_next_token() # Invalid or un-terminated character, report it
+
+        # STRINGS
+        if current_char == '"':
+            tok = Token(
+                begin_idx = self.idx,
+                begin_col = self.col,
+                begin_ln  = self.ln,
+            )
+            if single_lined_string := SINGLE_LINED_STRING_PATTERN.match(current_line, self.col):
+                tok.kind    = TokenKind.STRING
+                tok.value   = single_lined_string.group()
+                tok.end_col = tok.begin_col + len(tok.value)
+                tok.end_ln  = tok.begin_ln
+            elif (end := self.string_end()) != -1:
+                tok.kind    = TokenKind.MULTI_LINED_STRING
+                self.end_multi_lined(tok, end)
+            else:
+                return self.generate_next_token() # Un-terminated string, report it
+            tok.end_idx = tok.begin_idx + len(tok.value)
+            return self.finish_token("", tok)
+
+        # Nothing matched
+        return self.finish_token("", None)
+
+
+    def iter_tokens(self):
+        """
+        Generate tokens lazily, each token (INDENT/OUTDENT, LINE_BREAK and EOF included) is yielded as soon as it's found
+        Tokens are not stored in self.tokens, so memory use does not grow with the input
+        Use generate_tokens() to keep all of them
+        Once this generator is exhausted the lexer is done, and iterating again yields whatever self.tokens holds
+        """
+        if not self.token_cache or self.done:
+            yield from self.scan_tokens()
+        elif (cached := self.load_cached_tokens()) is not None:
+            yield from cached if self.compact else cached.to_tokens()
+        else:
+            # Tokens must be kept to be cached, keep them compact
+            scanned = TokenStore(self.source)
+            for tok in self.scan_tokens():
+                scanned.append(tok)
+                yield tok
+            self.store_cached_tokens(scanned)
+
+
+    def unexpected_character_error(self) -> str:
+        """
+        Syntax error pointing at current character
+        """
+        current_line = self.current_line_obj.value
+        first_non_white_space = FIRST_NON_WHITE_SPACE_PATTERN.search(current_line).start()
+        error = f"Syntax Error in \"{self.file}\", line {self.ln + 1}, column {self.col + 1}:\n"
+        error += " " * 4 + "Un-expected character\n"
+        error += f"{self.ln + 1} | " + current_line.strip() + "\n"
+        error += " " * len(f"{self.ln + 1} | ") + " " * (self.col - first_non_white_space) + "^" + "\n"
+        return error
+
+
+    def scan_tokens(self):
+        """
+        Scan source and yield tokens as they're found, see iter_tokens
+        """
         useless_white_space_pattern = re.compile(pattern = r"(?!\n)\s")
+        white_space_stop_pattern = re.compile(pattern = r"[^\s]|\n")
         error = ""
+        last_tok = None # Last token yielded
         if not self.done:
             while True: # Iterate lines
                 self.current_line_obj = self.lines.get(self.ln, None) # Attempt getting line with index self.ln, None means failure
@@ -487,8 +1249,8 @@ class Lexer:
                     break
                 line_value = self.current_line_obj.value
                 if not (
-                    (last_tok := None if not self.tokens else self.tokens[-1]) and # There's at least one token AND
-                    last_tok.name.startswith("MULTI_LINED") # It's a MULTI_LINED token
+                    last_tok and # There's at least one token AND
+                    last_tok.kind & TokenKind.MULTI_LINED # It's a MULTI_LINED token
                 ):
                     # SO THIS CONDITION IS TRUE WHEN:
                     #    - No tokens available
@@ -497,6 +1259,58 @@ class Lexer:
                     # If multi-lining is ON, assume we checked for indentation
                     # because there's no indentation when multi-lining
                     self.checked_indent_in_current_line = bool(self.left_parenthesis_stack)
+                    if self.incremental and not self.left_parenthesis_stack:
+                        # A safe restart point
+                        if self.resync_with and (k := self.resync_point()) != -1:
+                            # Re-scanning after an edit met old tokens again, apply_edit takes it from here
+                            self.synced = k
+                            return
+                        if (
+                            not self.checkpoints or
+                            self.checkpoints.indent_tokens[-1] != len(self.indents_tokens_stack)
+                        ):
+                            indents = tuple(self.indents_stack)
+                        else:
+                            indents = self.checkpoints.indents[-1] # No INDENT/OUTDENT since last checkpoint, share it
+                        self.checkpoints.append(
+                            self.idx, self.ln, self.tokens_found, len(self.indents_tokens_stack), indents
+                        )
+                    self.line_head = LINE_HEAD_PATTERN.match(line_value)
+                    first = self.line_head.start("first")
+                    if line_value[first] == "\n" or (line_value[first] == "#" and line_value[first + 1] != "#"):
+                        # A line without code: blank, or only a # comment (## may begin a MULTI_LINED_COMMENT)
+                        # Its tokens are made right here, its indentation changes nothing
+                        begin = self.current_line_obj.begin
+                        line_break = len(line_value) - 1 # Column of line break
+                        if first != line_break:
+                            tok = Token(
+                                kind      = TokenKind.COMMENT,
+                                value     = self.decode(line_value[first : line_break]),
+                                begin_idx = begin + first,
+                                end_idx   = begin + line_break,
+                                begin_col = first,
+                                end_col   = line_break,
+                                begin_ln  = self.ln,
+                                end_ln    = self.ln
+                            )
+                            self.tokens_found += 1
+                            yield tok
+                        last_tok = tok = Token(
+                            kind      = TokenKind.LINE_BREAK,
+                            value     = "\n",
+                            begin_idx = begin + line_break,
+                            end_idx   = begin + line_break + 1,
+                            begin_col = line_break,
+                            end_col   = line_break + 1,
+                            begin_ln  = self.ln,
+                            end_ln    = self.ln
+                        )
+                        self.tokens_found += 1
+                        yield tok
+                        self.idx = self.current_line_obj.end
+                        self.col = line_break + 1
+                        self.ln += 1
+                        continue
                 else:
                     # Last generated token is MULTI_LINED_COMMENT/MULTI_LINED_STRING
                     # this means will start tokenization process from the middle of the line in which
@@ -512,63 +1326,59 @@ class Lexer:
                 current_position_is_indentation = not self.checked_indent_in_current_line # True when at line head, False otherwise
                 while True: # Generate all tokens in current line
                     if (
-                        self.col == 0 and # It's line head AND
-                        re.fullmatch(     # This line is just white-spaces
-                            pattern = rf"{useless_white_space_pattern.pattern}+",
-                            string = line_value.removesuffix("\n")
-                        )
+                        # Current char is a useless white-space AND
+                        useless_white_space_pattern.match(string = self.source[self.idx]) and
+                        # This is not line head so we don't skip indentation as if they're useless white-spaces
+                        not current_position_is_indentation
                     ):
-                        # WHITE-SPACES LINE
-                        self.advance(steps = len(line_value.removesuffix("\n"))) # exclude \n
-                        # We need to reach this line's (\n), not overcome it
-                        # so advance to last item in this line, which is \n
+                        # Indentation was checked (or there's none), even at line head these white-spaces are useless
+                        # like white-spaces other than spaces/tabs before first character of a line
+                        stop = white_space_stop_pattern.search(
+                            string = line_value,
+                            pos    = self.col + 1,
+                            endpos = len(line_value)
+                        )
+                        # no need to check if (stop) is None because we search for either a non-white-space or \n
+                        # each line self.lines ends with (\n), so it's always guaranteed that (stop) will find a match
+                        # Skip the whole run of white-spaces at once
+                        self.advance(stop.start() - self.col)
                     else:
-                        if (
-                            # Current char is a useless white-space AND
-                            useless_white_space_pattern.match(string = self.source[self.idx]) and
-                            # This is not line head so we don't skip indentation as if they're useless white-spaces
-                            not current_position_is_indentation
-                        ):
-                            if (
-                                # It's line head but Multi-lining is ON OR
-                                (self.col == 0 and self.left_parenthesis_stack) or
-                                # We are in the middle of current line
-                                self.col != 0 and self.col < len(line_value)
-                            ):
-                                # THIS CONDITION SAYS MAKE SURE CURRENT POSITION IS NEVER INDENTATION
-                                stop = re.compile(pattern = r"[^\s]|\n").search(
-                                    string = line_value,
-                                    pos    = self.col + 1,
-                                    endpos = len(line_value)
-                                )
-                                # no need to check if (stop) is None because we search for either a non-white-space or \n
-                                # each line self.lines ends with (\n), so it's always guaranteed that (stop) will find a match
-                                steps = len(stop.group())
-                                self.advance(steps)
+                        scanned_from = (self.idx, self.checked_indent_in_current_line)
+                        error, tok = self.next_token()
+                        if not error and not tok and scanned_from == (self.idx, self.checked_indent_in_current_line):
+                            # No token starts with current character, scanning would stay here forever
+                            error = self.unexpected_character_error()
+                        if error:
+                            self.fail(error, (self.idx, self.current_line_obj.end - 1))
+                            # Only collecting errors gets here, go on from the next line
+                            error = ""
+                            self.skip_line()
+                            current_position_is_indentation = False
                         else:
-                            error, tok = self.generate_next_token()
-                            if error:
-                                print(error, file = stderr)
-                                exit(1)
-                            else:
-                                # We moved beyond line head, indentation no longer exist
-                                current_position_is_indentation = False
-                                if tok:
-                                    self.tokens.append(tok)
-                                    if tok.value == "\n" or tok.name.startswith("MULTI_LINED"):
-                                        # 1 - We found (\n) which means we reached current line end OR
-                                        # 2 - We found a MULTI_LINED token, and so remaining characters in this line belong to this
-                                        # MULTI_LINED token we just found
-                                        # - In either case, no more work to be done in current line
-                                        # In case 1, jump to next line
-                                        # In case 2, jump to the line where this (MULTI_LINED token we just found) ends
-                                        break
+                            # We moved beyond line head, indentation no longer exist
+                            current_position_is_indentation = False
+                            if tok:
+                                last_tok = tok
+                                if self.mapped:
+                                    # Lexer is done with tok.value, from now on it's only shown
+                                    # that's safe because tok.end_idx/tok.end_col are already computed
+                                    tok.value = self.decode(tok.value)
+                                self.tokens_found += 1
+                                yield tok
+                                if tok.kind == TokenKind.LINE_BREAK or tok.kind & TokenKind.MULTI_LINED:
+                                    # 1 - We found (\n) which means we reached current line end OR
+                                    # 2 - We found a MULTI_LINED token, and so remaining characters in this line belong to this
+                                    # MULTI_LINED token we just found
+                                    # - In either case, no more work to be done in current line
+                                    # In case 1, jump to next line
+                                    # In case 2, jump to the line where this (MULTI_LINED token we just found) ends
+                                    break
                 # end "while True" generate all tokens in current line
 
                 # no need for (not tok) part because the smallest line possible is "\n"
                 # which means we have at least the (\n) token
                 # which is the exact token need to break the loop above ([generate al tokens in current line] loop)
-                if tok.value == "\n":
+                if tok.kind == TokenKind.LINE_BREAK:
                     # We reached the end of current line
                     self.ln += 1
                 else:
@@ -600,6 +1410,7 @@ class Lexer:
 
             current_line = self.current_line_obj.value
 
+            eof_errors: List[Tuple[str, Tuple[int, int]]] = [] # (error, span)
             left_open_parenthesis = False
             if self.left_parenthesis_stack:
                 # Un-close left parentheses
@@ -619,13 +1430,11 @@ class Lexer:
                 error += (" " * 3) * int(len(error_line_indent) > 4)
                 error += (" " * 4) * int(bool(error_line_indent))
                 error += " " * (last_left.begin_col - first_non_white_space) + "^" + "\n"
+                eof_errors.append((error, (last_left.begin_idx, last_left.end_idx)))
+                error = ""
                 left_open_parenthesis = True
 
             if not left_open_parenthesis and self.indents_stack:
-                if error:
-                    error += "\n"
-                    error += "<===========================================================================>\n"
-                    error += "\n"
                 # Missing (end) statement
                 # for
                 #     write(x)
@@ -644,39 +1453,381 @@ class Lexer:
                 error += (" " * 4) * int(bool(current_line_indent)) + current_line.strip() + "\n"
                 error += f"{self.ln + 2} | " + "end" + "\n"
                 error += " " * len(f"{self.ln + 2} | ") + "+++" + "\n"
-
-            if error:
-                print(error, file = stderr)
-                exit(1)
-            else:
-                EOF = Token(
-                    name  = "EOF",
-                    value = "",
-                )
-                EOF.begin_idx = EOF.end_idx = len(self.source)
-                EOF.begin_col = EOF.end_col = self.current_line_obj.end
-                EOF.begin_ln  = EOF.end_ln  = self.ln
-                self.tokens.append(EOF)
+                eof_errors.append((error, (len(self.source), len(self.source))))
+                error = ""
+
+            if self.collect_errors:
+                for eof_error, span in eof_errors:
+                    self.fail(eof_error, span)
+            elif eof_errors:
+                separator = "\n<===========================================================================>\n\n"
+                self.fail(separator.join(eof_error for eof_error, _ in eof_errors))
+
+            EOF = Token(
+                kind  = TokenKind.EOF,
+                value = "",
+            )
+            EOF.begin_idx = EOF.end_idx = len(self.source)
+            EOF.begin_col = EOF.end_col = self.current_line_obj.end
+            EOF.begin_ln  = EOF.end_ln  = self.ln
+            self.tokens_found += 1
+            yield EOF
 
             self.done = True
+        else:
+            yield from self.tokens
         # end "if not self.done"
+
+
+    def generate_tokens(self):
+        """
+        Generate all tokens and store them in self.tokens
+        """
+        if not self.done:
+            if self.token_cache and (cached := self.load_cached_tokens()) is not None:
+                self.tokens = cached if self.compact else list(cached.to_tokens())
+            else:
+                if not (self.workers > 1 and not self.incremental and self.scan_chunks()):
+                    self.tokens.extend(self.scan_tokens())
+                self.store_cached_tokens(self.tokens)
         return self
 
 
+    def find_chunks(self, text: str, count: int) -> List[Tuple[int, int, Tuple[int, ...]]]:
+        """
+        Split text (this lexer's source) in about count chunks of about the same size, without lexing it
+        Chunks begin at safe restart points: line heads outside any bracket, string, character and comment
+        Returns (index, line, indents_stack) at head of each chunk, indents_stack is what the lexer has there,
+        found by checking indentation of every line head (like the scanners do) on the way
+        """
+        chunks = [(0, 0, ())]
+        target = len(text) // count # Where the next chunk should begin, at least
+        indents: List[int] = []
+        depth = 0 # Brackets open
+        idx, ln = 0, 0
+        line_head = True
+        while True:
+            if line_head and not depth:
+                if target <= idx < len(text) and len(chunks) < count:
+                    chunks.append((idx, ln, tuple(indents)))
+                    target = idx + (len(text) - idx) // (count - len(chunks) + 1)
+                line_head = LINE_HEAD_PATTERN.match(text, idx) # None at end of text
+                if line_head and line_head["first"] not in ("\n", "#", ")", "}", "]"): # Not an empty/white-spaces line either
+                    indent = len(line_head["indent"])
+                    current_indent = indents[-1] if indents else 0
+                    if indent < current_indent:
+                        indents.pop(-1)
+                    elif current_indent < indent:
+                        indents.append(indent)
+            line_head = False
+            if not (match := RESTART_POINT_PATTERN.search(text, idx)):
+                break
+            char, idx = match.group(), match.end()
+            if char == "\n":
+                ln += 1
+                line_head = True
+            elif char in "([{":
+                depth += 1
+            elif char in ")]}":
+                depth = max(depth - 1, 0)
+            elif char == "#":
+                if text.startswith("#", idx) and (comment_end := text.find("##", idx + 1)) != -1:
+                    ln += text.count("\n", idx, comment_end)
+                    idx = comment_end + 2
+                elif (line_break := text.find("\n", idx)) != -1:
+                    idx = line_break # Line comment, its line break still ends the line
+            else:
+                # String (it may run over many lines) or character (it does not), ends at first quote not after \
+                end = idx
+                while (end := text.find(char, end)) != -1 and text[end - 1] == "\\":
+                    end += 1
+                if end == -1 or (char == "'" and text.find("\n", idx, end) != -1):
+                    continue # Un-terminated, it's an error and lexing chunks gives up on it
+                ln += text.count("\n", idx, end)
+                idx = end + 1
+        return chunks
+
+
+    def scan_chunks(self) -> bool:
+        """
+        Generate all tokens in self.workers processes, each lexing a chunk of source (see find_chunks)
+        then put them together, moving each chunk's tokens to where it is in source
+        Only for sources without errors: if any chunk fails, or does not end in the state the next chunk is
+        assumed to begin in, nothing is kept and it's False (scan_tokens then finds and reports errors as usual)
+        Small sources are not split, False too
+        """
+        count = min(self.workers, len(self.source) // PARALLEL_CHUNK_SIZE)
+        if count < 2:
+            return False
+        text = self.source[:] if self.mapped else self.source # Workers get chunks of text
+        chunks = self.find_chunks(text, count)
+        if len(chunks) < 2:
+            return False
+        bounds = [idx for idx, _, _ in chunks[1:]] + [len(text)]
+        expected_indents = [indents for _, _, indents in chunks[1:]] + [()] # At end of each chunk
+        tokens = TokenStore(self.source)
+        pool = ProcessPoolExecutor(max_workers = min(self.workers, len(chunks)))
+        try:
+            futures = [
+                pool.submit(lex_chunk, self.file, text[idx : end], self.scanner, indents)
+                for (idx, _, indents), end in zip(chunks, bounds)
+            ]
+            for (idx, ln, _), future, expected in zip(chunks, futures, expected_indents):
+                if (result := future.result()) is None or result[1] != expected:
+                    return False
+                columns = result[0]
+                tokens.kinds.extend(columns["kinds"])
+                for column, delta in (("begin_idx", idx), ("end_idx", idx), ("begin_ln", ln), ("end_ln", ln)):
+                    getattr(tokens, column).extend(value + delta for value in columns[column])
+                tokens.begin_col.extend(columns["begin_col"])
+                tokens.end_col.extend(columns["end_col"])
+        finally:
+            pool.shutdown(cancel_futures = True)
+
+        self.ln = len(self.lines) - 1
+        self.current_line_obj = self.lines[self.ln]
+        tokens.append(Token(
+            kind      = TokenKind.EOF,
+            value     = "",
+            begin_idx = len(self.source),
+            end_idx   = len(self.source),
+            begin_col = self.current_line_obj.end,
+            end_col   = self.current_line_obj.end,
+            begin_ln  = self.ln,
+            end_ln    = self.ln
+        ))
+        self.tokens = tokens if self.compact else list(tokens.to_tokens())
+        self.indents_tokens_stack = [
+            self.tokens[i] for i, kind in enumerate(tokens.kinds) if kind in (TokenKind.INDENT, TokenKind.OUTDENT)
+        ]
+        self.idx = len(self.source)
+        self.tokens_found = len(tokens)
+        self.done = True
+        return True
+
+
+    def load_cached_tokens(self) -> TokenStore:
+        """
+        Tokens of this source from token cache, None if they're not there
+        On success the lexer is left as if it scanned the source itself
+        """
+        self.cache_key = self.token_cache.key(self.source.buffer if self.mapped else self.source, self.mapped)
+        if (columns := self.token_cache.load(self.cache_key)) is None:
+            return None
+        cached = TokenStore(self.source)
+        for column in TokenStore.COLUMNS:
+            setattr(cached, column, columns[column])
+        if not len(cached) or cached.kinds[-1] != TokenKind.EOF:
+            return None
+
+        self.indents_tokens_stack = [
+            cached[i] for i, kind in enumerate(cached.kinds) if kind in (TokenKind.INDENT, TokenKind.OUTDENT)
+        ]
+        self.idx = len(self.source)
+        self.ln = cached.begin_ln[-1]
+        self.current_line_obj = self.lines[self.ln]
+        self.tokens_found = len(cached)
+        self.done = True
+        return cached
+
+
+    def store_cached_tokens(self, tokens):
+        """
+        Save all tokens (a list or a TokenStore) in token cache
+        """
+        if not self.token_cache or not self.done or self.diagnostics:
+            return # Diagnostics are not cached, sources with errors are scanned again
+        if not isinstance(tokens, TokenStore):
+            compact_tokens = TokenStore(self.source)
+            compact_tokens.extend(tokens)
+            tokens = compact_tokens
+        self.token_cache.store(self.cache_key, {column: getattr(tokens, column) for column in TokenStore.COLUMNS})
+
+
+    def resync_point(self) -> int:
+        """
+        Old checkpoint where re-scanning can stop, -1 if current line head is not one
+        Text after such checkpoint is unchanged and lexer state is the same, so old tokens after it are still valid
+        """
+        old_checkpoints, edit_end, delta_idx = self.resync_with
+        old_idx = self.idx - delta_idx
+        if old_idx < edit_end:
+            return -1
+        k = old_checkpoints.find(old_idx)
+        if k == -1 or old_checkpoints.indents[k] != tuple(self.indents_stack):
+            return -1
+        return k
+
+
+    def apply_edit(self, start_idx: int, end_idx: int, new_text: str) -> Tuple[int, int, int]:
+        """
+        Replace source[start_idx : end_idx] with new_text and update tokens
+        Only what could have changed is scanned again: from the last safe restart point before the edit
+        until scanning meets a safe restart point after the edit, in the same indentation, from there old tokens are kept
+        Needs a lexer made with incremental = True whose tokens are generated
+        Returns (index of first changed token, how many old tokens were removed, how many new tokens were inserted)
+        """
+        if not (self.incremental and self.done):
+            raise ValueError("apply_edit needs an incremental lexer (incremental = True) whose tokens are generated")
+        if self.mapped:
+            raise ValueError("apply_edit needs a source text, not a mapped file")
+        if not 0 <= start_idx <= end_idx <= len(self.source):
+            raise IndexError(f"Edit {start_idx}-{end_idx} outside source (0-{len(self.source)})")
+
+        old_source, old_tokens_count = self.source, len(self.tokens)
+        new_source = old_source[ : start_idx] + new_text + old_source[end_idx : ]
+        if not new_source.endswith("\n"):
+            new_source += "\n"
+        delta_idx = len(new_text) - (end_idx - start_idx)
+
+        if self.diagnostics:
+            # Diagnostics are not kept in step with tokens, an edit may fix any of them
+            self.__init__(
+                self.file,
+                new_source,
+                scanner = self.scanner,
+                compact = self.compact,
+                incremental = self.incremental,
+                exit_on_error = self.exit_on_error,
+                collect_errors = self.collect_errors,
+            )
+            self.generate_tokens()
+            return (0, old_tokens_count, len(self.tokens))
+
+        restart_before = start_idx
+        if "#" in new_text or "#" in old_source[max(start_idx - 1, 0) : end_idx + 1]:
+            # A ## never closed is a COMMENT until its line end, a ## made by the edit closes it
+            # and makes it a MULTI_LINED_COMMENT, there's no ## after such a COMMENT so it's the last ## before the edit
+            if (last_comment := old_source.rfind("##", 0, start_idx)) != -1:
+                restart_before = last_comment
+
+        # Attributes are replaced below, never changed in place, so this is the lexer before the edit
+        saved = dict(self.__dict__)
+        old_checkpoints = self.checkpoints
+        k = old_checkpoints.last_before(min(restart_before, len(new_source) - 1)) # Restart inside new source
+        restart_idx, restart_ln, restart_tokens, restart_indent_tokens, restart_indents = old_checkpoints[k]
+        final_ln, final_indents = self.ln, self.indents_stack
+        old_indents_tokens = self.indents_tokens_stack
+
+        # Go back to restart point, with the new source
+        self.source = new_source
+        lines = LineIndex(self.source)
+        lines.begins = self.lines.begins[ : restart_ln + 1] # Lines before the edit did not change
+        self.lines = lines
+        self.idx, self.ln, self.col = restart_idx, restart_ln, 0
+        self.current_line_obj = self.lines[self.ln]
+        self.indents_stack = list(restart_indents)
+        self.indents_tokens_stack = old_indents_tokens[ : restart_indent_tokens]
+        self.left_parenthesis_stack = []
+        self.checked_indent_in_current_line = False
+        self.tokens_found = restart_tokens
+        self.checkpoints = old_checkpoints.prefix(k)
+        self.resync_with = (old_checkpoints, end_idx, delta_idx)
+        self.synced = -1
+        self.done = False
+
+        try:
+            new_tokens = list(self.scan_tokens())
+        except SourceError:
+            # Edit is not applied, the lexer keeps its source and tokens so later edits can fix it
+            self.__dict__.update(saved)
+            raise
+
+        self.resync_with = None
+        if self.synced == -1:
+            # Scanning reached end of file, all tokens after restart point are new
+            removed = old_tokens_count - restart_tokens
+        else:
+            # Keep old tokens after where scanning stopped, in their new places
+            sync_idx, sync_ln, sync_tokens, sync_indent_tokens, _ = old_checkpoints[self.synced]
+            delta_ln = self.ln - sync_ln
+            removed = sync_tokens - restart_tokens
+            if self.compact:
+                self.tokens.shift(sync_tokens, delta_idx, delta_ln)
+                shifted = old_indents_tokens[sync_indent_tokens : ] # Token objects outside the store
+            else:
+                shifted = self.tokens[sync_tokens : ]
+            for tok in shifted:
+                tok.begin_idx += delta_idx
+                tok.end_idx   += delta_idx
+                tok.begin_ln  += delta_ln
+                tok.end_ln    += delta_ln
+                if tok.kind == TokenKind.EOF:
+                    tok.begin_col += delta_idx # EOF columns are its line's end index
+                    tok.end_col   += delta_idx
+            self.checkpoints.extend_shifted(
+                old_checkpoints,
+                self.synced,
+                delta_idx,
+                delta_ln,
+                restart_tokens + len(new_tokens) - sync_tokens,
+                len(self.indents_tokens_stack) - sync_indent_tokens,
+            )
+            self.indents_tokens_stack.extend(old_indents_tokens[sync_indent_tokens : ])
+            self.indents_stack = final_indents
+            self.idx = len(self.source)
+            self.ln = final_ln + delta_ln
+            self.current_line_obj = self.lines[self.ln]
+            self.tokens_found = old_tokens_count - removed + len(new_tokens)
+            self.done = True
+
+        if self.compact:
+            self.tokens.source = self.source
+        self.tokens[restart_tokens : restart_tokens + removed] = new_tokens
+        return (restart_tokens, removed, len(new_tokens))
+
+
     def __iter__(self):
         if self.done is False:
             self.generate_tokens()
         return iter(self.tokens)
 
 
+def lex_chunk(file_name: str, text: str, scanner: str, indents: Tuple[int, ...]):
+    """
+    Tokens of a chunk of source, see Lexer.scan_chunks
+    The chunk is lexed as a source of its own, beginning with indents_stack indents and without its EOF token
+    Runs in worker processes, so it must stay a module level function
+    Returns (TokenStore columns, indents_stack at end of chunk), None if lexing it fails
+    """
+    lexer = Lexer(file_name, text, scanner = scanner, compact = True, exit_on_error = False)
+    lexer.indents_stack = list(indents)
+    tokens = TokenStore(lexer.source)
+    try:
+        for tok in lexer.scan_tokens():
+            tokens.append(tok)
+            if tok.end_idx == len(lexer.source):
+                break # Last line break of chunk, what's after it is checking the end of a whole source
+    except SourceError:
+        return None
+    if lexer.left_parenthesis_stack:
+        return None
+    return ({column: getattr(tokens, column) for column in TokenStore.COLUMNS}, tuple(lexer.indents_stack))
+
+
 if __name__ == "__main__":
     from argparse import ArgumentParser
     from sys import argv
+    from contextlib import nullcontext
+    from token_cache import TokenCache, DEFAULT_TOKEN_CACHE_DIR
+    from profiling import Profiler
 
     parser = ArgumentParser()
 
     parser.add_argument("--source", help="A small code sample to execute")
     parser.add_argument("--file", help="Source file")
+    parser.add_argument("--scanner", choices=SCANNERS, default="master", help="Scanner used to find tokens")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes lexing chunks of a big source (default 1)")
+    parser.add_argument(
+        "--token-cache",
+        nargs="?",
+        const=DEFAULT_TOKEN_CACHE_DIR,
+        metavar="DIR",
+        help=f"Reuse tokens of sources scanned before, cached in DIR (default {DEFAULT_TOKEN_CACHE_DIR})"
+    )
+    parser.add_argument("--profile", action="store_true", help="Print token counts and time spent by scanner branch to stderr")
+    parser.add_argument("--cprofile", metavar="FILE", help="Save cProfile stats (pstats format) to FILE, implies --profile")
+    parser.add_argument("--tracemalloc", metavar="FILE", help="Save a tracemalloc snapshot to FILE, implies --profile")
 
     args = parser.parse_args()
     cmd_line = "".join(argv)
@@ -686,7 +1837,7 @@ if __name__ == "__main__":
         print("Do not supply both --file and --source", file = stderr)
         exit(1)
     if args.file and not args.source:
-        source = open(args.file).read()
+        source = None # Lexer maps file into memory
         file = path.abspath(args.file)
     elif args.source and not args.file:
         source = args.source
@@ -695,9 +1846,26 @@ if __name__ == "__main__":
         print("You must supply either --file or --source", file = stderr)
         exit(1)
 
-    tokenizer = Lexer(
-        file_name = file,
-        text=source,
-    )
-    for token in tokenizer:
-        print(token, file = stderr)
+    if args.workers < 1:
+        print("--workers must be at least 1", file = stderr)
+        exit(1)
+
+    profiler = Profiler(args.cprofile, args.tracemalloc) if args.profile or args.cprofile or args.tracemalloc else None
+    try:
+        with profiler or nullcontext():
+            tokenizer = Lexer(
+                file_name = file,
+                text=source,
+                scanner=args.scanner,
+                token_cache=TokenCache(args.token_cache) if args.token_cache else None,
+                workers=args.workers,
+            )
+            if profiler:
+                profiler.watch_lexer(tokenizer)
+            # With workers all chunks are lexed before printing, otherwise tokens are printed as soon as they're found
+            for token in tokenizer.generate_tokens() if args.workers > 1 else tokenizer.iter_tokens():
+                print(token, file = stderr)
+    finally:
+        # Errors exit, what was found until then is reported too
+        if profiler:
+            print(profiler.stats().report(), file = stderr)
@@ -0,0 +1,323 @@
+#!/usr/local/bin/python3.10
+
+from typing import List, Dict, Tuple, Iterable
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from os import path, cpu_count
+from sys import stderr
+from time import perf_counter
+from functools import lru_cache
+from lexer import Lexer, Diagnostic, SCANNERS, character_span
+from parser import Parser, Statement, Compound_Statement_Import, NodeKind
+from token_cache import TokenCache
+from module_cache import ModuleCache, MISSING_FILE
+
+####################################################################################################
+
+# Module loader: a program is its main module and every module it imports, directly or not
+# Imports are resolved relative to the importing file, and each distinct file (by real path) is lexed and parsed
+# once, however many modules import it
+# Modules found at the same time (imports of one module, independent parts of the import graph) are loaded
+# in a pool of worker processes
+# Import cycles are errors, reported at the import statement closing the cycle
+# With a module cache (see module_cache.py) unchanged modules are not parsed again, their stored ASTs are loaded
+
+
+@dataclass
+class Import:
+    statement: Compound_Statement_Import
+    file: str # Real path of imported file
+    line_text: str # Line of statement, for error reports
+
+
+@dataclass
+class Module:
+    file: str
+    statements: List[Statement] = field(default_factory = list)
+    imports: List[Import] = field(default_factory = list) # Imports of existing files, in source order
+    errors: List[Diagnostic] = field(default_factory = list)
+    seconds: float = 0.0
+    cached: bool = False # Loaded from module cache, not parsed
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    @property
+    def dependencies(self) -> List[str]:
+        """
+        Files this module imports, each one once, in source order
+        """
+        return list(dict.fromkeys(imported.file for imported in self.imports))
+
+
+@dataclass
+class Program:
+    roots: List[str] # Files loading started from
+    modules: Dict[str, Module] # Every module of program, by file
+    order: List[str] # Files of modules, each one after all modules it imports (unless they're in a cycle)
+    errors: List[Diagnostic] = field(default_factory = list) # Errors of all modules, then import cycles
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def resolve_import(importing_file: str, imported_path: str) -> str:
+    """
+    Real path of file imported as imported_path by importing_file
+    """
+    return path.realpath(path.join(path.dirname(importing_file), imported_path))
+
+
+@lru_cache(maxsize = None)
+def open_module_cache(directory: str) -> ModuleCache:
+    """
+    One ModuleCache per directory and process, so what it learns (content hashes) is shared by modules
+    """
+    return ModuleCache(directory)
+
+
+def load_module(file_path: str, scanner: str = "master", token_cache_dir: str = None, module_cache_dir: str = None) -> Module:
+    """
+    Lex and parse one file, then resolve its imports
+    With module_cache_dir, the module is loaded from there if it's up to date there, and stored there if it's not
+    Runs in worker processes, so it must stay a module level function
+    """
+    start = perf_counter()
+    module_cache = open_module_cache(module_cache_dir) if module_cache_dir else None
+    if module_cache:
+        if (cached := module_cache.load(file_path)) is not None:
+            statements, imports, errors = cached
+            module = Module(file_path, statements, [Import(*imported) for imported in imports], errors, cached = True)
+            module.seconds = perf_counter() - start
+            return module
+        source = module_cache.fingerprint(file_path) # Before reading it, a file changed while it's read is not cached as unchanged
+    module = Module(file = file_path)
+    imported_files: List[str] = [] # Missing ones included
+    lexer = None
+    try:
+        lexer = Lexer(
+            file_name = file_path,
+            scanner = scanner,
+            token_cache = TokenCache(token_cache_dir) if token_cache_dir else None,
+            collect_errors = True,
+        )
+        parser = Parser(lexer_object = lexer, echo = False).parse()
+        module.statements = parser.statements
+        for statement in parser.statements:
+            if statement.kind != NodeKind.IMPORT_STATEMENT:
+                continue
+            imported = resolve_import(file_path, statement.file_path)
+            imported_files.append(imported)
+            path_token = statement.path
+            if path.isfile(imported):
+                module.imports.append(Import(statement, imported, lexer.line_text(path_token.begin_ln)))
+            else:
+                lexer.fail(
+                    parser.token_error(path_token, f"Could not open file {path_token.value}", "File Error"),
+                    (path_token.begin_idx, path_token.end_idx)
+                )
+        lexer.diagnostics.sort(key = lambda diagnostic: diagnostic.span)
+        module.errors = lexer.diagnostics
+        if module_cache and source != MISSING_FILE:
+            module_cache.store(
+                file_path,
+                source,
+                imported_files,
+                (
+                    module.statements,
+                    [(imported.statement, imported.file, imported.line_text) for imported in module.imports],
+                    module.errors
+                )
+            )
+    except OSError as error:
+        module.errors.append(
+            Diagnostic(
+                kind    = "File Error",
+                file    = file_path,
+                message = error.strerror,
+                report  = f"File Error in \"{file_path}\":\n" + " " * 4 + f"{error.strerror}",
+            )
+        )
+    finally:
+        if lexer:
+            lexer.close()
+    module.seconds = perf_counter() - start
+    return module
+
+
+class ModuleLoader:
+    def __init__(self, workers: int = None, scanner: str = "master", token_cache_dir: str = None, module_cache_dir: str = None):
+        """
+        workers: processes loading modules at the same time (default: one per CPU), 1 loads everything in this process
+        Loaded modules are kept, loading a program again (or another program sharing modules) does not reload them
+        """
+        self.workers = workers or cpu_count() or 1
+        self.scanner = scanner
+        self.token_cache_dir = token_cache_dir
+        self.module_cache_dir = module_cache_dir
+        self.modules: Dict[str, Module] = {} # Loaded modules, by real path of their files
+
+
+    def load_modules(self, files: List[str]):
+        """
+        Load files and everything they import, directly or not, skipping modules loaded before
+        While only one module can be loaded it's loaded in this process, a pool is started once there are more
+        """
+        pending: List[str] = [file_path for file_path in dict.fromkeys(files) if file_path not in self.modules]
+        queued = set(pending) # Files pending or being loaded
+        running: Dict[Future, str] = {}
+        arguments = (self.scanner, self.token_cache_dir, self.module_cache_dir)
+        stored = False # Was any module stored in module cache
+        pool = None
+        try:
+            while pending or running:
+                if pending and not running and (len(pending) == 1 or self.workers == 1):
+                    file_path = pending.pop(0)
+                    loaded = [load_module(file_path, *arguments)]
+                else:
+                    if pool is None:
+                        pool = ProcessPoolExecutor(max_workers = self.workers)
+                    for file_path in pending:
+                        running[pool.submit(load_module, file_path, *arguments)] = file_path
+                    pending.clear()
+                    done, _ = wait(running, return_when = FIRST_COMPLETED)
+                    loaded = [future.result() for future in done]
+                    for future in done:
+                        del running[future]
+                for module in loaded:
+                    self.modules[module.file] = module
+                    stored = stored or not module.cached
+                    for dependency in module.dependencies:
+                        if dependency not in self.modules and dependency not in queued:
+                            queued.add(dependency)
+                            pending.append(dependency)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures = True)
+        if self.module_cache_dir and stored:
+            open_module_cache(self.module_cache_dir).evict()
+
+
+    def cycle_error(self, imported: Import, importing_file: str, cycle: List[str]) -> Diagnostic:
+        """
+        Error of import statement imported (in importing_file) closing cycle, files of cycle in import order
+        """
+        tok = imported.statement.path
+        base = path.dirname(cycle[0])
+        message = "Circular import: " + " -> ".join(path.relpath(file_path, base) for file_path in cycle)
+        col, width = character_span(imported.line_text, tok.begin_col, len(tok.value.encode("utf-8")))
+        report = f"Import Error in \"{importing_file}\", line {tok.begin_ln + 1}, column {col + 1}:\n"
+        report += " " * 4 + message + "\n"
+        report += f"{tok.begin_ln + 1} | " + imported.line_text
+        report += " " * len(f"{tok.begin_ln + 1} | ") + " " * col + "^" * width
+        return Diagnostic(
+            kind    = "Import Error",
+            file    = importing_file,
+            line    = tok.begin_ln,
+            col     = col,
+            span    = (tok.begin_idx, tok.end_idx),
+            message = message,
+            report  = report,
+        )
+
+
+    def link(self, roots: List[str]) -> Tuple[List[str], List[Diagnostic]]:
+        """
+        Files of modules reachable from roots, each one after the modules it imports, and errors of import cycles
+        Depth first search without recursion, import chains can be long
+        """
+        order: List[str] = []
+        errors: List[Diagnostic] = []
+        state: Dict[str, bool] = {} # File => is it still on the current import chain (False once it's done)
+        for root in roots:
+            if root in state:
+                continue
+            state[root] = True
+            chain = [(root, iter(self.modules[root].imports))]
+            while chain:
+                file_path, imports = chain[-1]
+                for imported in imports:
+                    if imported.file not in state:
+                        state[imported.file] = True
+                        chain.append((imported.file, iter(self.modules[imported.file].imports)))
+                        break
+                    if state[imported.file]:
+                        files = [chain_file for chain_file, _ in chain]
+                        cycle = files[files.index(imported.file):] + [imported.file]
+                        errors.append(self.cycle_error(imported, file_path, cycle))
+                else:
+                    chain.pop()
+                    state[file_path] = False
+                    order.append(file_path)
+        return (order, errors)
+
+
+    def load(self, files: Iterable[str]) -> Program:
+        """
+        Program made of files (main modules) and everything they import
+        """
+        roots = [path.realpath(file_path) for file_path in files]
+        self.load_modules(roots)
+        order, cycle_errors = self.link(roots)
+        errors = [error for file_path in order for error in self.modules[file_path].errors]
+        return Program(
+            roots   = roots,
+            modules = {file_path: self.modules[file_path] for file_path in order},
+            order   = order,
+            errors  = errors + cycle_errors,
+        )
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    from token_cache import DEFAULT_TOKEN_CACHE_DIR
+    from module_cache import DEFAULT_MODULE_CACHE_DIR
+
+    parser = ArgumentParser(description = "Load a program: its main modules and every module they import")
+
+    parser.add_argument("files", nargs="+", help="Main modules")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--scanner", choices=SCANNERS, default="master", help="Scanner used to find tokens")
+    parser.add_argument(
+        "--token-cache",
+        nargs="?",
+        const=DEFAULT_TOKEN_CACHE_DIR,
+        metavar="DIR",
+        help=f"Reuse tokens of sources scanned before, cached in DIR (default {DEFAULT_TOKEN_CACHE_DIR})"
+    )
+    parser.add_argument(
+        "--module-cache",
+        nargs="?",
+        const=DEFAULT_MODULE_CACHE_DIR,
+        metavar="DIR",
+        help=f"Reuse modules parsed before and not changed since, cached in DIR (default {DEFAULT_MODULE_CACHE_DIR})"
+    )
+
+    args = parser.parse_args()
+
+    if args.workers is not None and args.workers < 1:
+        print("--workers must be at least 1", file = stderr)
+        exit(1)
+
+    start = perf_counter()
+    program = ModuleLoader(
+        workers = args.workers,
+        scanner = args.scanner,
+        token_cache_dir = args.token_cache,
+        module_cache_dir = args.module_cache,
+    ).load(args.files)
+    seconds = perf_counter() - start
+
+    for error in program.errors:
+        print(error, file = stderr)
+        print(file = stderr)
+
+    for file_path in program.order:
+        module = program.modules[file_path]
+        loaded = "cached" if module.cached else "parsed"
+        print(f"{file_path}: {len(module.statements)} statements, {len(module.imports)} imports, {loaded} in {module.seconds:.3f}s")
+    statements = sum(len(module.statements) for module in program.modules.values())
+    print(f"{len(program.modules)} modules, {len(program.errors)} errors, {statements} statements in {seconds:.3f}s")
+    exit(0 if program.ok else 1)
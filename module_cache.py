@@ -0,0 +1,189 @@
+#!/usr/local/bin/python3.10
+
+import struct
+import hashlib
+import pickle
+from typing import List, Tuple, Dict
+from functools import lru_cache
+from os import path, makedirs, replace, stat, utime, getpid
+from token_cache import definitions_version as token_definitions_version, evict_entries
+
+####################################################################################################
+
+# Module cache: parsed modules stored on disk (like .pyc files), so loading a program does not lex/parse
+# files that did not change since last time
+# An entry is found by the real path of a module's file, and it's used only if
+#   - it was written by the same lexer/parser (definitions version)
+#   - the file did not change: same size and modification time, or else same content hash
+#   - every file the module imports did not change either (or is still missing if it was missing)
+# Entries are binary: header, fingerprints of the file and its imports, then the pickled module
+
+
+DEFAULT_MODULE_CACHE_DIR = path.join(path.expanduser("~"), ".cache", "a-script", "modules")
+
+DEFAULT_MODULE_CACHE_SIZE = 256 * 1024 * 1024 # bytes
+
+# Entry layout:
+#   header: magic, format version, definitions version
+#   fingerprint of module file
+#   dependencies count, then for each one: path length, path (utf-8), fingerprint
+#   pickled module
+ENTRY_MAGIC = b"ASMC"
+ENTRY_FORMAT = 1
+ENTRY_HEADER = struct.Struct("<4sH16s")
+ENTRY_SUFFIX = ".asc"
+
+# Fingerprint of a file: size (-1 when missing), modification time (ns), content hash
+FINGERPRINT = struct.Struct("<qq20s")
+MISSING_FILE = (-1, 0, bytes(20))
+
+DEPENDENCIES_COUNT = struct.Struct("<I")
+DEPENDENCY_PATH_SIZE = struct.Struct("<H")
+
+
+@lru_cache(maxsize = None)
+def definitions_version() -> bytes:
+    """
+    Hash of everything that decides what a parsed module is:
+    token definitions (see token_cache.definitions_version), and the code of parser and loader
+    Computed once per process, every module loaded by a worker checks it
+    """
+    digest = hashlib.blake2b(digest_size = 16)
+    digest.update(str(ENTRY_FORMAT).encode())
+    digest.update(token_definitions_version().encode())
+    directory = path.dirname(path.abspath(__file__))
+    for module_file in ("parser.py", "loader.py"):
+        with open(path.join(directory, module_file), "rb") as code:
+            digest.update(code.read())
+    return digest.digest()
+
+
+def file_digest(file_path: str) -> bytes:
+    digest = hashlib.blake2b(digest_size = 20)
+    with open(file_path, "rb") as source:
+        digest.update(source.read())
+    return digest.digest()
+
+
+class ModuleCache:
+    def __init__(self, directory: str = DEFAULT_MODULE_CACHE_DIR, max_size: int = DEFAULT_MODULE_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size # Least recently used entries are removed when all entries take more than this
+        self.version = definitions_version()
+        # (file, size, modification time) => content hash, shared dependencies of many modules are hashed once
+        self.digests: Dict[Tuple[str, int, int], bytes] = {}
+        makedirs(self.directory, exist_ok = True)
+
+
+    def entry_path(self, file_path: str) -> str:
+        return path.join(self.directory, hashlib.blake2b(file_path.encode(), digest_size = 20).hexdigest() + ENTRY_SUFFIX)
+
+
+    def digest(self, file_path: str, size: int, modified: int) -> bytes:
+        """
+        Content hash of a file of size bytes modified at modified (ns)
+        """
+        key = (file_path, size, modified)
+        if key not in self.digests:
+            self.digests[key] = file_digest(file_path)
+        return self.digests[key]
+
+
+    def fingerprint(self, file_path: str) -> Tuple[int, int, bytes]:
+        """
+        (size, modification time, content hash) of a file, MISSING_FILE when it can't be read
+        """
+        try:
+            file_stat = stat(file_path)
+            return (file_stat.st_size, file_stat.st_mtime_ns, self.digest(file_path, file_stat.st_size, file_stat.st_mtime_ns))
+        except OSError:
+            return MISSING_FILE
+
+
+    def unchanged(self, file_path: str, recorded: Tuple[int, int, bytes]) -> bool:
+        """
+        Is file still the one recorded (a fingerprint), only hashed when its size is the same but its time is not
+        """
+        size, modified, digest = recorded
+        try:
+            file_stat = stat(file_path)
+        except OSError:
+            return size == -1
+        if size != file_stat.st_size:
+            return False
+        if modified == file_stat.st_mtime_ns:
+            return True
+        try:
+            return self.digest(file_path, file_stat.st_size, file_stat.st_mtime_ns) == digest
+        except OSError:
+            return False
+
+
+    def load(self, file_path: str):
+        """
+        Module stored for file_path (as given to store), None when there's no entry or it's out of date
+        """
+        entry_path = self.entry_path(file_path)
+        try:
+            with open(entry_path, "rb") as entry:
+                data = entry.read()
+        except OSError:
+            return None
+        try:
+            magic, entry_format, version = ENTRY_HEADER.unpack_from(data)
+            if magic != ENTRY_MAGIC or entry_format != ENTRY_FORMAT or version != self.version:
+                return None
+            offset = ENTRY_HEADER.size
+            if not self.unchanged(file_path, FINGERPRINT.unpack_from(data, offset)):
+                return None
+            offset += FINGERPRINT.size
+            (count,) = DEPENDENCIES_COUNT.unpack_from(data, offset)
+            offset += DEPENDENCIES_COUNT.size
+            for _ in range(count):
+                (size,) = DEPENDENCY_PATH_SIZE.unpack_from(data, offset)
+                offset += DEPENDENCY_PATH_SIZE.size
+                dependency = data[offset : offset + size].decode()
+                offset += size
+                if not self.unchanged(dependency, FINGERPRINT.unpack_from(data, offset)):
+                    return None
+                offset += FINGERPRINT.size
+            module = pickle.loads(data[offset:])
+        except (struct.error, UnicodeDecodeError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None # Damaged entry, or written by some other code
+        try:
+            utime(entry_path) # Most recently used
+        except OSError:
+            pass
+        return module
+
+
+    def store(self, file_path: str, source: Tuple[int, int, bytes], dependencies: List[str], module):
+        """
+        Store module (anything pickle can store) parsed from file_path, whose fingerprint was source
+        when it was read, dependencies are files it imports (missing ones included)
+        """
+        data = bytearray(ENTRY_HEADER.pack(ENTRY_MAGIC, ENTRY_FORMAT, self.version))
+        data += FINGERPRINT.pack(*source)
+        data += DEPENDENCIES_COUNT.pack(len(dependencies))
+        for dependency in dependencies:
+            encoded = dependency.encode()
+            data += DEPENDENCY_PATH_SIZE.pack(len(encoded)) + encoded
+            data += FINGERPRINT.pack(*self.fingerprint(dependency))
+        data += pickle.dumps(module, protocol = pickle.HIGHEST_PROTOCOL)
+        # Write to a temporary file first, so no one reads a half written entry
+        entry_path = self.entry_path(file_path)
+        temporary_path = entry_path + f".{getpid()}.tmp"
+        try:
+            with open(temporary_path, "wb") as entry:
+                entry.write(data)
+            replace(temporary_path, entry_path)
+        except OSError:
+            pass # A cache that can't be written is just a cold cache
+
+
+    def evict(self):
+        """
+        Remove least recently used entries until all entries take at most max_size bytes
+        Not done by store, many modules are stored at once, evict once they're all stored
+        """
+        evict_entries(self.directory, ENTRY_SUFFIX, self.max_size)
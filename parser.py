@@ -1,291 +1,1458 @@
 #!/usr/local/bin/python3.10
 
 import re
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Deque, Callable
+from collections import deque
 from dataclasses import dataclass
 from const import *
 from os import path
 from sys import stderr
-from lexer import Lexer, Token
+from lexer import Lexer, Token, SCANNERS
 
 ####################################################################################################
 
+# Tokens are told apart by kind (const.TokenKind), not by name or value
+
+STATEMENT_END_KINDS = frozenset((SEPARATOR_KINDS[";"], TokenKind.LINE_BREAK)) # Kinds of tokens ending a simple statement
+
+NOTHING_TO_PARSE_KINDS = TokenKind.LINE_BREAK | TokenKind.COMMENT # Skipped between statements, MULTI_LINED_COMMENT included
+
+# Keyword starting a statement => Parser method parsing that statement, see Parser.parse_statement
+# Statements starting with anything else are expressions
+STATEMENT_KEYWORDS = {
+    "pass": "parse_simple_statement_pass",
+    "break": "parse_simple_statement_break",
+    "continue": "parse_simple_statement_continue",
+    "import": "parse_compound_statement_import",
+    "from": "parse_compound_statement_import",
+    "define": "parse_simple_statement_define",
+    "return": "parse_simple_statement_return",
+    "function": "parse_compound_statement_function",
+    "if": "parse_compound_statement_if",
+    "for": "parse_compound_statement_for",
+    "while": "parse_compound_statement_while",
+    "struct": "parse_compound_statement_struct",
+}
+
+BLOCK_HEADER_END_KINDS = frozenset((SEPARATOR_KINDS[":"], SEPARATOR_KINDS[";"])) # Optional after a block statement header
+
+TYPE_QUALIFIER_KINDS = frozenset((KEYWORD_KINDS["const"], KEYWORD_KINDS["mut"]))
+
+####################################################################################################
+
+# Expressions are parsed by precedence (Pratt parsing), see Parser.parse_expression
+# Each operator has a binding power, an operand goes to the operator binding it more tightly
+
+# Binary operators, from loosest to tightest binding
+# Levels are the groups of const.OPERATORS, split where a group mixes precedences
+# ~ (bitwise not) and not are unary only
+BINARY_OPERATOR_LEVELS = (
+    ASSIGNMENT_OPERATORS, # Right associative, a = b = c is a = (b = c)
+    ("or",),
+    ("and",),
+    tuple(operator for operator in LOGICAL_OPERATORS if operator not in ("not", "and", "or")), # Comparisons
+    ("|",),
+    ("^",),
+    ("&",),
+    (">>", "<<"),
+    ("+", "-"),
+    ("*", "/"),
+    MEMBERSHIP_ACCESS_OPERATORS,
+)
+
+
+def operator_kinds(operator: str) -> Tuple[int, ...]:
+    """
+    Kinds of tokens of operator, not/and/or are found as keywords so they're looked up as both
+    """
+    return tuple(kind for kind in (OPERATOR_KINDS.get(operator), KEYWORD_KINDS.get(operator)) if kind)
+
+
+def binary_binding_powers() -> Dict[int, Tuple[int, int]]:
+    """
+    Token kind of each binary operator => (left binding power, right binding power)
+    Left power above right power makes an operator right associative, below makes it left associative
+    """
+    powers: Dict[int, Tuple[int, int]] = {}
+    for level, operators in enumerate(BINARY_OPERATOR_LEVELS):
+        power = 2 * level + 1
+        for operator in operators:
+            for kind in operator_kinds(operator):
+                powers[kind] = (power + 1, power) if operator in ASSIGNMENT_OPERATORS else (power, power + 1)
+    return powers
+
+
+BINARY_BINDING_POWERS = binary_binding_powers()
+
+MEMBERSHIP_ACCESS_KIND = OPERATOR_KINDS["."]
+
+# Calls, subscriptions and struct expressions bind like membership access: f(x).y[0] is ((f(x)).y)[0]
+POSTFIX_BINDING_POWER = BINARY_BINDING_POWERS[MEMBERSHIP_ACCESS_KIND][0]
+
+# Unary operator kind => binding power of its operand
+# not takes a whole comparison (not a == b is not (a == b)), others only take an operand and its postfixes
+PREFIX_BINDING_POWERS: Dict[int, int] = {
+    kind: BINARY_BINDING_POWERS[OPERATOR_KINDS["=="]][0] if operator == "not" else POSTFIX_BINDING_POWER
+    for operator in ("-", "+", "~", "&", "not")
+    for kind in operator_kinds(operator)
+}
+PREFIX_BINDING_POWERS[TokenKind.OPERATOR] = POSTFIX_BINDING_POWER # ++ and --, they're not in OPERATORS
+PREFIX_BINDING_POWERS[KEYWORD_KINDS["ref_of"]] = POSTFIX_BINDING_POWER
+
+LITERAL_CATEGORIES = TokenKind.NUMBER | TokenKind.STRING | TokenKind.CHARACTER # MULTI_LINED_STRING included
+
+BOOLEAN_KINDS = frozenset((KEYWORD_KINDS["true"], KEYWORD_KINDS["false"]))
+
+COMMA_KIND = SEPARATOR_KINDS[","]
+
+# Literal values
+NUMBER_BASES = {TokenKind.BINARY: 2, TokenKind.OCTAL: 8, TokenKind.HEXADECIMAL: 16}
+
+ESCAPE_PATTERN = re.compile(r"\\(x[0-9a-fA-F]{2}|.)", re.DOTALL)
+
+ESCAPES = {
+    "\\": "\\", "'": "'", '"': '"', "0": "\0", "a": "\a", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "v": "\v",
+    "\n": "", # String continuation, a \ at the end of a line
+}
+
+
+def unescape(text: str) -> str:
+    """
+    Text of a string/character literal (quotes excluded) with its escape sequences replaced
+    """
+    if "\\" not in text:
+        return text
+    def escape(match: re.Match) -> str:
+        sequence = match.group(1)
+        if len(sequence) == 3:
+            return chr(int(sequence[1:], 16)) # \xDD
+        return ESCAPES.get(sequence, match.group())
+    return ESCAPE_PATTERN.sub(escape, text)
+
+
+def decode_literal(kind: int, text: str):
+    """
+    Value of a literal of kind written as text: int (any base, _ separators allowed), float, bool or str (strings
+    and characters)
+    """
+    if kind in BOOLEAN_KINDS:
+        return text == "true"
+    if kind in NUMBER_BASES:
+        return int(text[2:].replace("_", ""), NUMBER_BASES[kind])
+    if kind == TokenKind.INT:
+        return int(text.replace("_", ""))
+    if kind == TokenKind.FLOAT:
+        return float(text.replace("_", ""))
+    return unescape(text[1:-1])
+
+
+# Decoded literals, (kind, text) => value
+# A literal text is decoded once (however many tokens, modules and passes have it), and equal literals share one
+# value object
+# Emptied once it holds LITERAL_VALUES_LIMIT values, long lived processes see endless distinct literals
+LITERAL_VALUES: Dict[Tuple[int, str], object] = {}
+
+LITERAL_VALUES_LIMIT = 1 << 16
+
+
+def literal_value(tok: Token):
+    """
+    Value of a literal token, see decode_literal
+    """
+    key = (tok.kind, tok.value)
+    value = LITERAL_VALUES.get(key)
+    if value is None:
+        if len(LITERAL_VALUES) >= LITERAL_VALUES_LIMIT:
+            LITERAL_VALUES.clear()
+        value = LITERAL_VALUES[key] = decode_literal(tok.kind, tok.value)
+    return value
+
+####################################################################################################
+
+# Syntax tree
+# Nodes are small, there's one per operand/operator of long (machine generated) expressions:
+# no __dict__ (__slots__), a class level kind (NodeKind), children in slots or tuples
+# Tokens a node covers are not copied into it, the node keeps their span instead:
+# indices of its first and last tokens in the token stream (lexer.tokens when lexer stored them)
+# Only tokens carrying a node's meaning are kept (a name, a literal, an operator)
+
+
+# Node kinds, ints like const.TokenKind, a category bit or'ed with a number
+class NodeKind:
+    STATEMENT  = 1 << 8
+    EXPRESSION = 1 << 9
+    PART       = 1 << 10 # Parts of statements
+
+    PASS_STATEMENT       = STATEMENT | 1
+    BREAK_STATEMENT      = STATEMENT | 2
+    CONTINUE_STATEMENT   = STATEMENT | 3
+    EXPRESSION_STATEMENT = STATEMENT | 4
+    IMPORT_STATEMENT     = STATEMENT | 5
+    DEFINE_STATEMENT     = STATEMENT | 6
+    RETURN_STATEMENT     = STATEMENT | 7
+    FUNCTION_STATEMENT   = STATEMENT | 8
+    IF_STATEMENT         = STATEMENT | 9
+    FOR_STATEMENT        = STATEMENT | 10
+    WHILE_STATEMENT      = STATEMENT | 11
+    STRUCT_STATEMENT     = STATEMENT | 12
+
+    NAME                     = EXPRESSION | 1
+    LITERAL                  = EXPRESSION | 2
+    UNARY                    = EXPRESSION | 3
+    BINARY                   = EXPRESSION | 4
+    STRUCT_MEMBERSHIP_ACCESS = EXPRESSION | 5
+    FUNCTION_CALL            = EXPRESSION | 6
+    ARRAY_SUBSCRIPTION       = EXPRESSION | 7
+    ARRAY                    = EXPRESSION | 8
+    STRUCT                   = EXPRESSION | 9
+    CONSTANT                 = EXPRESSION | 10 # Folded by folder.py
+
+    TYPE       = PART | 1
+    TYPED_NAME = PART | 2
+
+
+NODE_KIND_NAMES = {
+    NodeKind.STATEMENT: "STATEMENT",
+    NodeKind.EXPRESSION: "EXPRESSION",
+    NodeKind.PART: "PART",
+    NodeKind.PASS_STATEMENT: "STATEMENT::PASS_STATEMENT",
+    NodeKind.BREAK_STATEMENT: "STATEMENT::BREAK_STATEMENT",
+    NodeKind.CONTINUE_STATEMENT: "STATEMENT::CONTINUE_STATEMENT",
+    NodeKind.EXPRESSION_STATEMENT: "STATEMENT::EXPRESSION_STATEMENT",
+    NodeKind.IMPORT_STATEMENT: "STATEMENT::IMPORT_STATEMENT",
+    NodeKind.DEFINE_STATEMENT: "STATEMENT::DEFINE_STATEMENT",
+    NodeKind.RETURN_STATEMENT: "STATEMENT::RETURN_STATEMENT",
+    NodeKind.FUNCTION_STATEMENT: "STATEMENT::FUNCTION_STATEMENT",
+    NodeKind.IF_STATEMENT: "STATEMENT::IF_STATEMENT",
+    NodeKind.FOR_STATEMENT: "STATEMENT::FOR_STATEMENT",
+    NodeKind.WHILE_STATEMENT: "STATEMENT::WHILE_STATEMENT",
+    NodeKind.STRUCT_STATEMENT: "STATEMENT::STRUCT_STATEMENT",
+    NodeKind.NAME: "EXPRESSION::NAME",
+    NodeKind.LITERAL: "EXPRESSION::LITERAL",
+    NodeKind.UNARY: "EXPRESSION::UNARY",
+    NodeKind.BINARY: "EXPRESSION::BINARY",
+    NodeKind.STRUCT_MEMBERSHIP_ACCESS: "EXPRESSION::STRUCT_MEMBERSHIP_ACCESS",
+    NodeKind.FUNCTION_CALL: "EXPRESSION::FUNCTION_CALL",
+    NodeKind.ARRAY_SUBSCRIPTION: "EXPRESSION::ARRAY_SUBSCRIPTION",
+    NodeKind.ARRAY: "EXPRESSION::ARRAY",
+    NodeKind.STRUCT: "EXPRESSION::STRUCT",
+    NodeKind.CONSTANT: "EXPRESSION::CONSTANT",
+    NodeKind.TYPE: "PART::TYPE",
+    NodeKind.TYPED_NAME: "PART::TYPED_NAME",
+}
+
+
 class ASTNode:
-    def __init__(self):
-        self.name = ""
-        self.tokens: List[Token] = []
+    __slots__ = ("first", "last") # Span: indices of first and last tokens of this node
+    kind = 0
+
+    @property
+    def name(self) -> str:
+        return NODE_KIND_NAMES[self.kind]
 
+    @property
+    def span(self) -> Tuple[int, int]:
+        return (self.first, self.last)
 
+    @property
+    def children(self) -> Tuple["ASTNode", ...]:
+        return ()
+
+    def __repr__(self):
+        return f"<{self.name} {self.first}-{self.last}>"
+
+
+# Statements get their span from Parser.parse_statement, after they're parsed
 class Statement(ASTNode):
-    def __init__(self):
-        super().__init__()
-        self.name += "STATEMENT"
+    __slots__ = ()
+    kind = NodeKind.STATEMENT
+
 
+class Simple_Statement_Pass(Statement):
+    __slots__ = ()
+    kind = NodeKind.PASS_STATEMENT
 
-class Simple_Statement(Statement):
-    def __init__(self):
-        super().__init__()
-        self.name += "::SIMPLE_STATEMENT"
 
+class Simple_Statement_Break(Statement):
+    __slots__ = ("keyword",)
+    kind = NodeKind.BREAK_STATEMENT
 
-class Simple_Statement_Pass(Simple_Statement):
-    def __init__(self):
-        super().__init__()
-        self.name += "::PASS_STATEMNET"
+    def __init__(self, keyword: Token):
+        self.keyword = keyword
 
 
-class Simple_Statement_Break(Simple_Statement):
-    def __init__(self):
-        super().__init__()
-        self.name += "::BREAK_STATEMNET"
+class Simple_Statement_Continue(Statement):
+    __slots__ = ("keyword",)
+    kind = NodeKind.CONTINUE_STATEMENT
 
+    def __init__(self, keyword: Token):
+        self.keyword = keyword
 
-class Simple_Statement_Continue(Simple_Statement):
-    def __init__(self):
-        super().__init__()
-        self.name += "::CONTINUE_STATEMNET"
 
+class Simple_Statement_Expression(Statement):
+    __slots__ = ("expression",)
+    kind = NodeKind.EXPRESSION_STATEMENT
 
-class Compound_Statement(Statement):
-    def __init__(self):
-        super().__init__()
-        self.name += "::COMPOUND_STATEMENT"
+    def __init__(self, expression: "Expression"):
+        self.expression = expression
 
+    @property
+    def children(self) -> Tuple["ASTNode", ...]:
+        return (self.expression,)
 
+    def __repr__(self):
+        return f"<{self.name} {self.first}-{self.last} {self.expression!r}>"
 
+
+# import "file" or from "file" import items, files are loaded by loader.ModuleLoader
 class Compound_Statement_Import(Statement):
-    def __init__(self, file_path_token: Token = None, items_tokens_list: List[Token] = None):
-        super().__init__()
-        self.name += "::IMPORT_STATEMENT"
-        self.file_path_token: Token = file_path_token
-        if self.file_path_token:
-            self.file_path: str = self.file_path_token.value
-        else:
-            self.file_path: str = ""
-        self.items_tokens: List[Token] = items_tokens_list
-        if not self.items_tokens:
-            self.items_tokens = []
-        self.items: List[str] = []
-        for tok in self.items_tokens:
-            self.items.append(tok.value)
+    __slots__ = ("path", "items")
+    kind = NodeKind.IMPORT_STATEMENT
+
+    def __init__(self, path: Token, items: Tuple[Token, ...] = ()):
+        self.path = path # STRING
+        self.items = items # NAMEs, empty when whole file is imported
+
+    @property
+    def file_path(self) -> str:
+        """
+        Path written in this statement, relative to the importing file
+        """
+        return self.path.value[1:-1]
+
+    def __repr__(self):
+        return f"<{self.name} {self.first}-{self.last} {self.path.value}" + "".join(f" {item.value}" for item in self.items) + ">"
+
+
+# Blocks (bodies of compound statements) are tuples of statements
+Block = Tuple[Statement, ...]
+
+
+def block_repr(block: Block) -> str:
+    return "(" + " ".join(repr(statement) for statement in block) + ")"
+
+
+# define NAME: TYPE [:= value]
+class Simple_Statement_Define(Statement):
+    __slots__ = ("variable", "type", "value")
+    kind = NodeKind.DEFINE_STATEMENT
+
+    def __init__(self, variable: Token, type: "Type", value: "Expression" = None):
+        self.variable = variable # NAME
+        self.type = type
+        self.value = value # None when there's no initial value
+
+    @property
+    def children(self) -> Tuple[ASTNode, ...]:
+        return (self.type,) + ((self.value,) if self.value else ())
+
+    def __repr__(self):
+        value = f" {self.value!r}" if self.value else ""
+        return f"<{self.name} {self.first}-{self.last} {self.variable.value}: {self.type!r}{value}>"
+
+
+class Simple_Statement_Return(Statement):
+    __slots__ = ("keyword", "value")
+    kind = NodeKind.RETURN_STATEMENT
+
+    def __init__(self, keyword: Token, value: "Expression" = None):
+        self.keyword = keyword
+        self.value = value # None when nothing is returned
+
+    @property
+    def children(self) -> Tuple[ASTNode, ...]:
+        return (self.value,) if self.value else ()
+
+    def __repr__(self):
+        value = f" {self.value!r}" if self.value else ""
+        return f"<{self.name} {self.first}-{self.last}{value}>"
+
+
+class Compound_Statement_Function(Statement):
+    __slots__ = ("function", "parameters", "return_type", "body")
+    kind = NodeKind.FUNCTION_STATEMENT
+
+    def __init__(self, function: Token, parameters: Tuple["Typed_Name", ...], return_type: "Type", body: Block):
+        self.function = function # NAME
+        self.parameters = parameters
+        self.return_type = return_type # None when nothing is returned
+        self.body = body
+
+    @property
+    def children(self) -> Tuple[ASTNode, ...]:
+        return self.parameters + ((self.return_type,) if self.return_type else ()) + self.body
+
+    def __repr__(self):
+        parameters = ", ".join(repr(parameter) for parameter in self.parameters)
+        return_type = f" => {self.return_type!r}" if self.return_type else ""
+        return f"<{self.name} {self.first}-{self.last} {self.function.value}({parameters}){return_type} {block_repr(self.body)}>"
+
+
+# if, its else_if parts and else part
+class Compound_Statement_If(Statement):
+    __slots__ = ("conditions", "blocks", "else_block")
+    kind = NodeKind.IF_STATEMENT
+
+    def __init__(self, conditions: Tuple["Expression", ...], blocks: Tuple[Block, ...], else_block: Block = None):
+        self.conditions = conditions # Of if, then of each else_if
+        self.blocks = blocks # Block of each condition
+        self.else_block = else_block # None when there's no else
+
+    @property
+    def children(self) -> Tuple[ASTNode, ...]:
+        return self.conditions + sum(self.blocks, ()) + (self.else_block or ())
+
+    def __repr__(self):
+        parts = " ".join(f"{condition!r} {block_repr(block)}" for condition, block in zip(self.conditions, self.blocks))
+        if self.else_block is not None:
+            parts += f" else {block_repr(self.else_block)}"
+        return f"<{self.name} {self.first}-{self.last} {parts}>"
+
+
+class Compound_Statement_For(Statement):
+    __slots__ = ("variable", "iterable", "body")
+    kind = NodeKind.FOR_STATEMENT
+
+    def __init__(self, variable: Token, iterable: "Expression", body: Block):
+        self.variable = variable # NAME
+        self.iterable = iterable
+        self.body = body
+
+    @property
+    def children(self) -> Tuple[ASTNode, ...]:
+        return (self.iterable,) + self.body
+
+    def __repr__(self):
+        return f"<{self.name} {self.first}-{self.last} {self.variable.value} {self.iterable!r} {block_repr(self.body)}>"
+
+
+class Compound_Statement_While(Statement):
+    __slots__ = ("condition", "body")
+    kind = NodeKind.WHILE_STATEMENT
+
+    def __init__(self, condition: "Expression", body: Block):
+        self.condition = condition
+        self.body = body
+
+    @property
+    def children(self) -> Tuple[ASTNode, ...]:
+        return (self.condition,) + self.body
+
+    def __repr__(self):
+        return f"<{self.name} {self.first}-{self.last} {self.condition!r} {block_repr(self.body)}>"
+
+
+class Compound_Statement_Struct(Statement):
+    __slots__ = ("struct", "members")
+    kind = NodeKind.STRUCT_STATEMENT
+
+    def __init__(self, struct: Token, members: Tuple["Typed_Name", ...]):
+        self.struct = struct # NAME
+        self.members = members
+
+    @property
+    def children(self) -> Tuple[ASTNode, ...]:
+        return self.members
+
+    def __repr__(self):
+        members = ", ".join(repr(member) for member in self.members)
+        return f"<{self.name} {self.first}-{self.last} {self.struct.value} {{{members}}}>"
+
+
+# Types: [const | mut] (primitive type | struct name | array(TYPE, size, ...)) [&]
+class Type(ASTNode):
+    __slots__ = ("qualifier", "base", "element", "sizes", "reference")
+    kind = NodeKind.TYPE
+
+    def __init__(self, first: int, last: int, qualifier: Token, base: Token, element: "Type", sizes: Tuple[Token, ...], reference: bool):
+        self.first = first
+        self.last = last
+        self.qualifier = qualifier # const/mut keyword, None when immutable
+        self.base = base # DATA_TYPE keyword (array included) or NAME of a struct
+        self.element = element # Type of array items, None when it's not an array (or just array)
+        self.sizes = sizes # Size of each dimension of an array, INT tokens
+        self.reference = reference # Ends with &
+
+    @property
+    def mutable(self) -> bool:
+        return self.qualifier is not None and self.qualifier.value == "mut"
+
+    @property
+    def constant(self) -> bool:
+        return self.qualifier is not None and self.qualifier.value == "const"
+
+    @property
+    def children(self) -> Tuple[ASTNode, ...]:
+        return (self.element,) if self.element else ()
+
+    def __repr__(self):
+        text = f"{self.qualifier.value} " if self.qualifier else ""
+        text += self.base.value
+        if self.element:
+            text += f"({self.element!r}" + "".join(f", {size.value}" for size in self.sizes) + ")"
+        return text + "&" * self.reference
+
+
+# NAME: TYPE, a parameter or a struct member
+class Typed_Name(ASTNode):
+    __slots__ = ("identifier", "type")
+    kind = NodeKind.TYPED_NAME
+
+    def __init__(self, first: int, identifier: Token, type: Type):
+        self.first = first
+        self.last = type.last
+        self.identifier = identifier # NAME
+        self.type = type
+
+    @property
+    def children(self) -> Tuple[ASTNode, ...]:
+        return (self.type,)
+
+    def __repr__(self):
+        return f"{self.identifier.value}: {self.type!r}"
+
+
+# Expressions know their span when they're made, from their tokens and children
+# repr is the expression in prefix notation, like (+ a (* b c))
+class Expression(ASTNode):
+    __slots__ = ("token",)
+    kind = NodeKind.EXPRESSION
+
+
+class Name_Expression(Expression):
+    __slots__ = ()
+    kind = NodeKind.NAME
+
+    def __init__(self, index: int, token: Token):
+        self.first = self.last = index
+        self.token = token
+
+    def __repr__(self):
+        return self.token.value
+
+
+class Literal_Expression(Expression):
+    __slots__ = ()
+    kind = NodeKind.LITERAL
+
+    def __init__(self, index: int, token: Token):
+        self.first = self.last = index
+        self.token = token
+
+    @property
+    def value(self):
+        return literal_value(self.token)
+
+    def __repr__(self):
+        return self.token.value
+
+
+# Value of an expression known at compile time (see folder.py), an int, float, bool or str
+class Constant_Expression(Expression):
+    __slots__ = ("value",)
+    kind = NodeKind.CONSTANT
+
+    def __init__(self, first: int, last: int, token: Token, value):
+        self.first = first
+        self.last = last
+        self.token = token # First token of folded expression
+        self.value = value
+
+    def __repr__(self):
+        if isinstance(self.value, bool):
+            return "true" if self.value else "false"
+        return repr(self.value)
+
+
+class Unary_Expression(Expression):
+    __slots__ = ("operand",)
+    kind = NodeKind.UNARY
+
+    def __init__(self, index: int, token: Token, operand: Expression):
+        self.first = index
+        self.last = operand.last
+        self.token = token # Operator
+        self.operand = operand
+
+    @property
+    def children(self) -> Tuple[ASTNode, ...]:
+        return (self.operand,)
+
+    def __repr__(self):
+        return f"({self.token.value} {self.operand!r})"
+
+
+class Binary_Expression(Expression):
+    __slots__ = ("left", "right")
+    kind = NodeKind.BINARY
+
+    def __init__(self, token: Token, left: Expression, right: Expression):
+        self.first = left.first
+        self.last = right.last
+        self.token = token # Operator
+        self.left = left
+        self.right = right
+
+    @property
+    def children(self) -> Tuple[ASTNode, ...]:
+        return (self.left, self.right)
+
+    def __repr__(self):
+        return f"({self.token.value} {self.left!r} {self.right!r})"
+
+
+class Membership_Access_Expression(Expression):
+    __slots__ = ("struct", "member")
+    kind = NodeKind.STRUCT_MEMBERSHIP_ACCESS
+
+    def __init__(self, last: int, token: Token, struct: Expression, member: Token):
+        self.first = struct.first
+        self.last = last
+        self.token = token # .
+        self.struct = struct
+        self.member = member # NAME
+
+    @property
+    def children(self) -> Tuple[ASTNode, ...]:
+        return (self.struct,)
+
+    def __repr__(self):
+        return f"(. {self.struct!r} {self.member.value})"
+
+
+class Function_Call_Expression(Expression):
+    __slots__ = ("function", "arguments")
+    kind = NodeKind.FUNCTION_CALL
+
+    def __init__(self, last: int, token: Token, function: Expression, arguments: Tuple[Expression, ...]):
+        self.first = function.first
+        self.last = last
+        self.token = token # (
+        self.function = function
+        self.arguments = arguments
+
+    @property
+    def children(self) -> Tuple[ASTNode, ...]:
+        return (self.function,) + self.arguments
+
+    def __repr__(self):
+        return f"(call {self.function!r}" + "".join(f" {argument!r}" for argument in self.arguments) + ")"
+
+
+class Array_Subscription_Expression(Expression):
+    __slots__ = ("array", "index")
+    kind = NodeKind.ARRAY_SUBSCRIPTION
+
+    def __init__(self, last: int, token: Token, array: Expression, index: Expression):
+        self.first = array.first
+        self.last = last
+        self.token = token # [
+        self.array = array
+        self.index = index
+
+    @property
+    def children(self) -> Tuple[ASTNode, ...]:
+        return (self.array, self.index)
+
+    def __repr__(self):
+        return f"([] {self.array!r} {self.index!r})"
+
+
+class Array_Expression(Expression):
+    __slots__ = ("items",)
+    kind = NodeKind.ARRAY
+
+    def __init__(self, first: int, last: int, token: Token, items: Tuple[Expression, ...]):
+        self.first = first
+        self.last = last
+        self.token = token # [
+        self.items = items
+
+    @property
+    def children(self) -> Tuple[ASTNode, ...]:
+        return self.items
+
+    def __repr__(self):
+        return "[" + ", ".join(repr(item) for item in self.items) + "]"
+
+
+class Struct_Expression(Expression):
+    __slots__ = ("struct", "members", "values")
+    kind = NodeKind.STRUCT
+
+    def __init__(self, last: int, token: Token, struct: Expression, members: Tuple[Token, ...], values: Tuple[Expression, ...]):
+        self.first = struct.first
+        self.last = last
+        self.token = token # {
+        self.struct = struct # NAME of struct
+        self.members = members # Member NAMEs
+        self.values = values # Value of each member
+
+    @property
+    def children(self) -> Tuple[ASTNode, ...]:
+        return (self.struct,) + self.values
+
+    def __repr__(self):
+        return f"{self.struct!r} {{" + ", ".join(f"{member.value}: {value!r}" for member, value in zip(self.members, self.values)) + "}"
+
+
+def first_token(node: ASTNode) -> Token:
+    """
+    Token errors about an expression point at
+    """
+    while not isinstance(node, (Name_Expression, Literal_Expression, Constant_Expression, Unary_Expression, Array_Expression)):
+        node = node.left if isinstance(node, Binary_Expression) else node.children[0]
+    return node.token
 
 
 # Parser: do syntax analysis then outputs syntax tree
 class Parser:
-    def __init__(self, lexer_object = None):
+    def __init__(self, lexer_object = None, echo: bool = True):
+        """
+        When echo is True, each parsed statement is printed with its span (and expression tree)
+        Errors exit unless lexer was made with exit_on_error = False, then they raise SourceError, see Lexer.fail
+        When lexer collects errors (collect_errors = True) so does the parser, in the same list (self.diagnostics)
+        and parsing goes on from the next statement
+        """
         self.lexer: Lexer = lexer_object
-        self.pos = 0
+        self.echo = echo
+        self.statements: List[Statement] = [] # All parsed statements, in source order
+        self.diagnostics = self.lexer.diagnostics
+        # Leading token kind => method parsing the statement it starts, see parse_statement
+        self.statement_parsers: Dict[int, Callable[[], Tuple[str, Statement]]] = {
+            KEYWORD_KINDS[keyword]: getattr(self, method) for keyword, method in STATEMENT_KEYWORDS.items()
+        }
+        # Where tokens come from: lexer's stored tokens if it already generated them,
+        # otherwise they're scanned lazily while parsing, so only a small window of tokens is alive at a time
+        self.token_stream = iter(self.lexer.tokens) if self.lexer.done else self.lexer.iter_tokens()
+        self.lookahead: Deque[Token] = deque() # Tokens read from token_stream but not consumed yet, lookahead[0] is current token
+        self.pos = 0 # Index of current token in token stream
+        self.bracket_depth = 0 # Brackets opened in current expression, line breaks inside them are not statement ends
         self.update_current_token()
         self.done = False
 
 
+    def peek(self, k: int = 0) -> Token:
+        """
+        Token k steps after current token (k = 0 is current token), None when token stream is exhausted
+        """
+        while len(self.lookahead) <= k:
+            tok = next(self.token_stream, None)
+            if tok is None:
+                return None
+            self.lookahead.append(tok)
+        return self.lookahead[k]
+
+
     def update_current_token(self):
-        if self.pos < len(self.lexer.tokens):
-            self.current_token = self.lexer.tokens[self.pos]
-        else:
-            self.current_token = None
+        self.current_token = self.peek(0)
         return self
 
 
     def advance(self):
+        if self.lookahead:
+            self.lookahead.popleft()
         self.pos += 1
         self.update_current_token()
         return self
 
 
-    def parse_simple_statement_pass(self):
-        error = ""
-        pass_ast = Simple_Statement_Pass()
-        failed = True
-        if self.current_token.value == "pass":
-            pass_ast.tokens.append(self.current_token) # Add keyword (pass) token
+    def skip_statement(self):
+        """
+        Resync after an error: skip tokens until the end of current statement, that's a ; or a line break
+        outside brackets, both are skipped too
+        """
+        depth = self.bracket_depth # Brackets opened while skipping, including those opened before the error
+        self.bracket_depth = 0
+        while self.current_token and self.current_token.kind != TokenKind.EOF:
+            tok = self.current_token
             self.advance()
-            if self.current_token:
-                if self.current_token.value not in (";", "\n"):
-                    error += f"Syntax Error in \"{self.lexer.file}\", "
-                    error += f"line {self.current_token.begin_ln + 1}, column {self.current_token.begin_col + 1}:\n"
-                    error += " " * 4 + "Unexpected token\n"
-                    error += f"{self.current_token.begin_ln + 1} | " + self.lexer.lines[self.current_token.begin_ln].value
-                    error += " " * len(f"{self.current_token.begin_ln + 1} | ")
-                    error += " " * self.current_token.begin_col + "^" * len(self.current_token.value)
-                    pass_ast = None
-                else:
-                    pass_ast.tokens.append(self.current_token)
-                    self.advance()
-                    failed = False
-        else:
-            pass_ast = None
-        return (error, pass_ast, failed)
+            if tok.kind in OPENING_BRACKET_KINDS:
+                depth += 1
+            elif tok.kind in CLOSING_BRACKET_KINDS:
+                depth = max(depth - 1, 0)
+            elif tok.kind in STATEMENT_END_KINDS and not depth:
+                break
+
+
+    def token_error(self, tok: Token, message: str, kind: str = "Syntax Error") -> str:
+        """
+        Error report pointing at tok
+        """
+        error = f"{kind} in \"{self.lexer.file}\", "
+        error += f"line {tok.begin_ln + 1}, column {tok.begin_col + 1}:\n"
+        error += " " * 4 + message + "\n"
+        error += f"{tok.begin_ln + 1} | " + self.lexer.line_text(tok.begin_ln)
+        error += " " * len(f"{tok.begin_ln + 1} | ")
+        error += " " * tok.begin_col + "^" * max(self.lexer.width(tok.value.partition("\n")[0]), 1)
+        return error
 
 
-    def parse_simple_statement_break(self):
-        error = ""
-        break_ast = Simple_Statement_Break()
-        failed = True
-        if self.current_token.value == "break":
-            break_ast.tokens.append(self.current_token) # Add keyword (break) token
+    def unexpected_token_error(self, message: str = "Unexpected token") -> str:
+        """
+        Syntax error pointing at current token
+        """
+        return self.token_error(self.current_token, message)
+
+
+    def node_tokens(self, node: ASTNode) -> List[Token]:
+        """
+        Tokens in span of node, only when lexer kept its tokens (generate_tokens() before parsing)
+        """
+        return self.lexer.tokens[node.first : node.last + 1]
+
+
+    def parse_statement_end(self) -> str:
+        """
+        A simple statement ends with ; or a line break (maybe after a comment), move past it
+        Returns an error if current token is neither
+        """
+        while self.current_token and self.current_token.kind & TokenKind.COMMENT:
             self.advance()
-            if self.current_token:
-                if self.current_token.value not in (";", "\n"):
-                    error += f"Syntax Error in \"{self.lexer.file}\", "
-                    error += f"line {self.current_token.begin_ln + 1}, column {self.current_token.begin_col + 1}:\n"
-                    error += " " * 4 + "Unexpected token\n"
-                    error += f"{self.current_token.begin_ln + 1} | " + self.lexer.lines[self.current_token.begin_ln].value
-                    error += " " * len(f"{self.current_token.begin_ln + 1} | ")
-                    error += " " * self.current_token.begin_col + "^" * len(self.current_token.value)
-                    break_ast = None
-                else:
-                    break_ast.tokens.append(self.current_token)
-                    self.advance()
-                    failed = False
-        else:
-            break_ast = None
-        return (error, break_ast, failed)
+        if self.current_token and self.current_token.kind not in STATEMENT_END_KINDS:
+            return self.unexpected_token_error()
+        if self.current_token:
+            self.advance()
+        return ""
+
+
+    def parse_simple_statement_pass(self) -> Tuple[str, Simple_Statement_Pass]:
+        self.advance() # Skip keyword (pass)
+        if error := self.parse_statement_end():
+            return (error, None)
+        return ("", Simple_Statement_Pass())
 
 
-    def parse_simple_statement_continue(self):
-        error = ""
-        continue_ast = Simple_Statement_Continue()
-        failed = True
-        if self.current_token.value == "continue":
-            continue_ast.tokens.append(self.current_token) # Add keyword (continue) token
+    def parse_simple_statement_break(self) -> Tuple[str, Simple_Statement_Break]:
+        keyword = self.current_token
+        self.advance() # Skip keyword (break)
+        if error := self.parse_statement_end():
+            return (error, None)
+        return ("", Simple_Statement_Break(keyword))
+
+
+    def parse_simple_statement_continue(self) -> Tuple[str, Simple_Statement_Continue]:
+        keyword = self.current_token
+        self.advance() # Skip keyword (continue)
+        if error := self.parse_statement_end():
+            return (error, None)
+        return ("", Simple_Statement_Continue(keyword))
+
+
+    def skip_line_breaks(self):
+        """
+        Inside brackets an expression goes on over line breaks (and comments)
+        """
+        while self.bracket_depth and self.current_token.kind & NOTHING_TO_PARSE_KINDS:
             self.advance()
-            if self.current_token:
-                if self.current_token.value not in (";", "\n"):
-                    error += f"Syntax Error in \"{self.lexer.file}\", "
-                    error += f"line {self.current_token.begin_ln + 1}, column {self.current_token.begin_col + 1}:\n"
-                    error += " " * 4 + "Unexpected token\n"
-                    error += f"{self.current_token.begin_ln + 1} | " + self.lexer.lines[self.current_token.begin_ln].value
-                    error += " " * len(f"{self.current_token.begin_ln + 1} | ")
-                    error += " " * self.current_token.begin_col + "^" * len(self.current_token.value)
-                    continue_ast = None
-                else:
-                    continue_ast.tokens.append(self.current_token) # include ;
-                    self.advance()
-                    if self.current_token.value == "\n": # include (\n) if possible
-                        continue_ast.tokens.append(self.current_token)
-                        self.advance()
-                    failed = False
-        else:
-            continue_ast = None
-        return (error, continue_ast, failed)
 
 
-    def parse_simple_statement(self) -> Tuple[str, Simple_Statement, bool]: # Error, AST, Failed to parse simple statement
-        pass_error, pass_ast, failed_to_parse_pass = self.parse_simple_statement_pass()
-        if pass_error:
-            return (pass_error, None, True)
-        else:
-            if failed_to_parse_pass:
-                break_error, break_ast, failed_to_parse_break = self.parse_simple_statement_break()
-                if break_error:
-                    return (break_error, None, True)
-                else:
-                    if failed_to_parse_break:
-                        continue_error, continue_ast, failed_to_parse_continue = self.parse_simple_statement_continue()
-                        if continue_error:
-                            return (continue_error, None, True)
-                        else:
-                            if failed_to_parse_continue:
-                                pass
-                            else:
-                                return ("", continue_ast, False)
-                    else:
-                        return ("", break_ast, False)
-            else:
-                return ("", pass_ast, False)
-        pass
+    def parse_expressions_list(self, closing: str) -> Tuple[str, Tuple[Expression, ...]]:
+        """
+        Comma separated expressions after an opening bracket (current token), until the closing bracket
+        A trailing comma is allowed, both brackets are consumed, self.pos - 1 is index of the closing one
+        """
+        closing_kind = SEPARATOR_KINDS[closing]
+        self.bracket_depth += 1
+        self.advance()
+        items: List[Expression] = []
+        self.skip_line_breaks()
+        while self.current_token.kind != closing_kind:
+            error, item = self.parse_expression()
+            if error:
+                return (error, None)
+            items.append(item)
+            self.skip_line_breaks()
+            if self.current_token.kind != COMMA_KIND:
+                break
+            self.advance()
+            self.skip_line_breaks()
+        if self.current_token.kind != closing_kind:
+            return (self.unexpected_token_error(f"Expected , or {closing}"), None)
+        self.advance()
+        self.bracket_depth -= 1
+        return ("", tuple(items))
 
 
-    def parse_compound_statement_import(self):
-        error = ""
-        import_ast = None
-        failed = True
-        if self.current_token.value == "import":
-            # Attemp to parse path to file
-            import_token = self.current_token
+    def parse_struct_expression(self, struct: Expression) -> Tuple[str, Struct_Expression]:
+        """
+        NAME { member: value, ... } with current token the {
+        """
+        opening_token = self.current_token
+        closing_kind = SEPARATOR_KINDS["}"]
+        self.bracket_depth += 1
+        self.advance()
+        members: List[Token] = []
+        values: List[Expression] = []
+        self.skip_line_breaks()
+        while self.current_token.kind != closing_kind:
+            member = self.current_token
+            if member.kind != TokenKind.NAME:
+                return (self.unexpected_token_error("Expected member name"), None)
             self.advance()
-            if MULTI_LINED_STRING_PATTERN.match(self.current_token.value):
-                try:
-                    open(self.current_token.value)
-                    import_ast = Compound_Statement_Import()
-                    import_ast.tokens.append(import_token)
-                    failed = False
-                except:
-                    # Could not open file
-                    error += f"File Error in \"{self.lexer.file}\", "
-                    error += f"line {self.current_token.begin_ln + 1}, column {self.current_token.begin_col + 1}:\n"
-                    error += " " * 4 + f"Could not open file {self.current_token.value}\n"
-                    error += f"{self.current_token.begin_ln + 1} | " + self.lexer.lines[self.current_token.begin_ln].value
-                    error += " " * len(f"{self.current_token.begin_ln + 1} | ")
-                    error += " " * self.current_token.begin_col
-                    error += " " * int(self.current_token.value in ("\a", "\b", "\f", "\n", "\r", "\t", "\v"))
-                    error += "^" * len(self.current_token.value)
-                    import_ast = None
-            else:
-                # Syntax Error, expected string
-                error += f"Syntax Error in \"{self.lexer.file}\", "
-                error += f"line {self.current_token.begin_ln + 1}, column {self.current_token.begin_col + 1}:\n"
-                error += " " * 4 + "Expected path to file ( something like \"path\\to\\file\" )\n"
-                error += f"{self.current_token.begin_ln + 1} | " + self.lexer.lines[self.current_token.begin_ln].value
-                error += " " * len(f"{self.current_token.begin_ln + 1} | ")
-                error += " " * self.current_token.begin_col
-                error += " " * int(self.current_token.value in ("\a", "\b", "\f", "\n", "\r", "\t", "\v"))
-                error += "^" * len(self.current_token.value)
-                import_ast = None
-        return (error, import_ast, failed)
-
-    def parse_compound_statement(self) -> Tuple[str, Compound_Statement, bool]:
-        import_error, import_ast, failed_to_parse_import = self.parse_compound_statement_import()
-        if import_error:
-            return (import_error, None, True)
-        else:
-            if failed_to_parse_import:
-                pass
-            else:
-                return ("", import_ast, False)
-        return None
+            self.skip_line_breaks()
+            if self.current_token.kind != SEPARATOR_KINDS[":"]:
+                return (self.unexpected_token_error("Expected :"), None)
+            self.advance()
+            error, value = self.parse_expression()
+            if error:
+                return (error, None)
+            members.append(member)
+            values.append(value)
+            self.skip_line_breaks()
+            if self.current_token.kind != COMMA_KIND:
+                break
+            self.advance()
+            self.skip_line_breaks()
+        if self.current_token.kind != closing_kind:
+            return (self.unexpected_token_error("Expected , or }"), None)
+        last = self.pos
+        self.advance()
+        self.bracket_depth -= 1
+        return ("", Struct_Expression(last, opening_token, struct, tuple(members), tuple(values)))
 
 
-    def parse_statement(self) -> Tuple[str, Statement]: # Error, AST Tree
-        while self.current_token:
-            simple_statement = self.parse_simple_statement()
-            if simple_statement:
-                simple_error, simple_ast, simple_failed = simple_statement
-                if simple_error:
-                    return (simple_error, None)
-                else:
-                    return ("", simple_ast)
-            else:
-                compound_statement = self.parse_compound_statement()
-                if compound_statement:
-                    compound_error, compound_ast, compound_failed = compound_statement
-                    if compound_error:
-                        return (compound_error, None)
-                    else:
-                        return ("", compound_ast)
-                else:
-                    break
-        return ("", None)
+    def parse_operand(self) -> Tuple[str, Expression]:
+        """
+        Expression an operator applies to: name, literal, unary operation, (expression) or array [a, b, ...]
+        """
+        self.skip_line_breaks()
+        tok = self.current_token
+        kind = tok.kind
+        first = self.pos
+        if kind == TokenKind.NAME:
+            self.advance()
+            return ("", Name_Expression(first, tok))
+        if kind & LITERAL_CATEGORIES or kind in BOOLEAN_KINDS:
+            self.advance()
+            return ("", Literal_Expression(first, tok))
+        if kind in PREFIX_BINDING_POWERS:
+            self.advance()
+            error, operand = self.parse_expression(PREFIX_BINDING_POWERS[kind])
+            if error:
+                return (error, None)
+            return ("", Unary_Expression(first, tok, operand))
+        if kind == SEPARATOR_KINDS["("]:
+            self.bracket_depth += 1
+            self.advance()
+            error, expression = self.parse_expression()
+            if error:
+                return (error, None)
+            self.skip_line_breaks()
+            if self.current_token.kind != SEPARATOR_KINDS[")"]:
+                return (self.unexpected_token_error("Expected )"), None)
+            # Brackets are part of the expression they group
+            expression.first = first
+            expression.last = self.pos
+            self.advance()
+            self.bracket_depth -= 1
+            return ("", expression)
+        if kind == SEPARATOR_KINDS["["]:
+            error, items = self.parse_expressions_list("]")
+            if error:
+                return (error, None)
+            return ("", Array_Expression(first, self.pos - 1, tok, items))
+        return (self.unexpected_token_error(), None)
 
 
-    def parse(self):
-        if not self.done:
-            while self.current_token:
-                if self.current_token.name == "EOF" and self.current_token.end_idx == len(self.lexer.source):
+    def parse_expression(self, min_power: int = 0) -> Tuple[str, Expression]:
+        """
+        An operand followed by operators binding at least min_power (and their operands)
+        Operators of the same or looser binding are left for the caller, so one left to right pass
+        builds the whole tree, recursing only when a tighter (or right associative) operator follows
+        """
+        error, left = self.parse_operand()
+        if error:
+            return (error, None)
+        while True:
+            self.skip_line_breaks()
+            tok = self.current_token
+            kind = tok.kind
+            if kind in BINARY_BINDING_POWERS:
+                left_power, right_power = BINARY_BINDING_POWERS[kind]
+                if left_power < min_power:
                     break
+                self.advance()
+                if kind == MEMBERSHIP_ACCESS_KIND:
+                    self.skip_line_breaks()
+                    if self.current_token.kind != TokenKind.NAME:
+                        return (self.unexpected_token_error("Expected member name"), None)
+                    left = Membership_Access_Expression(self.pos, tok, left, self.current_token)
+                    self.advance()
+                    continue
+                error, right = self.parse_expression(right_power)
+                if error:
+                    return (error, None)
+                left = Binary_Expression(tok, left, right)
+            elif POSTFIX_BINDING_POWER < min_power:
+                break
+            elif kind == SEPARATOR_KINDS["("]:
+                error, arguments = self.parse_expressions_list(")")
+                if error:
+                    return (error, None)
+                left = Function_Call_Expression(self.pos - 1, tok, left, arguments)
+            elif kind == SEPARATOR_KINDS["["]:
+                self.bracket_depth += 1
+                self.advance()
+                error, index = self.parse_expression()
+                if error:
+                    return (error, None)
+                self.skip_line_breaks()
+                if self.current_token.kind != SEPARATOR_KINDS["]"]:
+                    return (self.unexpected_token_error("Expected ]"), None)
+                left = Array_Subscription_Expression(self.pos, tok, left, index)
+                self.advance()
+                self.bracket_depth -= 1
+            elif kind == SEPARATOR_KINDS["{"] and type(left) is Name_Expression:
+                error, left = self.parse_struct_expression(left)
+                if error:
+                    return (error, None)
+            else:
+                break
+        return ("", left)
+
+
+    def parse_expression_statement(self) -> Tuple[str, Simple_Statement_Expression]:
+        """
+        Any statement not starting with a keyword of STATEMENT_KEYWORDS is an expression
+        """
+        self.bracket_depth = 0
+        error, expression = self.parse_expression()
+        if error:
+            return (error, None)
+        if error := self.parse_statement_end():
+            return (error, None)
+        return ("", Simple_Statement_Expression(expression))
+
+
+    def parse_import_items(self) -> Tuple[str, Tuple[Token, ...]]:
+        """
+        Names imported by from "file" import ..., either item0, item1 or { item0, item1 }
+        Braced names may go over lines, a trailing comma is allowed
+        """
+        braced = self.current_token.kind == SEPARATOR_KINDS["{"]
+        if braced:
+            self.bracket_depth += 1
+            self.advance()
+            self.skip_line_breaks()
+        items: List[Token] = []
+        while self.current_token.kind == TokenKind.NAME:
+            items.append(self.current_token)
+            self.advance()
+            self.skip_line_breaks()
+            if self.current_token.kind != COMMA_KIND:
+                break
+            self.advance()
+            self.skip_line_breaks()
+        if not items:
+            return (self.unexpected_token_error("Expected name of imported item"), None)
+        if braced:
+            if self.current_token.kind != SEPARATOR_KINDS["}"]:
+                return (self.unexpected_token_error("Expected , or }"), None)
+            self.advance()
+            self.bracket_depth -= 1
+        return ("", tuple(items))
+
+
+    def parse_compound_statement_import(self) -> Tuple[str, Compound_Statement_Import]:
+        """
+        import "file" or from "file" import items
+        Only syntax is checked here, loader.ModuleLoader finds and loads files
+        """
+        from_import = self.current_token.kind == KEYWORD_KINDS["from"]
+        self.bracket_depth = 0
+        self.advance() # Skip keyword (import/from)
+        if not self.current_token.kind & TokenKind.STRING:
+            return (self.unexpected_token_error("Expected path to file ( something like \"path\\to\\file\" )"), None)
+        path_token = self.current_token
+        self.advance()
+        items = ()
+        if from_import:
+            if self.current_token.kind != KEYWORD_KINDS["import"]:
+                return (self.unexpected_token_error("Expected import"), None)
+            self.advance()
+            error, items = self.parse_import_items()
+            if error:
+                return (error, None)
+        if error := self.parse_statement_end():
+            return (error, None)
+        return ("", Compound_Statement_Import(path_token, items))
+
+
+    def parse_type(self) -> Tuple[str, Type]:
+        """
+        [const | mut] (primitive type | struct name | array[(TYPE, size, ...)]) [&]
+        """
+        first = self.pos
+        qualifier = None
+        if self.current_token.kind in TYPE_QUALIFIER_KINDS:
+            qualifier = self.current_token
+            self.advance()
+        base = self.current_token
+        if base.kind != TokenKind.NAME and base.kind & ~KIND_INDEX_MASK != TokenKind.DATA_TYPE:
+            return (self.unexpected_token_error("Expected type"), None)
+        self.advance()
+        element = None
+        sizes: List[Token] = []
+        if base.kind == KEYWORD_KINDS["array"] and self.current_token.kind == SEPARATOR_KINDS["("]:
+            self.bracket_depth += 1
+            self.advance()
+            self.skip_line_breaks()
+            error, element = self.parse_type()
+            if error:
+                return (error, None)
+            self.skip_line_breaks()
+            while self.current_token.kind == COMMA_KIND:
+                self.advance()
+                self.skip_line_breaks()
+                if self.current_token.kind != TokenKind.INT:
+                    return (self.unexpected_token_error("Expected array size"), None)
+                sizes.append(self.current_token)
+                self.advance()
+                self.skip_line_breaks()
+            if not sizes:
+                return (self.unexpected_token_error("Expected , and array size"), None)
+            if self.current_token.kind != SEPARATOR_KINDS[")"]:
+                return (self.unexpected_token_error("Expected , or )"), None)
+            self.advance()
+            self.bracket_depth -= 1
+        reference = self.current_token.kind == OPERATOR_KINDS["&"]
+        if reference:
+            self.advance()
+        return ("", Type(first, self.pos - 1, qualifier, base, element, tuple(sizes), reference))
+
+
+    def parse_typed_name(self) -> Tuple[str, Typed_Name]:
+        """
+        NAME: TYPE
+        """
+        first = self.pos
+        name = self.current_token
+        if name.kind != TokenKind.NAME:
+            return (self.unexpected_token_error("Expected name"), None)
+        self.advance()
+        if self.current_token.kind != SEPARATOR_KINDS[":"]:
+            return (self.unexpected_token_error("Expected :"), None)
+        self.advance()
+        error, name_type = self.parse_type()
+        if error:
+            return (error, None)
+        return ("", Typed_Name(first, name, name_type))
+
+
+    def parse_simple_statement_define(self) -> Tuple[str, Simple_Statement_Define]:
+        """
+        define NAME: TYPE [(:= | =) EXPRESSION]
+        """
+        self.bracket_depth = 0
+        self.advance() # Skip keyword (define)
+        error, typed_name = self.parse_typed_name()
+        if error:
+            return (error, None)
+        value = None
+        if self.current_token.kind in (OPERATOR_KINDS[":="], OPERATOR_KINDS["="]):
+            self.advance()
+            error, value = self.parse_expression()
+            if error:
+                return (error, None)
+        if error := self.parse_statement_end():
+            return (error, None)
+        return ("", Simple_Statement_Define(typed_name.identifier, typed_name.type, value))
+
+
+    def parse_simple_statement_return(self) -> Tuple[str, Simple_Statement_Return]:
+        self.bracket_depth = 0
+        keyword = self.current_token
+        self.advance() # Skip keyword (return)
+        value = None
+        if not self.current_token.kind & (TokenKind.COMMENT | TokenKind.EOF) and self.current_token.kind not in STATEMENT_END_KINDS:
+            error, value = self.parse_expression()
+            if error:
+                return (error, None)
+        if error := self.parse_statement_end():
+            return (error, None)
+        return ("", Simple_Statement_Return(keyword, value))
+
+
+    def parse_block_header_end(self) -> str:
+        """
+        A block statement header ends with an optional : or ; then a line break
+        """
+        if self.current_token.kind in BLOCK_HEADER_END_KINDS:
+            self.advance()
+        while self.current_token.kind & TokenKind.COMMENT:
+            self.advance()
+        if self.current_token.kind != TokenKind.LINE_BREAK:
+            return self.unexpected_token_error("Expected end of line")
+        self.advance()
+        return ""
+
+
+    def parse_block(self) -> Tuple[str, Block]:
+        """
+        Statements of an indented block, after its header
+        The block ends at the outdent of its last line, which is consumed too
+        """
+        error = self.parse_block_header_end()
+        if error:
+            return (error, None)
+        while self.current_token.kind & NOTHING_TO_PARSE_KINDS:
+            self.advance()
+        if self.current_token.kind != TokenKind.INDENT:
+            return (self.unexpected_token_error("Expected an indented block"), None)
+        self.advance()
+        statements: List[Statement] = []
+        self.parse_statements(statements, in_block = True)
+        if self.current_token.kind != TokenKind.OUTDENT:
+            return (self.unexpected_token_error("Expected end of block"), None)
+        self.advance()
+        return ("", tuple(statements))
+
+
+    def parse_block_end(self) -> str:
+        """
+        end [STRING], closing a block statement
+        """
+        if self.current_token.kind != KEYWORD_KINDS["end"]:
+            return self.unexpected_token_error("Expected end")
+        self.advance()
+        if self.current_token.kind & TokenKind.STRING:
+            self.advance()
+        return self.parse_statement_end()
+
+
+    def parse_compound_statement_function(self) -> Tuple[str, Compound_Statement_Function]:
+        """
+        function NAME(NAME: TYPE, ...) [=> TYPE] [: | ;] BLOCK end [STRING]
+        """
+        self.bracket_depth = 0
+        self.advance() # Skip keyword (function)
+        name = self.current_token
+        if name.kind != TokenKind.NAME:
+            return (self.unexpected_token_error("Expected function name"), None)
+        self.advance()
+        if self.current_token.kind != SEPARATOR_KINDS["("]:
+            return (self.unexpected_token_error("Expected ("), None)
+        self.bracket_depth += 1
+        self.advance()
+        self.skip_line_breaks()
+        parameters: List[Typed_Name] = []
+        while self.current_token.kind == TokenKind.NAME:
+            error, parameter = self.parse_typed_name()
+            if error:
+                return (error, None)
+            parameters.append(parameter)
+            self.skip_line_breaks()
+            if self.current_token.kind != COMMA_KIND:
+                break
+            self.advance()
+            self.skip_line_breaks()
+        if self.current_token.kind != SEPARATOR_KINDS[")"]:
+            return (self.unexpected_token_error("Expected , or )"), None)
+        self.advance()
+        self.bracket_depth -= 1
+        return_type = None
+        if self.current_token.kind == SEPARATOR_KINDS["=>"]:
+            self.advance()
+            error, return_type = self.parse_type()
+            if error:
+                return (error, None)
+        error, body = self.parse_block()
+        if error:
+            return (error, None)
+        if error := self.parse_block_end():
+            return (error, None)
+        return ("", Compound_Statement_Function(name, tuple(parameters), return_type, body))
+
 
-                if self.current_token.value == "\n":
+    def parse_compound_statement_if(self) -> Tuple[str, Compound_Statement_If]:
+        """
+        if EXPRESSION BLOCK (else_if EXPRESSION BLOCK)* [else BLOCK] end [STRING]
+        """
+        conditions: List[Expression] = []
+        blocks: List[Block] = []
+        else_block = None
+        while self.current_token.kind in (KEYWORD_KINDS["if"], KEYWORD_KINDS["else_if"]):
+            self.bracket_depth = 0
+            self.advance() # Skip keyword (if/else_if)
+            error, condition = self.parse_expression()
+            if error:
+                return (error, None)
+            error, block = self.parse_block()
+            if error:
+                return (error, None)
+            conditions.append(condition)
+            blocks.append(block)
+        if self.current_token.kind == KEYWORD_KINDS["else"]:
+            self.advance()
+            error, else_block = self.parse_block()
+            if error:
+                return (error, None)
+        if error := self.parse_block_end():
+            return (error, None)
+        return ("", Compound_Statement_If(tuple(conditions), tuple(blocks), else_block))
+
+
+    def parse_compound_statement_for(self) -> Tuple[str, Compound_Statement_For]:
+        """
+        for NAME in EXPRESSION BLOCK end [STRING]
+        """
+        self.bracket_depth = 0
+        self.advance() # Skip keyword (for)
+        name = self.current_token
+        if name.kind != TokenKind.NAME:
+            return (self.unexpected_token_error("Expected loop variable name"), None)
+        self.advance()
+        if self.current_token.kind != KEYWORD_KINDS["in"]:
+            return (self.unexpected_token_error("Expected in"), None)
+        self.advance()
+        error, iterable = self.parse_expression()
+        if error:
+            return (error, None)
+        error, body = self.parse_block()
+        if error:
+            return (error, None)
+        if error := self.parse_block_end():
+            return (error, None)
+        return ("", Compound_Statement_For(name, iterable, body))
+
+
+    def parse_compound_statement_while(self) -> Tuple[str, Compound_Statement_While]:
+        """
+        while EXPRESSION BLOCK end [STRING]
+        """
+        self.bracket_depth = 0
+        self.advance() # Skip keyword (while)
+        error, condition = self.parse_expression()
+        if error:
+            return (error, None)
+        error, body = self.parse_block()
+        if error:
+            return (error, None)
+        if error := self.parse_block_end():
+            return (error, None)
+        return ("", Compound_Statement_While(condition, body))
+
+
+    def parse_compound_statement_struct(self) -> Tuple[str, Compound_Statement_Struct]:
+        """
+        struct NAME, then an indented block of members (NAME: TYPE, one per line), then end [STRING]
+        """
+        self.bracket_depth = 0
+        self.advance() # Skip keyword (struct)
+        name = self.current_token
+        if name.kind != TokenKind.NAME:
+            return (self.unexpected_token_error("Expected struct name"), None)
+        self.advance()
+        if error := self.parse_block_header_end():
+            return (error, None)
+        while self.current_token.kind & NOTHING_TO_PARSE_KINDS:
+            self.advance()
+        if self.current_token.kind != TokenKind.INDENT:
+            return (self.unexpected_token_error("Expected indented struct members"), None)
+        self.advance()
+        members: List[Typed_Name] = []
+        while self.current_token.kind != TokenKind.OUTDENT:
+            if self.current_token.kind & NOTHING_TO_PARSE_KINDS:
+                self.advance()
+                continue
+            error, member = self.parse_typed_name()
+            if error:
+                return (error, None)
+            if error := self.parse_statement_end():
+                return (error, None)
+            members.append(member)
+        self.advance()
+        if error := self.parse_block_end():
+            return (error, None)
+        return ("", Compound_Statement_Struct(name, tuple(members)))
+
+
+    def skip_block(self):
+        """
+        Resync after an error in a block statement header: skip the indented block after it (if any),
+        then its else_if/else parts and its end line
+        """
+        while True:
+            while self.current_token.kind & NOTHING_TO_PARSE_KINDS:
+                self.advance()
+            if self.current_token.kind == TokenKind.INDENT:
+                depth = 0
+                while self.current_token.kind != TokenKind.EOF:
+                    kind = self.current_token.kind
                     self.advance()
+                    if kind == TokenKind.INDENT:
+                        depth += 1
+                    elif kind == TokenKind.OUTDENT:
+                        depth -= 1
+                        if not depth:
+                            break
+            if self.current_token.kind in (KEYWORD_KINDS["else_if"], KEYWORD_KINDS["else"]):
+                self.skip_statement()
+                continue
+            if self.current_token.kind == KEYWORD_KINDS["end"]:
+                self.skip_statement()
+            return
+
+
+    def parse_statements(self, statements: List[Statement], in_block: bool = False):
+        """
+        Parse statements into statements, until end of file or (in a block) the outdent ending the block
+        Errors are reported and parsing goes on from the next statement
+        """
+        while self.current_token:
+            kind = self.current_token.kind
+            if kind == TokenKind.EOF and (in_block or self.current_token.end_idx == len(self.lexer.source)):
+                break
+
+            if kind & NOTHING_TO_PARSE_KINDS:
+                # Nothing to parse
+                self.advance()
+                continue
+
+            if in_block and kind == TokenKind.OUTDENT:
+                break
+
+            statement_pos = self.pos
+            statement_error, statement_ast = self.parse_statement()
+            if not statement_error and self.pos == statement_pos:
+                # No statement starts with current token, stop here instead of trying it again forever
+                statement_error = self.unexpected_token_error()
+            if statement_error:
+                self.lexer.fail(statement_error, (self.current_token.begin_idx, self.current_token.end_idx))
+                # Only collecting errors gets here
+                self.skip_statement()
+                if kind & ~KIND_INDEX_MASK == TokenKind.BLOCK_KEYWORD or kind == KEYWORD_KINDS["struct"]:
+                    self.skip_block()
+            elif statement_ast:
+                statements.append(statement_ast)
+                if self.echo and not in_block:
+                    print(statement_ast, "\n")
 
-                statement_error, statement_ast = self.parse_statement()
-                if statement_error:
-                    print(statement_error, file = stderr)
-                    exit(1)
-                else:
-                    if statement_ast:
-                        print(statement_ast)
-                        print(statement_ast.tokens, "\n")
+
+    def parse_statement(self) -> Tuple[str, Statement]: # Error, AST Tree
+        """
+        Parse the statement starting at current token, chosen by the kind of that token
+        so it costs the same however many kinds of statements there are
+        """
+        if not self.current_token:
+            return ("", None)
+        first = self.pos
+        if statement_parser := self.statement_parsers.get(self.current_token.kind):
+            error, ast = statement_parser()
+        else:
+            error, ast = self.parse_expression_statement()
+        if ast:
+            ast.first = first
+            ast.last = self.pos - 1 # Statement end (; or line break) included
+        return (error, ast)
+
+
+    def parse(self):
+        if not self.done:
+            self.parse_statements(self.statements)
+            # Lexer errors are found ahead of the parser (lookahead), keep all errors in source order
+            self.diagnostics.sort(key = lambda diagnostic: diagnostic.span)
             self.done = True
         # end "if not self.done"
         return self
@@ -294,11 +1461,25 @@ class Parser:
 if __name__ == "__main__":
     from argparse import ArgumentParser
     from sys import argv
+    from contextlib import nullcontext
+    from token_cache import TokenCache, DEFAULT_TOKEN_CACHE_DIR
+    from profiling import Profiler
 
     parser = ArgumentParser()
 
     parser.add_argument("--source", help="A small code sample to execute")
     parser.add_argument("--file", help="Source file")
+    parser.add_argument("--scanner", choices=SCANNERS, default="master", help="Scanner used to find tokens")
+    parser.add_argument(
+        "--token-cache",
+        nargs="?",
+        const=DEFAULT_TOKEN_CACHE_DIR,
+        metavar="DIR",
+        help=f"Reuse tokens of sources scanned before, cached in DIR (default {DEFAULT_TOKEN_CACHE_DIR})"
+    )
+    parser.add_argument("--profile", action="store_true", help="Print token counts and time spent by scanner branch and parse method to stderr")
+    parser.add_argument("--cprofile", metavar="FILE", help="Save cProfile stats (pstats format) to FILE, implies --profile")
+    parser.add_argument("--tracemalloc", metavar="FILE", help="Save a tracemalloc snapshot to FILE, implies --profile")
 
     args = parser.parse_args()
     cmd_line = "".join(argv)
@@ -308,7 +1489,7 @@ if __name__ == "__main__":
         print("Do not supply both --file and --source", file = stderr)
         exit(1)
     if args.file and not args.source:
-        source = open(args.file).read()
+        source = None # Lexer maps file into memory
         file = path.abspath(args.file)
     elif args.source and not args.file:
         source = args.source
@@ -317,9 +1498,21 @@ if __name__ == "__main__":
         print("You must supply either --file or --source", file = stderr)
         exit(1)
 
-    Parser(
-        lexer_object = Lexer(
-            file_name = file,
-            text=source,
-        ).generate_tokens()
-    ).parse()
+    profiler = Profiler(args.cprofile, args.tracemalloc) if args.profile or args.cprofile or args.tracemalloc else None
+    try:
+        with profiler or nullcontext():
+            lexer = Lexer(
+                file_name = file,
+                text=source,
+                scanner=args.scanner,
+                token_cache=TokenCache(args.token_cache) if args.token_cache else None,
+            )
+            if profiler:
+                # Lexer is watched before the parser starts pulling tokens from it
+                profiler.watch_parser(Parser(lexer_object = profiler.watch_lexer(lexer))).parse()
+            else:
+                Parser(lexer_object = lexer).parse()
+    finally:
+        # Errors exit, what was found until then is reported too
+        if profiler:
+            print(profiler.stats().report(), file = stderr)
@@ -0,0 +1,258 @@
+#!/usr/local/bin/python3.10
+
+import cProfile
+import tracemalloc
+from typing import Dict, List, Callable
+from dataclasses import dataclass, field
+from collections import defaultdict
+from time import perf_counter
+from const import TokenKind, kind_name
+
+####################################################################################################
+
+# Profiling: where time goes while lexing and parsing, without an external profiler
+# A Profiler watches lexers and parsers given to it (Profiler.watch_lexer / Profiler.watch_parser) by replacing
+# a few of their methods with timed/counting ones, on those instances only
+# Lexers and parsers nobody watches are not touched, so profiling costs nothing when it's off
+# As a context manager it also runs cProfile and/or tracemalloc, saving what they found to files
+#
+#     profiler = Profiler()
+#     lexer = profiler.watch_lexer(Lexer(file_name, text))
+#     profiler.watch_parser(Parser(lexer_object = lexer, echo = False)).parse()
+#     print(profiler.stats().report())
+
+
+# Token kind bits => scanner branch finding tokens of that kind, see Profiler.branch
+SCANNER_BRANCHES = (
+    (TokenKind.INDENT | TokenKind.OUTDENT, "indentation"),
+    (TokenKind.COMMENT, "comments"),
+    (TokenKind.LINE_BREAK, "line breaks"),
+    (TokenKind.NAME | TokenKind.KEYWORD, "names"),
+    (TokenKind.NUMBER, "numbers"),
+    (TokenKind.OPERATOR, "operators"),
+    (TokenKind.SEPARATOR, "separators"),
+    (TokenKind.CHARACTER, "characters"),
+    (TokenKind.STRING, "strings"),
+)
+
+
+@dataclass
+class Stats:
+    """
+    What a Profiler found, times in seconds
+    Characters of text sources are counted as bytes, mapped sources are scanned byte by byte anyway
+    """
+    tokens: Dict[str, int] = field(default_factory = dict) # Token kind name => tokens scanned
+    branch_calls: Dict[str, int] = field(default_factory = dict) # Scanner branch => calls of scanner ending there
+    branch_seconds: Dict[str, float] = field(default_factory = dict)
+    parse_calls: Dict[str, int] = field(default_factory = dict) # Parser.parse_* method => calls
+    parse_seconds: Dict[str, float] = field(default_factory = dict) # Including methods it calls, once for recursive calls
+    parse_self_seconds: Dict[str, float] = field(default_factory = dict) # Excluding other parse_* methods it calls
+    bytes_scanned: int = 0
+    peak_tokens: int = 0 # Most tokens kept at once, by a lexer (generated tokens) or a parser (lookahead)
+    seconds: float = 0.0 # Time spent inside the Profiler context, 0 if it was not used as one
+    peak_memory: int = None # Bytes, only when tracemalloc ran
+
+    def report(self) -> str:
+        lines = [f"Tokens: {sum(self.tokens.values())}, bytes scanned: {self.bytes_scanned}, peak tokens kept: {self.peak_tokens}"]
+        if self.seconds:
+            lines.append(f"Seconds: {self.seconds:.6f}")
+        if self.peak_memory is not None:
+            lines.append(f"Peak memory: {self.peak_memory} bytes")
+        if self.tokens:
+            lines.append("\nTokens by kind:")
+            for kind, count in sorted(self.tokens.items(), key = lambda item: -item[1]):
+                lines.append(f"    {kind:<32}{count:>12}")
+        if self.branch_calls:
+            lines.append(f"\n{'Scanner branch':<36}{'calls':>12}{'seconds':>14}")
+            for branch, seconds in sorted(self.branch_seconds.items(), key = lambda item: -item[1]):
+                lines.append(f"    {branch:<32}{self.branch_calls[branch]:>12}{seconds:>14.6f}")
+        if self.parse_calls:
+            lines.append(f"\n{'Parser method':<36}{'calls':>12}{'seconds':>14}{'self seconds':>14}")
+            for method, seconds in sorted(self.parse_self_seconds.items(), key = lambda item: -item[1]):
+                lines.append(
+                    f"    {method:<32}{self.parse_calls[method]:>12}{self.parse_seconds[method]:>14.6f}{seconds:>14.6f}"
+                )
+        return "\n".join(lines)
+
+
+class Profiler:
+    def __init__(self, cprofile_file: str = None, tracemalloc_file: str = None):
+        """
+        cprofile_file: where cProfile stats of code run inside the Profiler context are saved (pstats format)
+        tracemalloc_file: where a tracemalloc snapshot taken at the end of the Profiler context is saved
+        (tracemalloc.Snapshot.load reads it)
+        """
+        self.cprofile_file = cprofile_file
+        self.tracemalloc_file = tracemalloc_file
+        self.cprofile: cProfile.Profile = None
+        self.started = 0.0
+        self.seconds = 0.0
+        self.peak_memory: int = None
+
+        self.kinds: Dict[int, int] = defaultdict(int) # Token kind => tokens scanned
+        self.branch_calls: Dict[str, int] = defaultdict(int)
+        self.branch_seconds: Dict[str, float] = defaultdict(float)
+        self.parse_calls: Dict[str, int] = defaultdict(int)
+        self.parse_seconds: Dict[str, float] = defaultdict(float)
+        self.parse_self_seconds: Dict[str, float] = defaultdict(float)
+        self.parse_depth: Dict[str, int] = defaultdict(int) # Calls of each method running now
+        self.callees_seconds: List[float] = [] # For each parse_* call running now, seconds spent in parse_* calls it made
+        self.bytes_scanned = 0
+        self.peak_tokens = 0
+
+
+    def __enter__(self):
+        if self.tracemalloc_file:
+            tracemalloc.start()
+        if self.cprofile_file:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        self.started = perf_counter()
+        return self
+
+
+    def __exit__(self, *_):
+        self.seconds += perf_counter() - self.started
+        if self.cprofile:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.cprofile_file)
+            self.cprofile = None
+        if self.tracemalloc_file and tracemalloc.is_tracing():
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.take_snapshot().dump(self.tracemalloc_file)
+            tracemalloc.stop()
+        return False
+
+
+    @staticmethod
+    def branch(kind: int) -> str:
+        """
+        Scanner branch finding tokens of kind
+        """
+        for kinds, branch in SCANNER_BRANCHES:
+            if kind & kinds:
+                return branch
+        return "other"
+
+
+    def watch_lexer(self, lexer):
+        """
+        Profile lexer (a lexer.Lexer), returns it
+        Times each call of its scanner by branch, counts tokens it scans and bytes it moves over
+        Tokens it doesn't scan itself (loaded from token cache) are not counted
+        """
+        next_token = lexer.next_token
+        scan_tokens = lexer.scan_tokens
+        scan_chunks = lexer.scan_chunks
+        generate_tokens = lexer.generate_tokens
+
+        def timed_next_token():
+            checking_indent = not lexer.checked_indent_in_current_line
+            start = perf_counter()
+            error, tok = next_token()
+            elapsed = perf_counter() - start
+            if error:
+                branch = "errors"
+            elif tok:
+                branch = self.branch(tok.kind)
+            else:
+                branch = "indentation" if checking_indent and lexer.checked_indent_in_current_line else "other"
+            self.branch_calls[branch] += 1
+            self.branch_seconds[branch] += elapsed
+            return error, tok
+
+        def counted_scan_tokens():
+            # Counted as tokens are found, whoever reads them may stop at EOF and never close this generator
+            scanned_to = lexer.idx
+            kinds = self.kinds
+            for tok in scan_tokens():
+                kinds[tok.kind] += 1
+                if lexer.idx > scanned_to:
+                    self.bytes_scanned += lexer.idx - scanned_to
+                    scanned_to = lexer.idx
+                yield tok
+
+        def counted_scan_chunks():
+            if not scan_chunks():
+                return False
+            for kind in lexer.tokens.kinds if lexer.compact else (tok.kind for tok in lexer.tokens):
+                self.kinds[kind] += 1
+            self.bytes_scanned += len(lexer.source)
+            return True
+
+        def watched_generate_tokens():
+            generate_tokens()
+            self.peak_tokens = max(self.peak_tokens, len(lexer.tokens))
+            return lexer
+
+        lexer.next_token = timed_next_token
+        lexer.scan_tokens = counted_scan_tokens
+        lexer.scan_chunks = counted_scan_chunks
+        lexer.generate_tokens = watched_generate_tokens
+        return lexer
+
+
+    def watch_parser(self, parser):
+        """
+        Profile parser (a parser.Parser), returns it
+        Times each of its parse_* methods, lexing done lazily while parsing is part of the method asking for tokens
+        """
+        for name in dir(type(parser)):
+            if name.startswith("parse"):
+                setattr(parser, name, self.timed_parse_method(name, getattr(parser, name)))
+        # Statement parsers were looked up before they were replaced
+        parser.statement_parsers = {
+            kind: getattr(parser, method.__name__) for kind, method in parser.statement_parsers.items()
+        }
+        peek = parser.peek
+
+        def watched_peek(k: int = 0):
+            tok = peek(k)
+            if len(parser.lookahead) > self.peak_tokens:
+                self.peak_tokens = len(parser.lookahead)
+            return tok
+
+        parser.peek = watched_peek
+        return parser
+
+
+    def timed_parse_method(self, name: str, method: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            self.callees_seconds.append(0.0)
+            self.parse_depth[name] += 1
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                self.parse_depth[name] -= 1
+                self.parse_calls[name] += 1
+                self.parse_self_seconds[name] += elapsed - self.callees_seconds.pop()
+                if not self.parse_depth[name]:
+                    self.parse_seconds[name] += elapsed # Outermost call only, recursive calls are inside it
+                if self.callees_seconds:
+                    self.callees_seconds[-1] += elapsed
+        timed.__name__ = name
+        return timed
+
+
+    def stats(self) -> Stats:
+        """
+        What was found so far
+        """
+        tokens: Dict[str, int] = defaultdict(int)
+        for kind, count in self.kinds.items():
+            tokens[kind_name(kind)] += count
+        return Stats(
+            tokens = dict(tokens),
+            branch_calls = dict(self.branch_calls),
+            branch_seconds = dict(self.branch_seconds),
+            parse_calls = dict(self.parse_calls),
+            parse_seconds = dict(self.parse_seconds),
+            parse_self_seconds = dict(self.parse_self_seconds),
+            bytes_scanned = self.bytes_scanned,
+            peak_tokens = self.peak_tokens,
+            seconds = self.seconds,
+            peak_memory = self.peak_memory,
+        )
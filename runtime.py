@@ -0,0 +1,255 @@
+#!/usr/local/bin/python3.10
+
+from typing import List, Tuple, Callable
+from array import array
+from sys import stdin
+
+####################################################################################################
+
+# Runtime: what A-Script values are while a program runs, shared by every engine running programs
+#   int, float, bool    => Python int, float, bool
+#   char, string        => Python str (a char is a str of length 1)
+#   array(T, N, ...)    => fixed size buffers: array("q") of int, array("d") of float, list of anything else
+#                          arrays of many dimensions are lists of arrays
+#   struct              => instances of a class with __slots__, made once for each struct statement
+#   references          => Reference, a container and a key in it (a frame's locals, globals, an array, a struct)
+# Integer operators follow A-Script: / of two ints truncates toward zero
+
+
+class ScriptError(Exception):
+    """
+    Error of a running program, report is set once it's known where it happened
+    """
+    def __init__(self, message: str, report: str = ""):
+        super().__init__(message)
+        self.message = message
+        self.report = report
+
+    def __str__(self):
+        return self.report or self.message
+
+
+class Reference:
+    """
+    Reference to a variable (or a struct member, or an array item): cells[index]
+    """
+    __slots__ = ("cells", "index")
+
+    def __init__(self, cells, index):
+        self.cells = cells
+        self.index = index
+
+    def get(self):
+        return self.cells[self.index]
+
+    def set(self, value):
+        self.cells[self.index] = value
+
+    def __repr__(self):
+        return f"ref_of {format_value(self.cells[self.index])}"
+
+
+class Struct:
+    """
+    Base of struct classes, see struct_class
+    Members are also items, so references to members are like references to anything else
+    """
+    __slots__ = ()
+    members: Tuple[str, ...] = ()
+
+    def __getitem__(self, member: str):
+        return getattr(self, member)
+
+    def __setitem__(self, member: str, value):
+        setattr(self, member, value)
+
+    def __repr__(self):
+        members = ", ".join(f"{member}: {format_value(getattr(self, member))}" for member in self.members)
+        return f"{type(self).__name__} {{{members}}}"
+
+
+def struct_class(name: str, members: Tuple[str, ...], zeros: Tuple[Callable[[], object], ...]) -> type:
+    """
+    Class of instances of struct name, zeros make initial values of its members
+    """
+    defaults = tuple(zip(members, zeros))
+    def __init__(self):
+        for member, zero in defaults:
+            setattr(self, member, zero())
+    return type(name, (Struct,), {"__slots__": members, "members": members, "__init__": __init__})
+
+
+def new_struct(cls: type, members: Tuple[str, ...], *values) -> Struct:
+    """
+    Instance of struct class cls, members given values (in order), others their initial values
+    """
+    instance = cls()
+    for member, value in zip(members, values):
+        setattr(instance, member, value)
+    return instance
+
+
+# Primitive type => value of variables of that type without an initial value
+ZERO_VALUES = {"int": 0, "float": 0.0, "bool": False, "char": "\0", "string": ""}
+
+# Item type => typecode of typed buffers holding items of that type, other arrays are lists
+ARRAY_TYPECODES = {"int": "q", "float": "d"}
+
+
+def array_factory(sizes: Tuple[int, ...], typecode: str, zero: Callable[[], object]) -> Callable[[], object]:
+    """
+    Function making new arrays of dimensions sizes, all items zero()
+    typecode: of items in the last dimension, None if they're not numbers
+    """
+    size = sizes[0]
+    if len(sizes) > 1:
+        inner = array_factory(sizes[1:], typecode, zero)
+        return lambda: [inner() for _ in range(size)]
+    if typecode:
+        empty = array(typecode, [zero()]) * size
+        return lambda: array(typecode, empty)
+    return lambda: [zero() for _ in range(size)]
+
+
+def array_converter(sizes: Tuple[int, ...], typecode: str, zero: Callable[[], object]) -> Callable[[object], object]:
+    """
+    Function making an array of dimensions sizes out of a list (array literal) or an array
+    Missing items are zero(), more items than size is an error
+    """
+    size = sizes[0]
+    inner = array_converter(sizes[1:], typecode, zero) if len(sizes) > 1 else None
+    make = array_factory(sizes, typecode, zero)
+    def convert(items):
+        if not isinstance(items, (list, array)):
+            raise ScriptError(f"Expected an array, got {type_name(items)}")
+        if len(items) > size:
+            raise ScriptError(f"Too many items ({len(items)}) for an array of size {size}")
+        converted = make()
+        for i, item in enumerate(items):
+            converted[i] = inner(item) if inner else item
+        return converted
+    return convert
+
+
+def store(cells, key, value):
+    """
+    cells[key] = value, as an expression
+    """
+    cells[key] = value
+    return value
+
+
+def update(cells, key, operation: Callable[[object, object], object], value):
+    """
+    cells[key] = operation(cells[key], value), as an expression
+    """
+    cells[key] = result = operation(cells[key], value)
+    return result
+
+
+def negative_index():
+    raise IndexError("Array index out of range")
+
+
+def type_name(value) -> str:
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, str):
+        return "char" if len(value) == 1 else "string"
+    if isinstance(value, (list, array)):
+        return "array"
+    return type(value).__name__
+
+
+def int_divide(a, b):
+    """
+    / of A-Script: truncated toward zero when both sides are ints
+    """
+    if type(a) is int and type(b) is int:
+        if not b:
+            raise ScriptError("Division by zero")
+        quotient = abs(a) // abs(b)
+        return quotient if (a < 0) == (b < 0) else -quotient
+    if not b:
+        raise ScriptError("Division by zero")
+    return a / b
+
+
+def error_message(error: Exception) -> str:
+    """
+    What an exception raised while running a program means to A-Script
+    """
+    if isinstance(error, ScriptError):
+        return error.message
+    if isinstance(error, RecursionError):
+        return "Too many nested calls"
+    if isinstance(error, ZeroDivisionError):
+        return "Division by zero"
+    if isinstance(error, IndexError):
+        return "Array index out of range"
+    return str(error)
+
+
+def format_value(value) -> str:
+    """
+    How write shows a value
+    """
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, (list, array)):
+        return "[" + ", ".join(format_value(item) for item in value) + "]"
+    return str(value)
+
+
+def write(*values):
+    print(*(format_value(value) for value in values))
+
+
+class Input:
+    """
+    Words read from stdin, each read(...) takes as many words as it has references
+    """
+    def __init__(self, stream = stdin):
+        self.stream = stream
+        self.words: List[str] = []
+
+    def word(self) -> str:
+        while not self.words:
+            line = self.stream.readline()
+            if not line:
+                raise ScriptError("Nothing left to read")
+            self.words = line.split()[::-1]
+        return self.words.pop()
+
+    def read(self, *references: Reference):
+        for reference in references:
+            if not isinstance(reference, Reference):
+                raise ScriptError("read takes references (ref_of name)")
+            reference.set(parse_word(self.word(), reference.get()))
+
+
+STANDARD_INPUT = Input()
+
+
+def read(*references: Reference):
+    STANDARD_INPUT.read(*references)
+
+
+def parse_word(word: str, current):
+    """
+    Value of word read into a variable whose current value is current, of the same type
+    """
+    try:
+        if isinstance(current, bool):
+            if word not in ("true", "false"):
+                raise ValueError
+            return word == "true"
+        if isinstance(current, int):
+            return int(word.replace("_", ""))
+        if isinstance(current, float):
+            return float(word)
+    except ValueError:
+        raise ScriptError(f"Can't read {word!r} as {type_name(current)}") from None
+    return word
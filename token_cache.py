@@ -0,0 +1,177 @@
+#!/usr/local/bin/python3.10
+
+import re
+import struct
+import hashlib
+from typing import Dict
+from array import array
+from os import path, makedirs, replace, remove, scandir, utime, getpid
+from sys import byteorder
+import const
+
+####################################################################################################
+
+# Token cache: token streams of already scanned sources, stored on disk
+# An entry is found by hashing source text together with a version of token definitions (const.py, lexer.py)
+# so editing either of them invalidates every entry
+# Entries are compact binary, one array per token attribute, token values are not stored since they're slices of source
+
+
+DEFAULT_TOKEN_CACHE_DIR = path.join(path.expanduser("~"), ".cache", "a-script", "tokens")
+
+DEFAULT_TOKEN_CACHE_SIZE = 256 * 1024 * 1024 # bytes
+
+# Same columns as lexer.TokenStore.COLUMNS, kinds are const.TokenKind values
+TOKEN_COLUMNS = ("kinds", "begin_idx", "end_idx", "begin_col", "end_col", "begin_ln", "end_ln")
+
+# Entry layout:
+#   header: magic, format version, byte order, tokens count
+#   columns: for each of TOKEN_COLUMNS, tokens count int32 values
+ENTRY_MAGIC = b"ASTK"
+ENTRY_FORMAT = 2
+ENTRY_HEADER = struct.Struct("<4sHcI")
+ENTRY_SUFFIX = ".tok"
+
+
+def definitions_version() -> str:
+    """
+    Hash of everything that decides which tokens a source has:
+    definitions in const.py and the code of lexer.py
+    """
+    digest = hashlib.blake2b(digest_size = 16)
+    digest.update(str(ENTRY_FORMAT).encode())
+    for name in sorted(vars(const)):
+        if not name.isupper():
+            continue
+        value = getattr(const, name)
+        if isinstance(value, re.Pattern):
+            value = (value.pattern, value.flags)
+        elif isinstance(value, (set, frozenset)):
+            value = sorted(value)
+        elif isinstance(value, dict):
+            value = sorted((key, str(item)) for key, item in value.items())
+        digest.update(f"{name}={value!r};".encode())
+    with open(path.join(path.dirname(path.abspath(__file__)), "lexer.py"), "rb") as lexer_file:
+        digest.update(lexer_file.read())
+    return digest.hexdigest()
+
+
+def encode_tokens(columns: Dict[str, array]) -> bytes:
+    """
+    Token columns (see lexer.TokenStore) as compact binary
+    """
+    count = len(columns["kinds"])
+    data = bytearray(ENTRY_HEADER.pack(ENTRY_MAGIC, ENTRY_FORMAT, byteorder[0].encode(), count))
+    for column in TOKEN_COLUMNS:
+        data += columns[column].tobytes()
+    return bytes(data)
+
+
+def decode_tokens(data: bytes) -> Dict[str, array]:
+    """
+    Token columns encoded by encode_tokens, None if data is not a valid encoding
+    """
+    if len(data) < ENTRY_HEADER.size:
+        return None
+    magic, entry_format, entry_byteorder, count = ENTRY_HEADER.unpack_from(data)
+    if magic != ENTRY_MAGIC or entry_format != ENTRY_FORMAT or entry_byteorder != byteorder[0].encode():
+        return None
+    offset = ENTRY_HEADER.size
+    columns: Dict[str, array] = {}
+    for column in TOKEN_COLUMNS:
+        values = array("i")
+        values.frombytes(data[offset : offset + count * values.itemsize])
+        if len(values) != count:
+            return None # Truncated
+        columns[column] = values
+        offset += count * values.itemsize
+    return columns
+
+
+class TokenCache:
+    def __init__(self, directory: str = DEFAULT_TOKEN_CACHE_DIR, max_size: int = DEFAULT_TOKEN_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size # Least recently used entries are removed when all entries take more than this
+        self.version = definitions_version()
+        makedirs(self.directory, exist_ok = True)
+
+
+    def key(self, source, mapped: bool) -> str:
+        """
+        Cache key of a source, str or mapped file buffer
+        Mapped sources count positions in bytes, not characters, so they never share entries with str sources
+        """
+        digest = hashlib.blake2b(digest_size = 20)
+        digest.update(self.version.encode())
+        digest.update(b"mapped:" if mapped else b"text:")
+        digest.update(source if mapped else source.encode("utf-8", errors = "surrogatepass"))
+        return digest.hexdigest()
+
+
+    def entry_path(self, key: str) -> str:
+        return path.join(self.directory, key + ENTRY_SUFFIX)
+
+
+    def load(self, key: str) -> Dict[str, array]:
+        """
+        Token columns stored under key, None when there's no (valid) entry
+        """
+        entry_path = self.entry_path(key)
+        try:
+            with open(entry_path, "rb") as entry:
+                decoded = decode_tokens(entry.read())
+        except OSError:
+            return None
+        if decoded is not None:
+            try:
+                utime(entry_path) # Most recently used
+            except OSError:
+                pass
+        return decoded
+
+
+    def store(self, key: str, columns: Dict[str, array]):
+        """
+        Store token columns under key, then evict least recently used entries if cache is too big
+        """
+        data = encode_tokens(columns)
+        # Write to a temporary file first, so no one reads a half written entry
+        temporary_path = self.entry_path(key) + f".{getpid()}.tmp"
+        try:
+            with open(temporary_path, "wb") as entry:
+                entry.write(data)
+            replace(temporary_path, self.entry_path(key))
+        except OSError:
+            return # A cache that can't be written is just a cold cache
+        self.evict()
+
+
+    def evict(self):
+        """
+        Remove least recently used entries until all entries take at most max_size bytes
+        """
+        evict_entries(self.directory, ENTRY_SUFFIX, self.max_size)
+
+
+def evict_entries(directory_path: str, suffix: str, max_size: int):
+    """
+    Remove least recently used (oldest modification time) files ending with suffix in directory_path
+    until they take at most max_size bytes
+    """
+    entries = []
+    total_size = 0
+    with scandir(directory_path) as directory:
+        for entry in directory:
+            if entry.name.endswith(suffix):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+    entries.sort()
+    for _, size, entry_path in entries:
+        if total_size <= max_size:
+            break
+        try:
+            remove(entry_path)
+            total_size -= size
+        except OSError:
+            pass
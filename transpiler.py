@@ -0,0 +1,707 @@
+#!/usr/local/bin/python3.10
+
+import ast
+import operator
+from typing import List, Dict, Tuple, Set
+from dataclasses import dataclass, field
+from types import CodeType
+from sys import stderr
+from const import *
+from lexer import Token, Diagnostic
+from parser import *
+from loader import Program
+from compiler import (
+    Compiler, ModuleCompiler, Variable, Function, BUILTINS, REFERENCE_OPERATORS, ASSIGNMENT_OPERATIONS,
+    position_report,
+)
+import runtime
+
+####################################################################################################
+
+# Transpiler: AST of a loaded program (loader.Program) => Python AST, compiled with compile() and run by CPython
+# Programs are checked by compiler.Compiler first, so both backends accept the same programs with the same errors,
+# and what it found out (names of each module, struct classes, array factories) is reused here
+# Every module is one Python module run in a namespace shared by the whole program:
+#   - functions are Python functions, top level code of a module is a function too (its block variables are locals)
+#   - global variables are globals of the namespace, functions assigning them declare them global
+#   - local variables are Python locals, a local some reference points to (ref_of x) is boxed in a list of one item
+#   - A-Script names get a suffix, so they never clash with each other, Python builtins or names of the runtime
+# Values are those of runtime.py, / of ints, struct literals and references call it
+# Python nodes get positions of the tokens they're made of, errors of a running program are reported at the
+# A-Script code of the Python instruction that raised them
+
+
+# Binary operator => Python operator
+PYTHON_OPERATORS = {
+    "+": ast.Add, "-": ast.Sub, "*": ast.Mult, "&": ast.BitAnd, "|": ast.BitOr, "^": ast.BitXor,
+    "<<": ast.LShift, ">>": ast.RShift,
+}
+
+PYTHON_COMPARISONS = {"<": ast.Lt, "<=": ast.LtE, ">": ast.Gt, ">=": ast.GtE, "==": ast.Eq, "!=": ast.NotEq}
+
+PYTHON_UNARY_OPERATORS = {"-": ast.USub, "+": ast.UAdd, "~": ast.Invert, "not": ast.Not}
+
+# Binary operator => function applying it, for assignments done by runtime.update
+OPERATOR_FUNCTIONS = {
+    "+": operator.add, "-": operator.sub, "*": operator.mul, "/": runtime.int_divide, "&": operator.and_,
+    "|": operator.or_, "^": operator.xor, "<<": operator.lshift, ">>": operator.rshift,
+}
+
+# Names of the runtime in every program's namespace
+RUNTIME_NAMES = {
+    "_Reference": runtime.Reference,
+    "_int_divide": runtime.int_divide,
+    "_new_struct": runtime.new_struct,
+    "_store": runtime.store,
+    "_update": runtime.update,
+    "_negative_index": runtime.negative_index,
+    "_bool": bool,
+}
+
+# Built in function => its name in namespace
+BUILTIN_NAMES = {name: "_" + name for name in BUILTINS}
+
+
+@dataclass
+class Local:
+    name: str # In Python
+    boxed: bool # A list of one item holding the value
+    reference: bool # Holds a reference
+    position: int # Of its definition (begin_idx of its name), boxed locals are known by it
+
+
+@dataclass
+class TranspiledProgram:
+    trees: List[Tuple[str, ast.Module]] = field(default_factory = list) # (file, Python AST) of each module, in order
+    codes: List[CodeType] = field(default_factory = list)
+    namespace: Dict[str, object] = field(default_factory = dict)
+    errors: List[Diagnostic] = field(default_factory = list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def run(self):
+        """
+        Run every module, in order
+        Errors of the program raise runtime.ScriptError, its report tells where it happened
+        """
+        files = {file_path for file_path, _ in self.trees}
+        for code in self.codes:
+            try:
+                exec(code, self.namespace)
+            except Exception as error:
+                raise script_error(error, files) from None
+
+
+def script_error(error: Exception, files: Set[str]) -> runtime.ScriptError:
+    """
+    ScriptError of error raised while running a transpiled program, reported at the innermost A-Script code
+    running then (the last frame of a module of files in its traceback)
+    """
+    if isinstance(error, runtime.ScriptError) and error.report:
+        return error
+    message = runtime.error_message(error)
+    position = None
+    tb = error.__traceback__
+    while tb is not None:
+        code = tb.tb_frame.f_code
+        if code.co_filename in files:
+            position = (code.co_filename, list(code.co_positions())[tb.tb_lasti // 2])
+        tb = tb.tb_next
+    if position is None:
+        return runtime.ScriptError(message)
+    file_path, (ln, _, col, end_col) = position
+    width = end_col - col if end_col is not None and col is not None else 1
+    return runtime.ScriptError(message, position_report(file_path, ln - 1, col or 0, width, message, "Runtime Error"))
+
+
+def located(node: ast.AST, tok: Token) -> ast.AST:
+    """
+    node, positioned at (the first line of) tok
+    """
+    node.lineno = node.end_lineno = tok.begin_ln + 1
+    node.col_offset = tok.begin_col
+    node.end_col_offset = tok.begin_col + len(tok.value.partition("\n")[0])
+    return node
+
+
+def load(name: str) -> ast.Name:
+    return ast.Name(name, ast.Load())
+
+
+def store(name: str) -> ast.Name:
+    return ast.Name(name, ast.Store())
+
+
+def call(function: ast.expr, *arguments: ast.expr) -> ast.Call:
+    return ast.Call(function, list(arguments), [])
+
+
+def checked_index(name: ast.Name) -> ast.expr:
+    """
+    Value of name, an array index, negative ones are errors
+    """
+    return ast.IfExp(ast.Compare(name, [ast.GtE()], [ast.Constant(0)]), name, call(load("_negative_index")))
+
+
+def has_side_effects(expression: Expression) -> bool:
+    """
+    True when evaluating expression may change variables or write something: it calls or assigns
+    """
+    if expression.kind == NodeKind.FUNCTION_CALL:
+        return True
+    tok = expression.token if expression.kind in (NodeKind.BINARY, NodeKind.UNARY) else None
+    if tok and (tok.kind & ~KIND_INDEX_MASK == TokenKind.ASSIGNMENT or tok.kind == TokenKind.OPERATOR and tok.value in ("++", "--")):
+        return True
+    return any(isinstance(child, Expression) and has_side_effects(child) for child in expression.children)
+
+
+def function_def(name: str, parameters: List[str], body: List[ast.stmt]) -> ast.FunctionDef:
+    arguments = ast.arguments(
+        posonlyargs = [], args = [ast.arg(parameter) for parameter in parameters], vararg = None,
+        kwonlyargs = [], kw_defaults = [], kwarg = None, defaults = [],
+    )
+    definition = ast.FunctionDef(name = name, args = arguments, body = body, decorator_list = [], returns = None, type_comment = None)
+    if "type_params" in ast.FunctionDef._fields:
+        definition.type_params = []
+    return definition
+
+
+def global_name(variable: Variable) -> str:
+    return f"{variable.name}_g{variable.slot}"
+
+
+def function_name(function: Function) -> str:
+    return f"{function.name}_f{function.index}"
+
+
+class FunctionTranspiler:
+    """
+    Transpiles one function, or the top level code of a module
+    """
+    def __init__(self, module: "ModuleTranspiler", boxed: Set[int]):
+        self.module = module
+        self.boxed = boxed # Positions of definitions (begin_idx of their names) of boxed locals
+        self.found_boxed = False # Was a local found to need a box it didn't have, then it's transpiled again
+        self.scopes: List[Dict[str, Local]] = [{}]
+        self.locals = 0
+        self.assigned_globals: Dict[str, None] = {} # Globals assigned here, they're declared global
+
+
+    # Names
+
+    def define_local(self, name: Token, reference: bool) -> Local:
+        local = Local(f"{name.value}_l{self.locals}", name.begin_idx in self.boxed, reference, name.begin_idx)
+        self.locals += 1
+        self.scopes[-1][name.value] = local
+        return local
+
+
+    def lookup(self, name: str):
+        """
+        Local, or a symbol of the module (compiler.Variable, Function or Struct), None for builtins
+        """
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        return self.module.names.lookup(name)
+
+
+    def constant(self, value) -> ast.Name:
+        return load(self.module.transpiler.constant(value))
+
+
+    def variable_value(self, tok: Token) -> ast.expr:
+        """
+        Value of variable named tok (what it references, if it's a reference)
+        """
+        symbol = self.lookup(tok.value)
+        if isinstance(symbol, Local):
+            value = located(load(symbol.name), tok)
+            if symbol.boxed:
+                value = located(ast.Subscript(value, ast.Constant(0), ast.Load()), tok)
+            reference = symbol.reference
+        else:
+            value = located(load(global_name(symbol)), tok)
+            reference = symbol.reference
+        if reference:
+            value = located(ast.Subscript(ast.Attribute(value, "cells", ast.Load()), ast.Attribute(value, "index", ast.Load()), ast.Load()), tok)
+        return value
+
+
+    def reference_value(self, tok: Token) -> ast.expr:
+        """
+        Reference held by reference variable named tok
+        """
+        symbol = self.lookup(tok.value)
+        if isinstance(symbol, Local):
+            value = located(load(symbol.name), tok)
+            if symbol.boxed:
+                value = located(ast.Subscript(value, ast.Constant(0), ast.Load()), tok)
+            return value
+        return located(load(global_name(symbol)), tok)
+
+
+    def cells(self, target: Expression) -> Tuple[ast.expr, ast.expr]:
+        """
+        (container, key) of an assignment target (or referenced expression), for runtime.Reference/store/update
+        """
+        if isinstance(target, Name_Expression):
+            tok = target.token
+            symbol = self.lookup(tok.value)
+            if symbol.reference:
+                reference = self.reference_value(tok)
+                return (ast.Attribute(reference, "cells", ast.Load()), ast.Attribute(reference, "index", ast.Load()))
+            if isinstance(symbol, Local):
+                if not symbol.boxed:
+                    # A reference to it was just found, it needs a box
+                    self.boxed.add(symbol.position)
+                    self.found_boxed = True
+                return (located(load(symbol.name), tok), ast.Constant(0))
+            return (load("_G"), ast.Constant(global_name(symbol)))
+        if isinstance(target, Membership_Access_Expression):
+            return (self.expression(target.struct), ast.Constant(target.member.value))
+        return (self.expression(target.array), self.index(target.index))
+
+
+    # Expressions
+
+    def index(self, index: Expression) -> ast.expr:
+        """
+        Array index, negative ones are errors (they're not counted from the end like in Python)
+        """
+        if isinstance(index, Constant_Expression):
+            value = index.value
+            if type(value) is int and value >= 0:
+                return located(ast.Constant(value), index.token)
+        value = self.expression(index)
+        if isinstance(index, Name_Expression):
+            return checked_index(value)
+        return ast.IfExp(
+            ast.Compare(ast.NamedExpr(store("_index"), value), [ast.GtE()], [ast.Constant(0)]),
+            load("_index"),
+            call(load("_negative_index")),
+        )
+
+
+    def expression(self, expression: Expression, condition: bool = False) -> ast.expr:
+        """
+        Python expression of expression, condition: only its truth matters
+        """
+        kind = expression.kind
+        tok = expression.token
+        if kind in (NodeKind.CONSTANT, NodeKind.LITERAL):
+            return located(ast.Constant(expression.value), tok)
+        if kind == NodeKind.NAME:
+            return self.variable_value(tok)
+        if kind == NodeKind.BINARY:
+            operator_text = tok.value
+            if tok.kind & ~KIND_INDEX_MASK == TokenKind.ASSIGNMENT:
+                return self.assignment_expression(expression.left, tok, expression.right)
+            left = self.expression(expression.left, condition and operator_text in ("and", "or"))
+            right = self.expression(expression.right, condition and operator_text in ("and", "or"))
+            if operator_text in ("and", "or"):
+                value = located(ast.BoolOp(ast.And() if operator_text == "and" else ast.Or(), [left, right]), tok)
+                return value if condition else located(call(load("_bool"), value), tok)
+            if operator_text in PYTHON_COMPARISONS:
+                return located(ast.Compare(left, [PYTHON_COMPARISONS[operator_text]()], [right]), tok)
+            if operator_text == "/":
+                return located(call(load("_int_divide"), left, right), tok)
+            return located(ast.BinOp(left, PYTHON_OPERATORS[operator_text](), right), tok)
+        if kind == NodeKind.UNARY:
+            operator_text = tok.value
+            if operator_text in PYTHON_UNARY_OPERATORS:
+                operand = self.expression(expression.operand, condition and operator_text == "not")
+                return located(ast.UnaryOp(PYTHON_UNARY_OPERATORS[operator_text](), operand), tok)
+            if operator_text in REFERENCE_OPERATORS:
+                return self.reference(expression.operand, tok)
+            return self.assignment_expression(expression.operand, tok, None) # ++ / --
+        if kind == NodeKind.STRUCT_MEMBERSHIP_ACCESS:
+            return located(ast.Attribute(self.expression(expression.struct), expression.member.value, ast.Load()), expression.member)
+        if kind == NodeKind.ARRAY_SUBSCRIPTION:
+            return located(ast.Subscript(self.expression(expression.array), self.index(expression.index), ast.Load()), tok)
+        if kind == NodeKind.FUNCTION_CALL:
+            return self.call(expression)
+        if kind == NodeKind.ARRAY:
+            return located(ast.List([self.expression(item) for item in expression.items], ast.Load()), tok)
+        if kind == NodeKind.STRUCT:
+            name = expression.struct.token
+            symbol = self.lookup(name.value)
+            members = tuple(member.value for member in expression.members)
+            values = [self.expression(value) for value in expression.values]
+            return located(call(load("_new_struct"), self.constant(symbol.cls), ast.Constant(members), *values), name)
+        raise ValueError(f"Unexpected expression {expression!r}")
+
+
+    def reference(self, expression: Expression, tok: Token) -> ast.expr:
+        """
+        Reference to expression (a variable, struct member or array item)
+        """
+        if isinstance(expression, Name_Expression) and self.lookup(expression.token.value).reference:
+            return self.reference_value(expression.token) # Already a reference, pass it on
+        return located(call(load("_Reference"), *self.cells(expression)), tok)
+
+
+    def reference_argument(self, argument: Expression) -> ast.expr:
+        """
+        Argument of a reference parameter: ref_of x (or &x), or a reference variable
+        """
+        if isinstance(argument, Unary_Expression) and argument.token.value in REFERENCE_OPERATORS:
+            return self.reference(argument.operand, argument.token)
+        return self.reference_value(argument.token)
+
+
+    def call(self, expression: Function_Call_Expression) -> ast.expr:
+        name = expression.function.token
+        symbol = self.lookup(name.value)
+        if symbol is None: # Builtin
+            takes_references = BUILTINS[name.value][1]
+            arguments = [
+                self.reference_argument(argument) if takes_references else self.expression(argument)
+                for argument in expression.arguments
+            ]
+            return located(call(load(BUILTIN_NAMES[name.value]), *arguments), name)
+        arguments = [
+            self.reference_argument(argument) if parameter.type.reference else self.expression(argument)
+            for parameter, argument in zip(symbol.statement.parameters, expression.arguments)
+        ]
+        return located(call(load(function_name(symbol)), *arguments), name)
+
+
+    def new_value(self, target_value: ast.expr, tok: Token, value: Expression) -> ast.expr:
+        """
+        Value assigned by target (operator tok) value, target_value: current value of target
+        """
+        operator_text = tok.value
+        if value is None: # ++ / --
+            operation, operand = ("+" if operator_text == "++" else "-"), located(ast.Constant(1), tok)
+        else:
+            operation, operand = ASSIGNMENT_OPERATIONS[operator_text], self.expression(value)
+        if operator_text == "~=":
+            operand = located(ast.UnaryOp(ast.Invert(), operand), tok)
+        if operation is None:
+            return operand
+        if operation == "/":
+            return located(call(load("_int_divide"), target_value, operand), tok)
+        return located(ast.BinOp(target_value, PYTHON_OPERATORS[operation](), operand), tok)
+
+
+    def simple_target(self, target: Expression) -> str:
+        """
+        Python name target is, when it's a name of an unboxed variable that isn't a reference, else None
+        """
+        if not isinstance(target, Name_Expression):
+            return None
+        symbol = self.lookup(target.token.value)
+        if symbol.reference:
+            return None
+        if isinstance(symbol, Local):
+            return None if symbol.boxed else symbol.name
+        name = global_name(symbol)
+        self.assigned_globals[name] = None
+        return name
+
+
+    def assignment_expression(self, target: Expression, tok: Token, value: Expression) -> ast.expr:
+        """
+        target (operator tok) value as an expression, its value is the assigned value
+        value is None for ++target / --target
+        """
+        if (name := self.simple_target(target)) is not None:
+            return located(ast.NamedExpr(store(name), self.new_value(load(name), tok, value)), tok)
+        container, key = self.cells(target)
+        operator_text = tok.value
+        if value is None:
+            operation, operand = ("+" if operator_text == "++" else "-"), ast.Constant(1)
+        else:
+            operation, operand = ASSIGNMENT_OPERATIONS[operator_text], self.expression(value)
+        if operator_text == "~=":
+            operand = located(ast.UnaryOp(ast.Invert(), operand), tok)
+        if operation is None:
+            return located(call(load("_store"), container, key, operand), tok)
+        return located(call(load("_update"), container, key, self.constant(OPERATOR_FUNCTIONS[operation]), operand), tok)
+
+
+    def assignment(self, target: Expression, tok: Token, value: Expression) -> List[ast.stmt]:
+        """
+        target (operator tok) value as statements
+        Like the VM, the container and key of target are evaluated first, then its current value, then value
+        """
+        operator_text = tok.value
+        if value is None:
+            operation = "+" if operator_text == "++" else "-"
+        else:
+            operation = ASSIGNMENT_OPERATIONS[operator_text]
+        setup: List[ast.stmt] = []
+        if (name := self.simple_target(target)) is not None:
+            python_target, current = store(name), load(name)
+        elif isinstance(target, (Membership_Access_Expression, Array_Subscription_Expression)):
+            is_member = isinstance(target, Membership_Access_Expression)
+            container = self.expression(target.struct if is_member else target.array)
+            if operation == "/" or operation is None and has_side_effects(value):
+                # Python assigns value before evaluating its target, keep container and key evaluated first
+                setup.append(located(ast.Assign([store("_target")], container), tok))
+                container = load("_target")
+                if not is_member:
+                    setup.append(located(ast.Assign([store("_key")], self.expression(target.index)), tok))
+                    key = checked_index(load("_key"))
+            elif not is_member:
+                key = self.index(target.index)
+            if is_member:
+                python_target = ast.Attribute(container, target.member.value, ast.Store())
+                current = ast.Attribute(container, target.member.value, ast.Load())
+            else:
+                python_target, current = ast.Subscript(container, key, ast.Store()), ast.Subscript(container, key, ast.Load())
+        else: # Boxed or reference variable
+            container, key = self.cells(target)
+            python_target, current = ast.Subscript(container, key, ast.Store()), ast.Subscript(container, key, ast.Load())
+        if operation in PYTHON_OPERATORS:
+            operand = located(ast.Constant(1), tok) if value is None else self.expression(value)
+            return [located(ast.AugAssign(located(python_target, tok), PYTHON_OPERATORS[operation](), operand), tok)]
+        return setup + [located(ast.Assign([located(python_target, tok)], self.new_value(current, tok, value)), tok)]
+
+
+    # Statements
+
+    def block(self, block: Block) -> List[ast.stmt]:
+        self.scopes.append({})
+        body = [python_statement for statement in block for python_statement in self.statement(statement)]
+        self.scopes.pop()
+        return body or [ast.Pass()]
+
+
+    def statement(self, statement: Statement) -> List[ast.stmt]:
+        kind = statement.kind
+        if kind == NodeKind.EXPRESSION_STATEMENT:
+            expression = statement.expression
+            tok = expression.token
+            if expression.kind == NodeKind.BINARY and tok.kind & ~KIND_INDEX_MASK == TokenKind.ASSIGNMENT:
+                return self.assignment(expression.left, tok, expression.right)
+            if expression.kind == NodeKind.UNARY and tok.kind == TokenKind.OPERATOR: # ++ / --
+                return self.assignment(expression.operand, tok, None)
+            return [located(ast.Expr(self.expression(expression)), tok)]
+        if kind == NodeKind.DEFINE_STATEMENT:
+            return [self.define(statement)]
+        if kind == NodeKind.IF_STATEMENT:
+            orelse = self.block(statement.else_block) if statement.else_block is not None else []
+            for condition, block in reversed(list(zip(statement.conditions, statement.blocks))):
+                test = self.expression(condition, condition = True)
+                orelse = [located(ast.If(test, self.block(block), orelse), condition.token)]
+            return orelse
+        if kind == NodeKind.WHILE_STATEMENT:
+            test = self.expression(statement.condition, condition = True)
+            return [located(ast.While(test, self.block(statement.body), []), statement.condition.token)]
+        if kind == NodeKind.FOR_STATEMENT:
+            tok = statement.variable
+            iterable = self.expression(statement.iterable)
+            self.scopes.append({})
+            variable = self.define_local(tok, reference = False)
+            body = self.block(statement.body)
+            if variable.boxed:
+                body.insert(0, located(ast.Assign([store(variable.name)], ast.List([load(variable.name)], ast.Load())), tok))
+            self.scopes.pop()
+            return [located(ast.For(located(store(variable.name), tok), iterable, body, []), tok)]
+        if kind == NodeKind.BREAK_STATEMENT:
+            return [located(ast.Break(), statement.keyword)]
+        if kind == NodeKind.CONTINUE_STATEMENT:
+            return [located(ast.Continue(), statement.keyword)]
+        if kind == NodeKind.RETURN_STATEMENT:
+            value = None if statement.value is None else self.expression(statement.value)
+            return [located(ast.Return(value), statement.keyword)]
+        return [] # pass
+
+
+    def define(self, statement: Simple_Statement_Define, variable: Variable = None) -> ast.stmt:
+        """
+        variable: global variable defined by statement, None for local ones (defined here)
+        """
+        name = statement.variable
+        variable_type = statement.type
+        value = statement.value
+        if variable_type.reference:
+            python_value = self.reference_argument(value)
+        elif value is not None:
+            python_value = self.expression(value)
+            if variable_type.sizes:
+                python_value = call(self.constant(self.module.names.array_converter(variable_type)), python_value)
+        else:
+            base = variable_type.base.value
+            if base in runtime.ZERO_VALUES:
+                python_value = ast.Constant(runtime.ZERO_VALUES[base])
+            else:
+                python_value = call(self.constant(self.module.names.zero_factory(variable_type)))
+        if variable is not None:
+            python_name = global_name(variable)
+            self.assigned_globals[python_name] = None
+        else:
+            local = self.define_local(name, variable_type.reference)
+            python_name = local.name
+            if local.boxed:
+                python_value = located(ast.List([python_value], ast.Load()), name)
+        return located(ast.Assign([located(store(python_name), name)], python_value), name)
+
+
+    def function_body(self, statements: List[Statement], top_level: bool = False) -> List[ast.stmt]:
+        """
+        Python statements of a function body (or top level code of a module, with top_level), declaring the
+        globals they assign first
+        """
+        body: List[ast.stmt] = []
+        for statement in statements:
+            kind = statement.kind
+            if top_level and kind in (NodeKind.FUNCTION_STATEMENT, NodeKind.STRUCT_STATEMENT, NodeKind.IMPORT_STATEMENT):
+                continue
+            if top_level and kind == NodeKind.DEFINE_STATEMENT:
+                variable = self.module.names.symbols.get(statement.variable.value)
+                body.append(self.define(statement, variable if isinstance(variable, Variable) else None))
+            else:
+                body.extend(self.statement(statement))
+        if self.assigned_globals:
+            body.insert(0, ast.Global(list(self.assigned_globals)))
+        return body or [ast.Pass()]
+
+
+class ModuleTranspiler:
+    """
+    Transpiles one module, names: its compiler (it knows what names of module are)
+    """
+    def __init__(self, transpiler: "Transpiler", file: str, statements: List[Statement], names: ModuleCompiler):
+        self.transpiler = transpiler
+        self.file = file
+        self.statements = statements
+        self.names = names
+
+
+    def function(self, make_body) -> List[ast.stmt]:
+        """
+        Body made by make_body(function_transpiler), transpiled again while it finds locals needing a box
+        """
+        boxed: Set[int] = set()
+        while True:
+            transpiler = FunctionTranspiler(self, boxed)
+            body = make_body(transpiler)
+            if not transpiler.found_boxed:
+                return body
+
+
+    def transpile(self) -> ast.Module:
+        body: List[ast.stmt] = []
+        for symbol in self.names.symbols.values():
+            if not isinstance(symbol, Function):
+                continue
+            statement = symbol.statement
+            parameters: List[str] = []
+
+            def make_body(transpiler: FunctionTranspiler) -> List[ast.stmt]:
+                parameters.clear()
+                boxes: List[ast.stmt] = []
+                for parameter in statement.parameters:
+                    local = transpiler.define_local(parameter.identifier, parameter.type.reference)
+                    parameters.append(local.name)
+                    if local.boxed:
+                        boxes.append(located(ast.Assign([store(local.name)], ast.List([load(local.name)], ast.Load())), parameter.identifier))
+                return boxes + transpiler.function_body(statement.body)
+
+            function_body = self.function(make_body)
+            body.append(located(function_def(function_name(symbol), list(parameters), function_body), statement.function))
+        top_level = self.function(lambda transpiler: transpiler.function_body(self.statements, top_level = True))
+        body.append(function_def("_module", [], top_level))
+        body.append(ast.Expr(call(load("_module"))))
+        return ast.fix_missing_locations(ast.Module(body, []))
+
+
+class Transpiler:
+    def __init__(self, program: Program):
+        self.program = program
+        self.transpiled = TranspiledProgram()
+        self.constants: Dict[int, str] = {} # id of a Python object => its name in namespace
+
+
+    def constant(self, value) -> str:
+        """
+        Name of a Python object (struct class, array factory, ...) in namespace
+        """
+        if id(value) not in self.constants:
+            name = self.constants[id(value)] = f"_k{len(self.constants)}"
+            self.transpiled.namespace[name] = value
+        return self.constants[id(value)]
+
+
+    def transpile(self) -> TranspiledProgram:
+        """
+        Check program with compiler.Compiler, then transpile every module of it, in order of execution
+        """
+        compiler = Compiler(self.program)
+        self.transpiled.errors = compiler.compile().errors
+        if self.transpiled.errors:
+            return self.transpiled
+        namespace = self.transpiled.namespace
+        namespace.update(RUNTIME_NAMES)
+        namespace.update((BUILTIN_NAMES[name], function) for name, (function, _) in BUILTINS.items())
+        namespace["_G"] = namespace
+        for file_path in self.program.order:
+            names = compiler.modules[file_path]
+            for symbol in names.symbols.values():
+                if isinstance(symbol, Variable):
+                    namespace[global_name(symbol)] = None # Like globals of the VM, until they're defined
+            module = ModuleTranspiler(self, file_path, self.program.modules[file_path].statements, names)
+            tree = module.transpile()
+            self.transpiled.trees.append((file_path, tree))
+            self.transpiled.codes.append(compile(tree, file_path, "exec"))
+        return self.transpiled
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    from lexer import SCANNERS
+    from loader import ModuleLoader
+    from module_cache import DEFAULT_MODULE_CACHE_DIR
+
+    parser = ArgumentParser(description = "Transpile a program to Python and run it")
+
+    parser.add_argument("file", help="Main module")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes loading modules (default: one per CPU)")
+    parser.add_argument("--scanner", choices=SCANNERS, default="master", help="Scanner used to find tokens")
+    parser.add_argument(
+        "--module-cache",
+        nargs="?",
+        const=DEFAULT_MODULE_CACHE_DIR,
+        metavar="DIR",
+        help=f"Reuse modules parsed before and not changed since, cached in DIR (default {DEFAULT_MODULE_CACHE_DIR})"
+    )
+    parser.add_argument("--python", action="store_true", help="Print Python code instead of running it")
+
+    args = parser.parse_args()
+
+    if args.workers is not None and args.workers < 1:
+        print("--workers must be at least 1", file = stderr)
+        exit(1)
+
+    program = ModuleLoader(
+        workers = args.workers,
+        scanner = args.scanner,
+        module_cache_dir = args.module_cache,
+    ).load([args.file])
+    if program.ok:
+        transpiled = Transpiler(program).transpile()
+        errors = transpiled.errors
+    else:
+        errors = program.errors
+    for error in errors:
+        print(error, file = stderr)
+        print(file = stderr)
+    if errors:
+        exit(1)
+
+    if args.python:
+        for file_path, tree in transpiled.trees:
+            print(f"# {file_path}")
+            print(ast.unparse(tree), end = "\n\n")
+        exit(0)
+
+    try:
+        transpiled.run()
+    except runtime.ScriptError as error:
+        print(error, file = stderr)
+        exit(1)
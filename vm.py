@@ -0,0 +1,390 @@
+#!/usr/local/bin/python3.10
+
+import re
+import inspect
+from typing import List
+from sys import stderr
+from compiler import Code, CompiledProgram, Op, BINARY_OPERATIONS
+from runtime import ScriptError, Reference, new_struct, error_message
+
+####################################################################################################
+
+# Virtual machine: runs code made by compiler.Compiler
+# One Python call of execute per A-Script call, with the frame's slots in a list and an operands stack
+# Instructions are dispatched by comparing opcodes, most frequent ones first (compiler.Op numbers them that way),
+# operands are read from code right after their opcode, pc moves past an instruction only once it's done
+# (so errors know where they happened)
+# Opcodes are compared as int literals (with their names in comments), a constant is cheaper to load than a global
+# Literals are checked against compiler.Op when this module is imported, see DISPATCHED_OPCODES
+
+class VM:
+    def __init__(self, program: CompiledProgram):
+        self.program = program
+        self.globals: List[object] = [None] * program.globals
+        for unit in program.functions + program.bodies:
+            unit.instructions = unit.code.tolist()
+
+
+    def run(self):
+        """
+        Run top level code of every module, in order
+        Errors of the program raise ScriptError, its report tells where it happened
+        """
+        for body in self.program.bodies:
+            self.execute(body, [])
+
+
+    def fail(self, unit: Code, pc: int, error: Exception) -> ScriptError:
+        """
+        ScriptError of error raised while running instruction at pc of unit
+        """
+        if isinstance(error, ScriptError) and error.report:
+            return error # From a function called here, it knows where it happened
+        message = error_message(error)
+        return ScriptError(message, unit.error_report(pc, message))
+
+
+    def execute(self, unit: Code, arguments: list):
+        """
+        Run unit (a function or top level code of a module) with arguments, returns what it returns
+        """
+        code = unit.instructions
+        constants = unit.constants
+        slots = arguments + [None] * (unit.slots - len(arguments))
+        global_slots = self.globals
+        functions = self.program.functions
+        execute = self.execute
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+        try:
+            while True:
+                op = code[pc]
+                if op == 1: # LOAD_LOCAL
+                    push(slots[code[pc + 1]])
+                    pc += 2
+                elif op == 2: # LOAD_LOCAL_LOCAL
+                    push(slots[code[pc + 1]])
+                    push(slots[code[pc + 2]])
+                    pc += 3
+                elif op == 3: # LOAD_LOCAL_CONST
+                    push(slots[code[pc + 1]])
+                    push(constants[code[pc + 2]])
+                    pc += 3
+                elif op == 4: # LOAD_CONST
+                    push(constants[code[pc + 1]])
+                    pc += 2
+                elif op == 5: # STORE_LOCAL
+                    slots[code[pc + 1]] = pop()
+                    pc += 2
+                elif op == 6: # ADD
+                    right = pop()
+                    stack[-1] = stack[-1] + right
+                    pc += 1
+                elif op == 7: # ADD_CONST
+                    stack[-1] = stack[-1] + constants[code[pc + 1]]
+                    pc += 2
+                elif op == 8: # INCREMENT_LOCAL
+                    slot = code[pc + 1]
+                    slots[slot] = slots[slot] + constants[code[pc + 2]]
+                    pc += 3
+                elif op == 9: # JUMP_IF_LESS
+                    right = pop()
+                    if pop() < right:
+                        pc = code[pc + 1]
+                    else:
+                        pc += 2
+                elif op == 10: # JUMP_UNLESS_LESS
+                    right = pop()
+                    if pop() < right:
+                        pc += 2
+                    else:
+                        pc = code[pc + 1]
+                elif op == 11: # SUBTRACT
+                    right = pop()
+                    stack[-1] = stack[-1] - right
+                    pc += 1
+                elif op == 12: # SUBTRACT_CONST
+                    stack[-1] = stack[-1] - constants[code[pc + 1]]
+                    pc += 2
+                elif op == 13: # MULTIPLY
+                    right = pop()
+                    stack[-1] = stack[-1] * right
+                    pc += 1
+                elif op == 14: # CALL
+                    count = code[pc + 2]
+                    if count:
+                        call_arguments = stack[-count:]
+                        del stack[-count:]
+                    else:
+                        call_arguments = []
+                    push(execute(functions[code[pc + 1]], call_arguments))
+                    pc += 3
+                elif op == 15: # RETURN
+                    return pop()
+                elif op == 16: # LOAD_ITEM
+                    index = pop()
+                    if index < 0:
+                        raise IndexError("Array index out of range")
+                    stack[-1] = stack[-1][index]
+                    pc += 1
+                elif op == 17: # STORE_ITEM
+                    value = pop()
+                    index = pop()
+                    if index < 0:
+                        raise IndexError("Array index out of range")
+                    pop()[index] = value
+                    if code[pc + 1]:
+                        push(value)
+                    pc += 2
+                elif op == 18: # JUMP
+                    pc = code[pc + 1]
+                elif op == 19: # POP_JUMP_IF_FALSE
+                    if pop():
+                        pc += 2
+                    else:
+                        pc = code[pc + 1]
+                elif op == 20: # POP_JUMP_IF_TRUE
+                    if pop():
+                        pc = code[pc + 1]
+                    else:
+                        pc += 2
+                elif op == 21: # FOR_ITER
+                    for value in slots[code[pc + 1]]:
+                        push(value)
+                        pc += 3
+                        break
+                    else:
+                        pc = code[pc + 2]
+                elif op == 22: # LOAD_GLOBAL
+                    push(global_slots[code[pc + 1]])
+                    pc += 2
+                elif op == 23: # STORE_GLOBAL
+                    global_slots[code[pc + 1]] = pop()
+                    pc += 2
+                elif op == 24: # LESS
+                    right = pop()
+                    stack[-1] = stack[-1] < right
+                    pc += 1
+                elif op == 25: # LESS_EQUAL
+                    right = pop()
+                    stack[-1] = stack[-1] <= right
+                    pc += 1
+                elif op == 26: # GREATER
+                    right = pop()
+                    stack[-1] = stack[-1] > right
+                    pc += 1
+                elif op == 27: # GREATER_EQUAL
+                    right = pop()
+                    stack[-1] = stack[-1] >= right
+                    pc += 1
+                elif op == 28: # EQUAL
+                    right = pop()
+                    stack[-1] = stack[-1] == right
+                    pc += 1
+                elif op == 29: # NOT_EQUAL
+                    right = pop()
+                    stack[-1] = stack[-1] != right
+                    pc += 1
+                elif op <= 39: # JUMP_IF_* / JUMP_UNLESS_* of <=, >, >=, ==, !=
+                    right = pop()
+                    left = pop()
+                    if op <= 31:
+                        result = left <= right
+                    elif op <= 33:
+                        result = left > right
+                    elif op <= 35:
+                        result = left >= right
+                    elif op <= 37:
+                        result = left == right
+                    else:
+                        result = left != right
+                    if result == (op % 2 == 0): # JUMP_IF_* are even
+                        pc = code[pc + 1]
+                    else:
+                        pc += 2
+                elif op == 40: # BINARY
+                    right = pop()
+                    stack[-1] = BINARY_OPERATIONS[code[pc + 1]](stack[-1], right)
+                    pc += 2
+                elif op == 41: # LOAD_MEMBER
+                    stack[-1] = getattr(stack[-1], constants[code[pc + 1]])
+                    pc += 2
+                elif op == 42: # STORE_MEMBER
+                    value = pop()
+                    setattr(pop(), constants[code[pc + 1]], value)
+                    if code[pc + 2]:
+                        push(value)
+                    pc += 3
+                elif op == 43: # LOAD_LOCAL_DEREF
+                    reference = slots[code[pc + 1]]
+                    push(reference.cells[reference.index])
+                    pc += 2
+                elif op == 44: # STORE_LOCAL_DEREF
+                    reference = slots[code[pc + 1]]
+                    reference.cells[reference.index] = pop()
+                    pc += 2
+                elif op == 45: # LOAD_GLOBAL_DEREF
+                    reference = global_slots[code[pc + 1]]
+                    push(reference.cells[reference.index])
+                    pc += 2
+                elif op == 46: # STORE_GLOBAL_DEREF
+                    reference = global_slots[code[pc + 1]]
+                    reference.cells[reference.index] = pop()
+                    pc += 2
+                elif op == 47: # RETURN_NONE
+                    return None
+                elif op == 48: # POP
+                    pop()
+                    pc += 1
+                elif op == 49: # DUP
+                    push(stack[-1])
+                    pc += 1
+                elif op == 50: # DUP_TWO
+                    stack.extend(stack[-2:])
+                    pc += 1
+                elif op == 51: # NEGATE
+                    stack[-1] = -stack[-1]
+                    pc += 1
+                elif op == 52: # POSITIVE
+                    stack[-1] = +stack[-1]
+                    pc += 1
+                elif op == 53: # INVERT
+                    stack[-1] = ~stack[-1]
+                    pc += 1
+                elif op == 54: # NOT
+                    stack[-1] = not stack[-1]
+                    pc += 1
+                elif op == 55: # AND_JUMP
+                    if stack[-1]:
+                        pop()
+                        pc += 2
+                    else:
+                        stack[-1] = False
+                        pc = code[pc + 1]
+                elif op == 56: # OR_JUMP
+                    if stack[-1]:
+                        stack[-1] = True
+                        pc = code[pc + 1]
+                    else:
+                        pop()
+                        pc += 2
+                elif op == 57: # TO_BOOL
+                    stack[-1] = bool(stack[-1])
+                    pc += 1
+                elif op == 58: # REF_LOCAL
+                    push(Reference(slots, code[pc + 1]))
+                    pc += 2
+                elif op == 59: # REF_GLOBAL
+                    push(Reference(global_slots, code[pc + 1]))
+                    pc += 2
+                elif op == 60: # REF_ITEM
+                    key = pop()
+                    if type(key) is int and key < 0:
+                        raise IndexError("Array index out of range")
+                    stack[-1] = Reference(stack[-1], key)
+                    pc += 1
+                elif op == 61: # GET_ITER
+                    slots[code[pc + 1]] = iter(pop())
+                    pc += 2
+                elif op == 62: # BUILD_ARRAY
+                    count = code[pc + 1]
+                    if count:
+                        items = stack[-count:]
+                        del stack[-count:]
+                    else:
+                        items = []
+                    push(items)
+                    pc += 2
+                elif op == 63: # NEW_STRUCT
+                    struct, members = constants[code[pc + 1]]
+                    count = code[pc + 2]
+                    if count:
+                        instance = new_struct(struct.cls, members, *stack[-count:])
+                        del stack[-count:]
+                    else:
+                        instance = struct.cls()
+                    push(instance)
+                    pc += 3
+                elif op == 64: # CALL_NATIVE
+                    count = code[pc + 2]
+                    if count:
+                        call_arguments = stack[-count:]
+                        del stack[-count:]
+                    else:
+                        call_arguments = ()
+                    push(constants[code[pc + 1]](*call_arguments))
+                    pc += 3
+                else:
+                    raise ScriptError(f"Unknown opcode {op}")
+        except Exception as error:
+            raise self.fail(unit, pc, error) from None
+
+
+# Each literal compared with op in VM.execute is the opcode named in its comment, so renumbering Op can't be missed
+DISPATCHED_OPCODES = {
+    name: int(value) for value, name in re.findall(r"op == (\d+): # (\w+)", inspect.getsource(VM.execute))
+}
+# Comparison jumps share one branch: op <= 39, then <= 31, 33, 35, 37 for each comparison, JUMP_IF_* even
+for index, comparison in enumerate(("LESS_EQUAL", "GREATER", "GREATER_EQUAL", "EQUAL", "NOT_EQUAL")):
+    DISPATCHED_OPCODES["JUMP_IF_" + comparison] = 30 + 2 * index
+    DISPATCHED_OPCODES["JUMP_UNLESS_" + comparison] = 31 + 2 * index
+for name, value in vars(Op).items():
+    if name.isupper():
+        assert DISPATCHED_OPCODES.get(name) == value, f"VM.execute doesn't run {name} as opcode {value} (compiler.Op)"
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    from lexer import SCANNERS
+    from loader import ModuleLoader
+    from compiler import Compiler, disassemble
+    from module_cache import DEFAULT_MODULE_CACHE_DIR
+
+    parser = ArgumentParser(description = "Compile a program to bytecode and run it")
+
+    parser.add_argument("file", help="Main module")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes loading modules (default: one per CPU)")
+    parser.add_argument("--scanner", choices=SCANNERS, default="master", help="Scanner used to find tokens")
+    parser.add_argument(
+        "--module-cache",
+        nargs="?",
+        const=DEFAULT_MODULE_CACHE_DIR,
+        metavar="DIR",
+        help=f"Reuse modules parsed before and not changed since, cached in DIR (default {DEFAULT_MODULE_CACHE_DIR})"
+    )
+    parser.add_argument("--disassemble", action="store_true", help="Print bytecode instead of running it")
+
+    args = parser.parse_args()
+
+    if args.workers is not None and args.workers < 1:
+        print("--workers must be at least 1", file = stderr)
+        exit(1)
+
+    program = ModuleLoader(
+        workers = args.workers,
+        scanner = args.scanner,
+        module_cache_dir = args.module_cache,
+    ).load([args.file])
+    if program.ok:
+        compiled = Compiler(program).compile()
+        errors = compiled.errors
+    else:
+        errors = program.errors
+    for error in errors:
+        print(error, file = stderr)
+        print(file = stderr)
+    if errors:
+        exit(1)
+
+    if args.disassemble:
+        for unit in compiled.functions + compiled.bodies:
+            print(disassemble(unit), end = "\n\n")
+        exit(0)
+
+    try:
+        VM(compiled).run()
+    except ScriptError as error:
+        print(error, file = stderr)
+        exit(1)